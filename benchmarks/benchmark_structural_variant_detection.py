@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the block-based structural variant detection with the original line-by-line implementation
+on a synthetic VCF. By default the VCF contains 50 million data lines, one in a thousand being a structural variant.
+"""
+
+import gzip
+import os
+import random
+import re
+import tempfile
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from io import StringIO
+
+from eva_submission.steps.structural_variant_detection import detect_structural_variant
+
+sv_alleles = ['<DEL>', '<DUP:TANDEM>', 'G]17:198982]', ']13:123456]T', 'A<ctg1>', '.A', 'G.']
+
+
+def line_by_line_detect_structural_variant(vcf_file, output_vcf):
+    """Original implementation of the structural variant detection, kept here as the reference."""
+    symbolic_allele_pattern = "^<(DEL|INS|DUP|INV|CNV|BND)"
+    complex_rearrangements_breakend_pattern = r"^[ATCGNatgcn]+\[.+:.+\[$|^[ATCGNatgcn]+\].+:.+\]$|^\].+:.+\][ATCGNatgcn]+$|^\[.+:.+\[[ATCGNatgcn]+$"
+    complex_rearrangements_special_breakend_pattern = "^[ATGCNatgcn]+<[0-9A-Za-z!#$%&+./:;?@^_|~-][0-9A-Za-z!#$%&*+./:;=?@^_|~-]*>$"
+    single_breakend_pattern = r"^\.[ATGCNatgcn]+|[ATGCNatgcn]+\.$"
+    sv_regex = re.compile(f'{symbolic_allele_pattern}|{complex_rearrangements_breakend_pattern}|'
+                          f'{complex_rearrangements_special_breakend_pattern}|{single_breakend_pattern}')
+    nb_sv = 0
+    if vcf_file.endswith('.gz'):
+        ctx = gzip.open(vcf_file, mode="rt")
+    else:
+        ctx = open(vcf_file, mode="r")
+    with ctx as open_input, open(output_vcf, 'w') as open_output:
+        for line in open_input:
+            if line.startswith("#"):
+                open_output.write(line)
+                continue
+            sp_line = line.split('\t')
+            alternate_alleles = sp_line[4].split(",")
+            for alternate_allele in alternate_alleles:
+                if re.search(sv_regex, alternate_allele):
+                    open_output.write(line)
+                    nb_sv += 1
+                    break
+    return nb_sv
+
+
+def write_synthetic_vcf(vcf_file, nb_lines, sv_frequency):
+    random.seed(42)
+    bases = 'ACGT'
+    with open(vcf_file, 'w') as open_file:
+        open_file.write('##fileformat=VCFv4.3\n')
+        open_file.write('##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency">\n')
+        open_file.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        lines = []
+        for position in range(1, nb_lines + 1):
+            ref = random.choice(bases)
+            if random.random() < sv_frequency:
+                alt = random.choice(sv_alleles)
+            else:
+                alt = random.choice(bases.replace(ref, ''))
+            lines.append(f'1\t{position}\t.\t{ref}\t{alt}\t.\tPASS\tAF=0.5\n')
+            if len(lines) == 100000:
+                open_file.write(''.join(lines))
+                lines = []
+        open_file.write(''.join(lines))
+
+
+def time_function(function, *args):
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    argparse = ArgumentParser(description='Benchmark the structural variant detection on a synthetic VCF')
+    argparse.add_argument('--nb_lines', type=int, default=50_000_000,
+                          help='Number of data lines in the synthetic VCF')
+    argparse.add_argument('--sv_frequency', type=float, default=0.001,
+                          help='Proportion of data lines containing a structural variant')
+    argparse.add_argument('--work_dir', type=str, default=None,
+                          help='Directory where the synthetic VCF and the outputs are written')
+    args = argparse.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        vcf_file = os.path.join(work_dir, 'synthetic.vcf')
+        write_synthetic_vcf(vcf_file, args.nb_lines, args.sv_frequency)
+        print(f'Synthetic VCF: {args.nb_lines} lines, {os.path.getsize(vcf_file) / 1e9:.2f} GB')
+
+        reference_output = os.path.join(work_dir, 'reference_sv_list.vcf')
+        block_output = os.path.join(work_dir, 'block_sv_list.vcf.gz')
+        reference_time = time_function(line_by_line_detect_structural_variant, vcf_file, reference_output)
+        print(f'Line by line detection: {reference_time:.1f}s')
+        block_time = time_function(detect_structural_variant, vcf_file, block_output)
+        print(f'Block detection with BGZF output: {block_time:.1f}s ({reference_time / block_time:.1f}x)')
+
+        with open(reference_output, 'rb') as reference, gzip.open(block_output, 'rb') as block:
+            if reference.read() != block.read():
+                raise ValueError('Outputs of the two implementations differ')
+        print('Outputs are identical')
+
+
+if __name__ == "__main__":
+    main()
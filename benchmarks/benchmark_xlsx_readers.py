@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the openpyxl read-only and the lxml iterparse backends of XlsxReader on metadata spreadsheets.
+The spreadsheets to read can be provided, for instance the largest ones received, otherwise the test spreadsheet is
+extended with a synthetic Sample worksheet. By default it contains 100,000 samples.
+"""
+
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from openpyxl import load_workbook
+
+from eva_submission import ETC_DIR, ROOT_DIR
+from eva_submission.xlsx.xlsx_parser import XlsxReader
+from eva_submission.xlsx.xlsx_parser_lxml import XlsxLxmlReader
+
+metadata_conf = os.path.join(ETC_DIR, 'eva_project_conf.yaml')
+template_metadata_file = os.path.join(ROOT_DIR, 'tests', 'resources', 'metadata.xlsx')
+
+
+def write_synthetic_metadata(metadata_file, nb_samples):
+    workbook = load_workbook(template_metadata_file)
+    worksheet = workbook['Sample']
+    headers = [cell.value for cell in worksheet[3]]
+    worksheet.delete_rows(4, worksheet.max_row)
+    for sample_num in range(1, nb_samples + 1):
+        values = {
+            'Analysis Alias': 'GAE', 'Sample Name': f'S{sample_num}', 'Title': f'Sample {sample_num}',
+            'Description': 'Synthetic sample', 'Unique Name Prefix': f'Unique {sample_num}', 'Scientific Name': 'Homo sapiens',
+            'Tax Id': 9606, 'collection_date': '2023-01-01', 'geographic location (country and/or sea)': 'Norway'
+        }
+        worksheet.append([values.get(header) for header in headers])
+    workbook.save(metadata_file)
+
+
+def read_all_worksheets(reader_class, metadata_file):
+    reader = reader_class(metadata_file, metadata_conf)
+    rows = {}
+    for worksheet in reader.valid_worksheets():
+        reader.active_worksheet = worksheet
+        rows[worksheet] = reader.get_rows()
+    reader.close()
+    return rows
+
+
+def time_reader(reader_class, metadata_file):
+    start = time.perf_counter()
+    rows = read_all_worksheets(reader_class, metadata_file)
+    return time.perf_counter() - start, rows
+
+
+def main():
+    argparse = ArgumentParser(description='Benchmark the backends reading the metadata spreadsheets')
+    argparse.add_argument('--metadata_files', type=str, nargs='+',
+                          help='Spreadsheets to read. A synthetic spreadsheet is used if none are provided')
+    argparse.add_argument('--nb_samples', type=int, default=100_000,
+                          help='Number of samples in the synthetic spreadsheet')
+    args = argparse.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        metadata_files = args.metadata_files
+        if not metadata_files:
+            metadata_file = os.path.join(work_dir, 'synthetic_metadata.xlsx')
+            write_synthetic_metadata(metadata_file, args.nb_samples)
+            metadata_files = [metadata_file]
+
+        for metadata_file in metadata_files:
+            print(f'{os.path.basename(metadata_file)}: {os.path.getsize(metadata_file) / 1e6:.1f} MB')
+            openpyxl_time, openpyxl_rows = time_reader(XlsxReader, metadata_file)
+            print(f'  openpyxl read-only: {openpyxl_time:.2f}s')
+            lxml_time, lxml_rows = time_reader(XlsxLxmlReader, metadata_file)
+            print(f'  lxml iterparse: {lxml_time:.2f}s ({openpyxl_time / lxml_time:.1f}x)')
+            if openpyxl_rows != lxml_rows:
+                raise ValueError(f'Rows read from {metadata_file} by the two backends differ')
+            print(f'  {sum(len(rows) for rows in openpyxl_rows.values())} identical rows')
+
+
+if __name__ == "__main__":
+    main()
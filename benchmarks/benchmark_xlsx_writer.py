@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare writing the samples of a large synthetic metadata spreadsheet cell by cell, the way XlsxWriter.edit_row used
+to, with the bulk XlsxWriter.write_rows, when all the samples get an accession and when they are written unchanged.
+"""
+
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from eva_submission import ETC_DIR
+from eva_submission.xlsx.xlsx_parser import XlsxWriter, REQUIRED_HEADERS_KEY_NAME, OPTIONAL_HEADERS_KEY_NAME
+from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader
+
+from benchmark_xlsx_readers import write_synthetic_metadata
+
+metadata_conf = os.path.join(ETC_DIR, 'eva_project_conf.yaml')
+
+
+def edit_rows_per_cell(writer, rows):
+    """Previous implementation of edit_row looking up the column of every header of every row."""
+    worksheet = writer.active_worksheet
+    headers = writer.headers[worksheet]
+    for row_data in rows:
+        for header in writer.xls_conf[worksheet].get(REQUIRED_HEADERS_KEY_NAME, []):
+            writer.workbook[worksheet].cell(column=headers.index(header) + 1, row=row_data['row_num'],
+                                            value=row_data[header])
+        for header in writer.xls_conf[worksheet].get(OPTIONAL_HEADERS_KEY_NAME, []):
+            if header in headers:
+                value = row_data[header] if header in row_data else ''
+                writer.workbook[worksheet].cell(column=headers.index(header) + 1, row=row_data['row_num'],
+                                                value=value)
+
+
+def edit_rows_in_bulk(writer, rows):
+    writer.write_rows(rows)
+
+
+def time_writes(edit_rows, metadata_file, rows):
+    writer = XlsxWriter(metadata_file, metadata_conf)
+    writer.active_worksheet = 'Sample'
+    start = time.perf_counter()
+    edit_rows(writer, rows)
+    return time.perf_counter() - start
+
+
+def main():
+    argparse = ArgumentParser(description='Benchmark writing the samples of a metadata spreadsheet')
+    argparse.add_argument('--nb_samples', type=int, default=50_000,
+                          help='Number of samples in the synthetic spreadsheet')
+    args = argparse.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        metadata_file = os.path.join(work_dir, 'synthetic_metadata.xlsx')
+        write_synthetic_metadata(metadata_file, args.nb_samples)
+        unchanged_rows = EvaXlsxReader(metadata_file).samples
+        accessioned_rows = [dict(row, **{'Sample Accession': f'SAMEA{row["row_num"]}'}) for row in unchanged_rows]
+
+        for description, rows in [('accessioned samples', accessioned_rows), ('unchanged samples', unchanged_rows)]:
+            print(f'{len(rows)} {description}')
+            per_cell_time = time_writes(edit_rows_per_cell, metadata_file, rows)
+            print(f'  cell by cell: {per_cell_time:.2f}s')
+            bulk_time = time_writes(edit_rows_in_bulk, metadata_file, rows)
+            print(f'  bulk write_rows: {bulk_time:.2f}s ({per_cell_time / bulk_time:.1f}x)')
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import logging
 from ebi_eva_common_pyutils.logger import logging_config as log_cfg
 from eva_submission.submission_config import load_config
 from eva_submission.samples_checker import compare_spreadsheet_and_vcf
+from eva_submission.vcf_profile import open_vcf_profile_cache
 
 
 def main():
@@ -13,6 +14,8 @@ def main():
                             help='EVA Submission Metadata Excel sheet')
     arg_parser.add_argument('--vcf-dir', required=True, dest='vcf_dir',
                             help='Path to the directory in which submitted files can be found')
+    arg_parser.add_argument('--cache-file', required=False, dest='cache_file',
+                            help='SQLite database where the samples found in the VCF files are cached between runs')
     arg_parser.add_argument('--debug', action='store_true', default=False,
                           help='Set the script to output logging information at debug level', )
     args = arg_parser.parse_args()
@@ -25,7 +28,8 @@ def main():
     # Load the config_file from default location
     load_config()
 
-    compare_spreadsheet_and_vcf(args.metadata_file, args.vcf_dir)
+    vcf_profile_cache = open_vcf_profile_cache(args.cache_file) if args.cache_file else None
+    compare_spreadsheet_and_vcf(args.metadata_file, args.vcf_dir, vcf_profile_cache)
 
 
 if __name__ == "__main__":
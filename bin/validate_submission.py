@@ -39,6 +39,12 @@ def main():
                           help='Whether to merge vcf files per analysis if possible.')
     argparse.add_argument('--report', action='store_true', default=False,
                           help='Set the script to only report the results based on previously run validation.')
+    argparse.add_argument('--full_revalidation', action='store_true', default=False,
+                          help='Validate all the VCF files even if they have not changed since the previous '
+                               'validation.')
+    argparse.add_argument('--fail_fast', required=False, type=int,
+                          help='Stop checking a VCF file after this number of errors and cancel the checks of the '
+                               'other files of the same analysis. The results are recorded as truncated.')
     argparse.add_argument('--debug', action='store_true', default=False,
                           help='Set the script to output logging information at debug level')
 
@@ -54,7 +60,8 @@ def main():
     with EloadValidation(args.eload) as eload:
         eload.upgrade_config_if_needed()
         if not args.report:
-            eload.validate(args.validation_tasks, args.set_as_valid, args.merge_per_analysis)
+            eload.validate(args.validation_tasks, args.set_as_valid, args.merge_per_analysis,
+                           incremental=not args.full_revalidation, fail_fast=args.fail_fast)
         eload.report()
 
 
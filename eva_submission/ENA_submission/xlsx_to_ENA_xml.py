@@ -1,10 +1,9 @@
 import os
 import re
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import cached_property
-from io import BytesIO
-from xml.dom import minidom
-from xml.etree.ElementTree import Element, ElementTree
+from xml.etree.ElementTree import Element
 
 from ebi_eva_common_pyutils.logger import AppLogger
 from ebi_eva_common_pyutils.taxonomy.taxonomy import get_scientific_name_from_ensembl
@@ -17,13 +16,73 @@ def today():
     return datetime.today()
 
 
-def prettify(etree):
-    """Return a pretty-printed XML string for the ElementTree. """
-    outfile = BytesIO()
-    etree.write(outfile, encoding='utf-8', xml_declaration=True)
-    rough_string = outfile.getvalue()
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent='    ', encoding="utf-8")
+xsi_namespace = 'http://www.w3.org/2001/XMLSchema-instance'
+
+
+def escape_xml(data):
+    """Escape the text or attribute value like minidom, which also escapes the double quotes in the text."""
+    return data.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+
+class XmlStreamWriter:
+    """
+    Write pretty-printed XML to an open file one element at a time, so that the document never needs to be held in
+    memory as a whole. The elements written are indented at the depth of the element they are written in, and are
+    formatted like minidom's toprettyxml.
+    """
+
+    indentation = '    '
+
+    def __init__(self, open_file):
+        self.open_file = open_file
+        self.depth = 0
+
+    def _write_line(self, text):
+        self.open_file.write(self.indentation * self.depth + text + '\n')
+
+    @staticmethod
+    def _attributes(attributes):
+        return ''.join(f' {key}="{escape_xml(value)}"' for key, value in attributes.items())
+
+    @contextmanager
+    def element(self, tag, **attributes):
+        """Open the element, in which the elements written within the context are written, and close it."""
+        self._write_line(f'<{tag}{self._attributes(attributes)}>')
+        self.depth += 1
+        yield
+        self.depth -= 1
+        self._write_line(f'</{tag}>')
+
+    def write(self, element):
+        """Write the complete element. Elements only containing text are written on a single line."""
+        attributes = self._attributes(element.attrib)
+        if len(element):
+            with self.element(element.tag, **element.attrib):
+                if element.text:
+                    self._write_line(escape_xml(element.text))
+                for child in element:
+                    self.write(child)
+        elif element.text:
+            self._write_line(f'<{element.tag}{attributes}>{escape_xml(element.text)}</{element.tag}>')
+        else:
+            self._write_line(f'<{element.tag}{attributes}/>')
+
+
+@contextmanager
+def open_xml_file(output_file):
+    """
+    Provides the XmlStreamWriter of the output file, after writing the XML declaration. The output file is only
+    replaced once the document is complete so that a failure does not leave a truncated file.
+    """
+    tmp_file = output_file + '.tmp'
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as open_file:
+            open_file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            yield XmlStreamWriter(open_file)
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
 
 
 def add_attributes(element, **kwargs):
@@ -196,11 +255,24 @@ class EnaXlsxConverter(AppLogger):
         :return: The top XML element
         """
         root = Element('ANALYSIS_SET')
+        root.extend(self._iter_analysis_elements())
+        return root
+
+    def _iter_analysis_elements(self):
+        """Yield the ANALYSIS element of each analysis, only creating it when the previous one has been consumed."""
         for analysis_row in self.reader.analysis:
-            sample_rows = self.reader.samples_per_analysis[analysis_row.get('Analysis Alias')]
-            file_rows = self.reader.files_per_analysis[analysis_row.get('Analysis Alias')]
+            # The samples and files are read for each analysis rather than all grouped in memory
+            sample_rows = self.reader.iter_samples_of_analysis(analysis_row.get('Analysis Alias'))
+            file_rows = self.reader.iter_files_of_analysis(analysis_row.get('Analysis Alias'))
+            root = Element('ANALYSIS_SET')
             self._add_analysis(root, analysis_row, self.reader.project, sample_rows, file_rows)
-        return root
+            yield root[0]
+
+    def _write_analysis_xml(self, xml_writer, **attributes):
+        """Write the ANALYSIS_SET element with the XmlStreamWriter, each analysis being written once it is created."""
+        with xml_writer.element('ANALYSIS_SET', **attributes):
+            for analysis_elemt in self._iter_analysis_elements():
+                xml_writer.write(analysis_elemt)
 
     def _add_analysis(self, root, analysis_row, project_row, sample_rows, file_rows):
         """
@@ -209,8 +281,8 @@ class EnaXlsxConverter(AppLogger):
         :param root: Top level element
         :param analysis_row: Dictionary representing one row of the analysis tab in the XLS file
         :param project_row: Dictionary representing one row of the project tab in the XLS file
-        :param sample_rows: Dictionary representing one row of the sample tab in the XLS file
-        :param file_rows: Dictionary representing one row of the file tab in the XLS file
+        :param sample_rows: Iterable of dictionaries representing the rows of the sample tab in the XLS file
+        :param file_rows: Iterable of dictionaries representing the rows of the file tab in the XLS file
         :return: None
         """
         analysis_elemt = add_element(root, 'ANALYSIS',
@@ -334,10 +406,9 @@ class EnaXlsxConverter(AppLogger):
 
     @staticmethod
     def write_xml_to_file(xml_element, output_file):
-        xml_element.attrib['xmlns:xsi'] = 'http://www.w3.org/2001/XMLSchema-instance'
-        etree = ElementTree(xml_element)
-        with open(output_file, 'bw') as open_file:
-            open_file.write(prettify(etree))
+        xml_element.attrib['xmlns:xsi'] = xsi_namespace
+        with open_xml_file(output_file) as xml_writer:
+            xml_writer.write(xml_element)
 
     def create_submission_files(self, eload):
         files_to_submit = []
@@ -351,8 +422,8 @@ class EnaXlsxConverter(AppLogger):
         else:
             project_file = None
 
-        analysis_elemt = self._create_analysis_xml()
-        self.write_xml_to_file(analysis_elemt, self.analysis_file)
+        with open_xml_file(self.analysis_file) as xml_writer:
+            self._write_analysis_xml(xml_writer, **{'xmlns:xsi': xsi_namespace})
         files_to_submit.append(
             {'file_name': os.path.basename(self.analysis_file), 'schema': 'analysis'}
         )
@@ -364,21 +435,17 @@ class EnaXlsxConverter(AppLogger):
         return self.submission_file, project_file, self.analysis_file
 
     def create_single_submission_file(self, eload):
-        root = Element('WEBIN')
-        # Submission ELEMENT
-        action = 'ADD'
-        submissions_elemt = self._create_submission_single_xml(action, self.reader.project, eload)
-        root.append(submissions_elemt)
-
-        # Project ELEMENT
-        if not self.is_existing_project:
-            projects_elemt = self._create_project_xml()
-            root.append(projects_elemt)
-
-        # Analysis ELEMENT
-        analysis_elemt = self._create_analysis_xml()
-        root.append(analysis_elemt)
-
-        self.write_xml_to_file(root, self.single_submission_file)
+        with open_xml_file(self.single_submission_file) as xml_writer, \
+                xml_writer.element('WEBIN', **{'xmlns:xsi': xsi_namespace}):
+            # Submission ELEMENT
+            action = 'ADD'
+            xml_writer.write(self._create_submission_single_xml(action, self.reader.project, eload))
+
+            # Project ELEMENT
+            if not self.is_existing_project:
+                xml_writer.write(self._create_project_xml())
+
+            # Analysis ELEMENT
+            self._write_analysis_xml(xml_writer)
 
         return self.single_submission_file
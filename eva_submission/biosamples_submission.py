@@ -359,10 +359,10 @@ class SampleMetadataSubmitter(SampleSubmitter):
         'Address': 'Address',
     }
 
-    def __init__(self, metadata_spreadsheet):
+    def __init__(self, metadata_spreadsheet, snapshot_dir=None):
         super().__init__()
         self.metadata_spreadsheet = metadata_spreadsheet
-        self.reader = EvaXlsxReader(self.metadata_spreadsheet)
+        self.reader = EvaXlsxReader(self.metadata_spreadsheet, snapshot_dir)
         self.sample_data = self.map_metadata_to_bsd_data()
 
     @staticmethod
@@ -374,7 +374,8 @@ class SampleMetadataSubmitter(SampleSubmitter):
 
     def map_metadata_to_bsd_data(self):
         payloads = []
-        for sample_row in self.reader.samples:
+        # The samples are read one at a time so only their payloads are kept in memory
+        for sample_row in self.reader.iter_rows('Sample'):
             bsd_sample_entry = {'characteristics': {}}
             description_list = []
             if sample_row.get('Title'):
@@ -441,7 +442,8 @@ class SampleMetadataSubmitter(SampleSubmitter):
     def already_submitted_sample_names_to_accessions(self):
         if self.check_submit_done():
             return dict([
-                (sample_row.get('Sample ID'), sample_row.get('Sample Accession')) for sample_row in self.reader.samples
+                (sample_row.get('Sample ID'), sample_row.get('Sample Accession'))
+                for sample_row in self.reader.iter_rows('Sample')
             ])
 
     def all_sample_names(self):
@@ -55,6 +55,9 @@ class EloadBrokering(Eload):
     def broker_to_ena(self, force=False, existing_project=None, async_upload=False, dry_ena_upload=False):
         if not self.eload_cfg.query('brokering', 'ena', 'pass') or force:
             ena_spreadsheet = os.path.join(self._get_dir('ena'), 'metadata_spreadsheet.xlsx')
+            if os.path.isdir(self.eload_cfg['validation']['valid']['metadata_spreadsheet']):
+                # Metadata provided as a directory of TSV or JSON files is copied to a directory
+                ena_spreadsheet = os.path.join(self._get_dir('ena'), 'metadata_spreadsheet')
             # Set the project in the metadata sheet which is then converted to XML
             self.update_metadata_spreadsheet(self.eload_cfg['validation']['valid']['metadata_spreadsheet'],
                                              ena_spreadsheet, existing_project)
@@ -95,7 +98,7 @@ class EloadBrokering(Eload):
 
     def upload_to_bioSamples(self, force=False):
         metadata_spreadsheet = self.eload_cfg['validation']['valid']['metadata_spreadsheet']
-        sample_metadata_submitter = SampleMetadataSubmitter(metadata_spreadsheet)
+        sample_metadata_submitter = SampleMetadataSubmitter(metadata_spreadsheet, self.metadata_snapshot_dir)
         if sample_metadata_submitter.check_submit_done() and not force:
             self.info('Biosamples accession already provided in the metadata, Skip!')
             self.eload_cfg.set('brokering', 'Biosamples', 'pass', value=True)
@@ -118,7 +118,7 @@ class EloadIngestion(Eload):
                 assembly_accession,
                 vep_cache_assembly_name
             )
-            vep_species = get_species_name_from_ncbi(assembly_accession)
+            vep_species = self.resolver.resolve('species_name_from_ncbi', get_species_name_from_ncbi, assembly_accession)
             self.eload_cfg.set(self.config_section, 'vep', assembly_accession, 'version', value=vep_version)
             self.eload_cfg.set(self.config_section, 'vep', assembly_accession, 'cache_version', value=vep_cache_version)
             self.eload_cfg.set(self.config_section, 'vep', assembly_accession, 'species', value=vep_species)
@@ -414,9 +414,11 @@ class EloadIngestion(Eload):
         if target_assembly is None:
             self.warning(f"Could not find remapping target assembly from EVAPRO or Ensembl for the submitted taxonomy: "
                          f"{self.taxonomy}... Attempting to find assemblies in an alternate taxonomy...")
-            alt_tax_ids = {tax_id for tax_id in
-                               [get_assembly_name_and_taxonomy_id(asm)[1] for asm in self.assembly_accessions]
-                           if tax_id != self.taxonomy}
+            assembly_tax_ids = [
+                self.resolver.resolve('assembly_name_and_taxonomy_id', get_assembly_name_and_taxonomy_id, asm)[1]
+                for asm in self.assembly_accessions
+            ]
+            alt_tax_ids = {tax_id for tax_id in assembly_tax_ids if tax_id != self.taxonomy}
             if len(alt_tax_ids) != 1:
                 self.warning("Could not find a unique alternate taxonomy for the submitted assemblies!")
                 return None
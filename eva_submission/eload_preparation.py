@@ -13,6 +13,7 @@ from ebi_eva_common_pyutils.config_utils import get_contig_alias_db_creds_for_pr
 from eva_submission.eload_submission import Eload, directory_structure
 from eva_submission.eload_utils import resolve_accession_from_text, get_reference_fasta_and_report, NCBIAssembly
 from eva_submission.submission_in_ftp import FtpDepositBox
+from eva_submission.xlsx.metadata_directory import is_metadata_directory
 from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader, EvaXlsxWriter
 
 
@@ -41,7 +42,7 @@ class EloadPreparation(Eload):
     def replace_values_in_metadata(self, taxid=None, reference_accession=None):
         """Find and Replace the value in the metadata spreadsheet with the one provided """
         input_spreadsheet = self.eload_cfg.query('submission', 'metadata_spreadsheet')
-        reader = EvaXlsxReader(input_spreadsheet)
+        reader = EvaXlsxReader(input_spreadsheet, self.metadata_snapshot_dir)
 
         # This will write the spreadsheet in place of the existing one
         eva_xls_writer = EvaXlsxWriter(input_spreadsheet)
@@ -73,6 +74,11 @@ class EloadPreparation(Eload):
     def detect_submitted_metadata(self):
         metadata_dir = os.path.join(self.eload_dir, directory_structure['metadata'])
         metadata_spreadsheets = glob.glob(os.path.join(metadata_dir, '*.xlsx'))
+        if not metadata_spreadsheets and is_metadata_directory(metadata_dir):
+            # Large submissions can provide a TSV or JSON file per worksheet instead of the spreadsheet
+            self.info('Found the metadata as TSV or JSON files in %s', metadata_dir)
+            self.eload_cfg.set('submission', 'metadata_spreadsheet', value=metadata_dir)
+            return
         if len(metadata_spreadsheets) != 1:
             self.critical('Found %s spreadsheet in %s', len(metadata_spreadsheets), metadata_dir)
             raise ValueError('Found %s spreadsheet in %s'% (len(metadata_spreadsheets), metadata_dir))
@@ -88,7 +94,7 @@ class EloadPreparation(Eload):
             raise FileNotFoundError('Could not locate vcf file in %s', vcf_dir)
 
         eva_files_sheet = self.eload_cfg.query('submission', 'metadata_spreadsheet')
-        eva_xls_reader = EvaXlsxReader(eva_files_sheet)
+        eva_xls_reader = EvaXlsxReader(eva_files_sheet, self.metadata_snapshot_dir)
         spreadsheet_vcfs = [
             os.path.basename(row['File Name']) for row in eva_xls_reader.files
             if row['File Type'] == 'vcf' or row['File Name'].endswith('.vcf') or row['File Name'].endswith('.vcf.gz')
@@ -119,11 +125,12 @@ class EloadPreparation(Eload):
             eva_xls_writer.save()
 
     def detect_metadata_attributes(self):
-        eva_metadata = EvaXlsxReader(self.eload_cfg.query('submission', 'metadata_spreadsheet'))
+        eva_metadata = EvaXlsxReader(self.eload_cfg.query('submission', 'metadata_spreadsheet'),
+                                     self.metadata_snapshot_dir)
         analysis_reference = {}
         for analysis in eva_metadata.analysis:
             reference_txt = analysis.get('Reference')
-            assembly_accessions = resolve_accession_from_text(reference_txt) if reference_txt else None
+            assembly_accessions = resolve_accession_from_text(reference_txt, self.resolver) if reference_txt else None
             if not assembly_accessions:
                 assembly_accession = None
             elif len(assembly_accessions) == 1:
@@ -151,7 +158,8 @@ class EloadPreparation(Eload):
         taxonomy_id = eva_metadata.project.get('Tax ID')
         if taxonomy_id and (isinstance(taxonomy_id, int) or taxonomy_id.isdigit()):
             self.eload_cfg.set('submission', 'taxonomy_id', value=int(taxonomy_id))
-            scientific_name = get_scientific_name_from_ensembl(taxonomy_id)
+            scientific_name = self.resolver.resolve('scientific_name_from_ensembl', get_scientific_name_from_ensembl,
+                                                    int(taxonomy_id))
             self.eload_cfg.set('submission', 'scientific_name', value=scientific_name)
         else:
             if taxonomy_id:
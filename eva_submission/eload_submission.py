@@ -13,6 +13,7 @@ from ebi_eva_common_pyutils.logger import logging_config as log_cfg
 from eva_submission import __version__
 from eva_submission.config_migration import upgrade_version_0_1
 from eva_submission.eload_utils import get_hold_date_from_ena
+from eva_submission.resolver import get_resolver
 from eva_submission.submission_config import EloadConfig
 from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader, EvaXlsxWriter
 
@@ -39,6 +40,8 @@ class Eload(AppLogger):
         self.eload = f'ELOAD_{eload_number}'
         self.eload_dir = os.path.abspath(os.path.join(cfg['eloads_dir'], self.eload))
         self.config_path = os.path.join(self.eload_dir, '.' + self.eload + '_config.yml')
+        # Where the parsed content of the metadata spreadsheets of the ELOAD is persisted between steps
+        self.metadata_snapshot_dir = os.path.join(self.eload_dir, '.metadata_snapshots')
         if config_object:
             self.eload_cfg = config_object
         else:
@@ -54,6 +57,9 @@ class Eload(AppLogger):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.eload_cfg.write()
+        # Only report the lookups if the resolver was used
+        if 'resolver' in self.__dict__:
+            self.resolver.log_counters()
 
     @property
     def metadata_connection_handle(self):
@@ -75,6 +81,11 @@ class Eload(AppLogger):
     def now(self):
         return datetime.now()
 
+    @cached_property
+    def resolver(self):
+        """Resolver running the remote lookups of this ELOAD and caching their results."""
+        return get_resolver()
+
     def create_log_file(self):
         logfile_name = os.path.join(self.eload_dir, str(self.eload) + "_submission.log")
         if logfile_name not in eload_logging_files:
@@ -98,22 +109,23 @@ class Eload(AppLogger):
         self.eload_cfg.set('brokering', 'ena', 'hold_date', value=hold_date)
 
     def update_metadata_spreadsheet(self, input_spreadsheet, output_spreadsheet=None, existing_project=None):
-        reader = EvaXlsxReader(input_spreadsheet)
+        reader = EvaXlsxReader(input_spreadsheet, self.metadata_snapshot_dir)
         single_analysis_alias = None
         if len(reader.analysis) == 1:
             single_analysis_alias = reader.analysis[0].get('Analysis Alias')
 
-        sample_rows = []
-        for sample_row in reader.samples:
-            if self.eload_cfg.query('brokering', 'Biosamples', 'Samples', sample_row.get('Sample Name')):
-                sample_rows.append({
-                    'row_num': sample_row.get('row_num'),
-                    'Analysis Alias': sample_row.get('Analysis Alias') or single_analysis_alias,
-                    'Sample ID': sample_row.get('Sample Name'),
-                    'Sample Accession': self.eload_cfg['brokering']['Biosamples']['Samples'][sample_row.get('Sample Name')]
-                })
-            else:
-                sample_rows.append(sample_row)
+        def sample_rows():
+            # The samples are streamed to the writer rather than all kept in memory
+            for sample_row in reader.iter_rows('Sample'):
+                if self.eload_cfg.query('brokering', 'Biosamples', 'Samples', sample_row.get('Sample Name')):
+                    yield {
+                        'row_num': sample_row.get('row_num'),
+                        'Analysis Alias': sample_row.get('Analysis Alias') or single_analysis_alias,
+                        'Sample ID': sample_row.get('Sample Name'),
+                        'Sample Accession': self.eload_cfg['brokering']['Biosamples']['Samples'][sample_row.get('Sample Name')]
+                    }
+                else:
+                    yield sample_row
 
         file_rows = []
         analyses = self.eload_cfg['brokering']['analyses']
@@ -145,7 +157,7 @@ class Eload(AppLogger):
         else:
             eva_xls_writer = EvaXlsxWriter(input_spreadsheet)
         eva_xls_writer.set_project(project_row)
-        eva_xls_writer.set_samples(sample_rows)
+        eva_xls_writer.set_samples(sample_rows())
         eva_xls_writer.set_files(file_rows)
         eva_xls_writer.save()
         return output_spreadsheet
@@ -17,6 +17,11 @@ from ebi_eva_common_pyutils.variation.assembly_utils import retrieve_genbank_ass
 from requests.auth import HTTPBasicAuth
 from retry import retry
 
+from eva_submission.resolver import get_resolver
+from eva_submission.vcf_profile import get_vcf_profile
+from eva_submission.vcf_utils import open_vcf_binary, read_header, read_data_lines, get_nb_samples, \
+    get_contig_lengths, has_genotypes_and_allele_frequencies
+
 logger = log_cfg.get_logger(__name__)
 
 
@@ -40,11 +45,18 @@ def get_reference_fasta_and_report(species_name, reference_accession, output_dir
         logger.warning(f'{reference_accession} is not recognize as either an INSDC assembly or sequence.')
 
 
-def resolve_accession_from_text(reference_text):
+def resolve_accession_from_text(reference_text, resolver=None):
     """
-    :param reference_text:
-    :return:
+    Find the INSDC assembly or sequence accessions the reference text refers to, through the resolver to reuse the
+    results of previous lookups.
+    :param reference_text: text describing the reference genome
+    :param resolver: Resolver running the lookup, one using the remote_lookups config is created if not provided
+    :return: list of accessions or None if none were found
     """
+    return (resolver or get_resolver()).resolve('accession_from_text', _resolve_accession_from_text, reference_text)
+
+
+def _resolve_accession_from_text(reference_text):
     # first Check if it is an reference genome
     if NCBIAssembly.is_assembly_accession_format(reference_text):
         return [reference_text]
@@ -184,31 +196,73 @@ def provision_new_database_for_variant_warehouse(db_name):
         logger.info(f'Created new database named {db_name}.')
 
 
-def detect_vcf_aggregation(vcf_file):
+def sample_indexed_data_lines(vcf_file, header_lines, nb_offsets, nb_lines):
+    """
+    Read nb_lines raw data lines at nb_offsets positions spread over the VCF using its index.
+    The positions are spread over the length of the contigs declared in the header or, when their length is not
+    declared, at the start of contigs spread over the index. Return an empty list if the VCF is not indexed.
+    """
+    if not (os.path.isfile(vcf_file + '.tbi') or os.path.isfile(vcf_file + '.csi')):
+        return []
+    data_lines = []
+    with pysam.TabixFile(vcf_file) as tabix_file:
+        indexed_contigs = set(tabix_file.contigs)
+        contig_lengths = [(contig, length) for contig, length in get_contig_lengths(header_lines)
+                          if contig in indexed_contigs]
+        total_length = sum(length for _, length in contig_lengths)
+        regions = []
+        if total_length:
+            for offset in range(1, nb_offsets + 1):
+                position = total_length * offset // (nb_offsets + 1)
+                for contig, length in contig_lengths:
+                    if position < length:
+                        regions.append((contig, position))
+                        break
+                    position -= length
+        else:
+            contigs = list(tabix_file.contigs)
+            step = max(len(contigs) // nb_offsets, 1) if nb_offsets else 1
+            regions = [(contig, 0) for contig in contigs[::step][:nb_offsets]]
+        for contig, position in regions:
+            # Lines are returned as raw text: the records are not decoded
+            for nb_line, line in enumerate(tabix_file.fetch(contig, position)):
+                if nb_line >= nb_lines:
+                    break
+                data_lines.append(line.encode())
+    return data_lines
+
+
+def detect_vcf_aggregation(vcf_file, vcf_profile_cache=None, nb_lines=10, nb_offsets=0):
     """
-    Detect the type of genotype aggregation done in the provided VCF file by checking the first 10 data lines
+    Detect the type of genotype aggregation done in the provided VCF file.
+    When the VcfProfile of the file is already available, it is used. Otherwise the raw text of the first nb_lines
+    data lines is checked, as well as nb_lines lines at nb_offsets positions sampled through the index if any.
     The aggregation is determined to be "none" (meaning genotype are all present) if a GT field can be found in
     all the samples. It is determined to be "basic" if it is not "none" and an AF field or AN and AC fields are found
     in every line checked.
     Otherwise it returns None meaning that the aggregation type could not be determined.
     """
-    with pysam.VariantFile(vcf_file, 'r') as vcf_in:
-        samples = list(vcf_in.header.samples)
-        # check that the first 10 lines have genotypes for all the samples present and if they have allele frequency
-        nb_line_checked = 0
-        max_line_check = 10
-        gt_in_format = True
-        af_in_info = True
-        for vcf_rec in vcf_in:
-            gt_in_format = gt_in_format and all('GT' in vcf_rec.samples.get(sample, {}) for sample in samples)
-            af_in_info = af_in_info and ('AF' in vcf_rec.info or ('AC' in vcf_rec.info and 'AN' in vcf_rec.info))
-            nb_line_checked += 1
-            if nb_line_checked >= max_line_check:
-                break
-        if len(samples) > 0 and gt_in_format:
-            return 'none'
-        elif len(samples) == 0 and af_in_info:
-            return 'basic'
-        else:
-            logger.error(f'Aggregation type could not be detected for {vcf_file}')
-            return None
+    vcf_profile = get_vcf_profile(vcf_file, vcf_profile_cache, compute=False)
+    if vcf_profile:
+        nb_samples = len(vcf_profile.samples)
+        gt_in_format = vcf_profile.has_genotypes
+        af_in_info = vcf_profile.has_allele_frequencies
+    else:
+        with open_vcf_binary(vcf_file) as open_input:
+            header_lines, first_line = read_header(open_input)
+            data_lines = read_data_lines(open_input, first_line, nb_lines)
+        if nb_offsets:
+            data_lines += sample_indexed_data_lines(vcf_file, header_lines, nb_offsets, nb_lines)
+        nb_samples = get_nb_samples(header_lines)
+        gt_in_format = af_in_info = True
+        for data_line in data_lines:
+            has_genotypes, has_allele_frequencies = has_genotypes_and_allele_frequencies(data_line)
+            gt_in_format = gt_in_format and has_genotypes
+            af_in_info = af_in_info and has_allele_frequencies
+    if nb_samples > 0 and gt_in_format:
+        return 'none'
+    elif nb_samples == 0 and af_in_info:
+        return 'basic'
+    else:
+        logger.error(f'Aggregation type could not be detected for {vcf_file}')
+        return None
@@ -4,20 +4,27 @@ import csv
 import os
 import re
 import shutil
+import sqlite3
 import subprocess
 import gzip
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
 
 import yaml
+from cached_property import cached_property
 from ebi_eva_common_pyutils import command_utils
 from ebi_eva_common_pyutils.config import cfg
 from eva_vcf_merge.detect import detect_merge_type, MergeType
 from eva_vcf_merge.merge import VCFMerger
 from eva_vcf_merge.utils import validate_aliases
 
-from eva_submission import NEXTFLOW_DIR
+from eva_submission import NEXTFLOW_DIR, __version__
 from eva_submission.eload_submission import Eload
 from eva_submission.eload_utils import resolve_single_file_path, detect_vcf_aggregation
 from eva_submission.samples_checker import compare_spreadsheet_and_vcf
+from eva_submission.submission_config import EloadConfig
+from eva_submission.vcf_profile import file_fingerprint, open_vcf_profile_cache
+from eva_submission import vcf_validator_report
 from eva_submission.xlsx.xlsx_validation import EvaXlsxValidator
 
 
@@ -25,28 +32,86 @@ class EloadValidation(Eload):
 
     all_validation_tasks = ['metadata_check', 'assembly_check', 'aggregation_check', 'vcf_check', 'sample_check',
                             'structural_variant_check', 'normalisation_check']
-
-    def validate(self, validation_tasks=None, set_as_valid=False, merge_per_analysis=False):
+    workflow_validation_tasks = ['vcf_check', 'assembly_check', 'normalisation_check', 'structural_variant_check']
+    # Executable whose version is part of the fingerprint of the files validated by each task
+    validation_task_executables = {'vcf_check': 'vcf_validator', 'assembly_check': 'vcf_assembly_checker',
+                                   'normalisation_check': 'bcftools'}
+
+    def __init__(self, eload_number: int, config_object: EloadConfig = None):
+        super().__init__(eload_number, config_object)
+        self._fingerprints = {}
+        self._tool_versions = {}
+
+    def validate(self, validation_tasks=None, set_as_valid=False, merge_per_analysis=False, incremental=True,
+                 fail_fast=None):
+        """
+        Run the validation tasks and record their results in the config.
+        When incremental is True, the workflow tasks are only run on the VCF files whose fingerprint changed since the
+        previous validation and the previous results are kept for the other files.
+        When fail_fast is set, vcf_check and assembly_check stop on a file after that number of errors, the checks of
+        the other files of the same analysis are cancelled and their results are recorded as truncated.
+        The results of the Python checks are recorded as soon as they complete. If a check or the workflow fails, the
+        error is raised without waiting for the workflow and the previous results of the workflow tasks are kept.
+        """
         if not validation_tasks:
             validation_tasks = self.all_validation_tasks
+        # The Nextflow workflow is started first and the checks performed in Python run at the same time.
+        python_checks = {
+            'metadata_check': self._validate_metadata_format,
+            'sample_check': self._validate_sample_names,
+            'aggregation_check': self._validate_genotype_aggregation
+        }
+        workflow_tasks = [task for task in validation_tasks if task in self.workflow_validation_tasks]
+        # Results of the previous validation, put back if the new results of a task can not be collected
+        previous_sections = dict(
+            (validation_task, copy.deepcopy(self.eload_cfg.query('validation', validation_task, ret_default={}) or {}))
+            for validation_task in workflow_tasks
+        )
+        previous_results = {}
+        if incremental:
+            previous_results = dict(
+                (validation_task, previous_sections[validation_task].get('files') or {})
+                for validation_task in workflow_tasks
+            )
 
-        # (Re-)Initialise the config file output
+        # (Re-)Initialise the config file output. The results of the Python checks are replaced as they complete.
         self.eload_cfg.set('validation', 'validation_date', value=self.now)
         self.eload_cfg.set('validation', 'valid', value={})
-        for validation_task in validation_tasks:
+        self.eload_cfg.set('validation', 'fail_fast', value=fail_fast)
+        for validation_task in workflow_tasks:
             self.eload_cfg.set('validation', validation_task, value={})
 
-        if 'metadata_check' in validation_tasks:
-            self._validate_metadata_format()
-        if 'sample_check' in validation_tasks:
-            self._validate_sample_names()
-        if 'aggregation_check' in validation_tasks:
-            self._validate_genotype_aggregation()
-        if set(validation_tasks).intersection(
-                {'vcf_check', 'assembly_check', 'normalisation_check', 'structural_variant_check'}
-        ):
-            output_dir = self._run_validation_workflow(validation_tasks)
-            self._collect_validation_workflow_results(output_dir, validation_tasks)
+        executor = ThreadPoolExecutor(max_workers=len(python_checks) + 1)
+        output_dir = None
+        try:
+            vcf_files_per_task = self._get_vcf_files_to_validate(workflow_tasks, previous_results)
+            tasks_to_run = [task for task in workflow_tasks if vcf_files_per_task[task]]
+            workflow_future = None
+            if tasks_to_run:
+                vcf_files_to_validate = sorted(set(
+                    vcf_file for task in tasks_to_run for vcf_file in vcf_files_per_task[task]
+                ))
+                workflow_future = executor.submit(
+                    self._run_validation_workflow, tasks_to_run, vcf_files_to_validate, fail_fast
+                )
+            check_futures = dict(
+                (executor.submit(check), validation_task)
+                for validation_task, check in python_checks.items() if validation_task in validation_tasks
+            )
+            for future in as_completed(check_futures):
+                self.eload_cfg.set('validation', check_futures[future], value=future.result())
+            output_dir = workflow_future.result() if workflow_future else None
+            if workflow_tasks:
+                self._collect_validation_workflow_results(output_dir, workflow_tasks, vcf_files_per_task)
+        except BaseException:
+            # Surface the error without waiting for the workflow and keep the previous results of the workflow tasks
+            self.error('Validation failed: the previous results of the validation workflow are kept')
+            executor.shutdown(wait=False, cancel_futures=True)
+            for validation_task in workflow_tasks:
+                self.eload_cfg.set('validation', validation_task, value=previous_sections[validation_task])
+            raise
+        executor.shutdown()
+        if output_dir:
             shutil.rmtree(output_dir)
 
         if set_as_valid is True:
@@ -87,6 +152,68 @@ class EloadValidation(Eload):
             vcf_files.extend(files) if files else None
         return vcf_files
 
+    def _get_reference_fasta_for_vcf_file(self, vcf_file):
+        for analysis_alias, analysis_data in self.eload_cfg.query('submission', 'analyses', ret_default={}).items():
+            if vcf_file in (analysis_data.get('vcf_files') or []):
+                return analysis_data.get('assembly_fasta')
+
+    def _get_tool_version(self, executable):
+        """Version reported by an executable or its path if the version can not be retrieved."""
+        if executable not in self._tool_versions:
+            executable_path = cfg.query('executable', executable, ret_default=executable)
+            try:
+                process = subprocess.run([executable_path, '--version'], capture_output=True, text=True, timeout=60)
+                output_lines = [line.strip() for line in (process.stdout + process.stderr).splitlines() if line.strip()]
+                self._tool_versions[executable] = output_lines[0] if output_lines else executable_path
+            except (OSError, subprocess.SubprocessError):
+                self._tool_versions[executable] = executable_path
+        return self._tool_versions[executable]
+
+    def _vcf_fingerprint(self, validation_task, vcf_file):
+        """
+        Fingerprint of a VCF file for one validation task, made of the file size, modification time and fast hash,
+        the version of the tools used by the task and the reference genome the file is checked against.
+        Return None if the file does not exist.
+        """
+        if (validation_task, vcf_file) not in self._fingerprints:
+            fingerprint = None
+            if os.path.isfile(vcf_file):
+                fingerprint = file_fingerprint(vcf_file)
+                fingerprint['tool_versions'] = {'eva_submission': __version__}
+                if validation_task in self.validation_task_executables:
+                    executable = self.validation_task_executables[validation_task]
+                    fingerprint['tool_versions'][executable] = self._get_tool_version(executable)
+                if validation_task in ['assembly_check', 'normalisation_check']:
+                    fingerprint['reference'] = self._get_reference_fasta_for_vcf_file(vcf_file)
+            self._fingerprints[(validation_task, vcf_file)] = fingerprint
+        return self._fingerprints[(validation_task, vcf_file)]
+
+    @staticmethod
+    def _vcf_result_key(validation_task, vcf_file):
+        """The normalisation results are stored under the full path of the VCF, the other ones under the file name."""
+        if validation_task == 'normalisation_check':
+            return vcf_file
+        return os.path.basename(vcf_file)
+
+    def _get_vcf_files_to_validate(self, validation_tasks, previous_results):
+        """
+        For each validation task, restore the previous results of the VCF files that have the same fingerprint as when
+        these results were produced and return the other VCF files that need to be validated.
+        """
+        vcf_files_per_task = {}
+        for validation_task in validation_tasks:
+            vcf_files_per_task[validation_task] = []
+            for vcf_file in self._get_vcf_files():
+                key = self._vcf_result_key(validation_task, vcf_file)
+                previous_result = previous_results.get(validation_task, {}).get(key)
+                fingerprint = self._vcf_fingerprint(validation_task, vcf_file)
+                if previous_result and fingerprint and previous_result.get('fingerprint') == fingerprint:
+                    self.debug(f'{vcf_file} has not changed since the last {validation_task}: reuse previous results')
+                    self.eload_cfg.set('validation', validation_task, 'files', key, value=previous_result)
+                else:
+                    vcf_files_per_task[validation_task].append(vcf_file)
+        return vcf_files_per_task
+
     def _get_valid_vcf_files_by_analysis(self):
         vcf_files = {}
         valid_analysis_dict = self.eload_cfg.query('validation', 'valid', 'analyses')
@@ -95,38 +222,50 @@ class EloadValidation(Eload):
                 vcf_files[analysis_alias] = valid_analysis_dict[analysis_alias]['vcf_files']
         return vcf_files
 
+    @cached_property
+    def vcf_profile_cache(self):
+        """Cache of the VcfProfile of the VCF files shared by the validation checks and the workflow steps."""
+        return open_vcf_profile_cache(os.path.join(self._get_dir('validation'), 'vcf_profiles.sqlite'))
+
     def _validate_metadata_format(self):
-        validator = EvaXlsxValidator(self.eload_cfg['submission']['metadata_spreadsheet'])
+        validator = EvaXlsxValidator(self.eload_cfg['submission']['metadata_spreadsheet'], self.metadata_snapshot_dir)
         validator.validate()
-        self.eload_cfg['validation']['metadata_check']['metadata_spreadsheet'] = self.eload_cfg['submission']['metadata_spreadsheet']
-        self.eload_cfg['validation']['metadata_check']['errors'] = validator.error_list
-        self.eload_cfg['validation']['metadata_check']['pass'] = len(validator.error_list) == 0
+        return {
+            'metadata_spreadsheet': self.eload_cfg['submission']['metadata_spreadsheet'],
+            'errors': validator.error_list,
+            'pass': len(validator.error_list) == 0
+        }
 
     def _validate_sample_names(self):
         overall_differences, results_per_analysis_alias = compare_spreadsheet_and_vcf(
             eva_files_sheet=self.eload_cfg['submission']['metadata_spreadsheet'],
-            vcf_dir=self._get_dir('vcf')
+            vcf_dir=self._get_dir('vcf'),
+            vcf_profile_cache=self.vcf_profile_cache
         )
+        sample_check = {}
         for analysis_alias in results_per_analysis_alias:
             has_difference, diff_submitted_file_submission, diff_submission_submitted_file = results_per_analysis_alias[analysis_alias]
 
-            self.eload_cfg.set('validation', 'sample_check', 'analysis', str(analysis_alias), value={
+            sample_check.setdefault('analysis', {})[str(analysis_alias)] = {
                 'difference_exists': has_difference,
                 'in_VCF_not_in_metadata': diff_submitted_file_submission,
                 'in_metadata_not_in_VCF': diff_submission_submitted_file
-            })
-        self.eload_cfg.set('validation', 'sample_check', 'pass', value=not overall_differences)
+            }
+        sample_check['pass'] = not overall_differences
+        return sample_check
 
     def _validate_genotype_aggregation(self):
+        aggregation_check = {}
         errors = []
+        nb_offsets = cfg.query('validation', 'aggregation_sampled_offsets', ret_default=0)
         for analysis_alias in self.eload_cfg.query('submission', 'analyses'):
             aggregations = [
-                detect_vcf_aggregation(vcf_file)
+                detect_vcf_aggregation(vcf_file, self.vcf_profile_cache, nb_offsets=nb_offsets)
                 for vcf_file in self.eload_cfg.query('submission', 'analyses', analysis_alias, 'vcf_files')
             ]
             if len(set(aggregations)) == 1 and None not in aggregations:
                 aggregation = set(aggregations).pop()
-                self.eload_cfg.set('validation', 'aggregation_check', 'analyses', str(analysis_alias), value=aggregation)
+                aggregation_check.setdefault('analyses', {})[str(analysis_alias)] = aggregation
             elif None in aggregations:
                 indices = [i for i, x in enumerate(aggregations) if x is None]
                 errors.append(f'{analysis_alias}: VCF file aggregation could not be determied: ' + ', '.join([
@@ -135,8 +274,9 @@ class EloadValidation(Eload):
                 ]))
             else:
                 errors.append(f'{analysis_alias}: Multiple aggregation found: {",".join(set(aggregations))}')
-        self.eload_cfg.set('validation', 'aggregation_check', 'errors', value=errors)
-        self.eload_cfg.set('validation', 'aggregation_check', 'pass', value=len(errors) == 0)
+        aggregation_check['errors'] = errors
+        aggregation_check['pass'] = len(errors) == 0
+        return aggregation_check
 
     def detect_and_optionally_merge(self, merge_per_analysis):
         """Detects merge type for each analysis, but performs merge only when merge_per_analysis is True."""
@@ -230,6 +370,50 @@ class EloadValidation(Eload):
                         error_list.append(line.strip())
         return valid, error_list, error_count, warning_count
 
+    def parse_vcf_check_db_report(self, vcf_check_db_report, vcf_check_text_report=None, max_errors=10):
+        """
+        Get the validity, the first errors and the number of errors and warnings from the SQLite report of
+        vcf_validator using aggregate queries, so that the time taken does not depend on the number of errors.
+        The errors and warnings are in the Error table of the report and differ by their severity.
+        Return None if the database can not be read, or if its validity differs from the conclusion of the text report,
+        so that the text report can be used instead.
+        """
+        try:
+            with closing(sqlite3.connect(f'file:{vcf_check_db_report}?mode=ro', uri=True)) as connection:
+                if not vcf_validator_report.has_errors_table(connection):
+                    return None
+                counts = dict(connection.execute(
+                    f'SELECT severity, count(*) FROM "{vcf_validator_report.errors_table}" GROUP BY severity'
+                ))
+                error_count = counts.get(vcf_validator_report.error_severity, 0)
+                warning_count = counts.get(vcf_validator_report.warning_severity, 0)
+                error_list = [
+                    f'Line {line}: {message}'
+                    for line, message in connection.execute(
+                        f'SELECT line, message FROM "{vcf_validator_report.errors_table}" WHERE severity = ? '
+                        f'ORDER BY id LIMIT ?',
+                        (vcf_validator_report.error_severity, max_errors)
+                    )
+                ]
+        except sqlite3.Error as e:
+            self.warning(f'Could not read {vcf_check_db_report}: {e}')
+            return None
+        valid = error_count == 0
+        if vcf_check_text_report and self._read_vcf_check_conclusion(vcf_check_text_report) not in (None, valid):
+            self.warning(f'The errors of {vcf_check_db_report} do not match the conclusion of {vcf_check_text_report}')
+            return None
+        return valid, error_list, error_count, warning_count
+
+    @staticmethod
+    def _read_vcf_check_conclusion(vcf_check_text_report):
+        """Validity concluded on the last line of the text report of vcf_validator or None if there is none."""
+        with open(vcf_check_text_report, 'rb') as open_file:
+            open_file.seek(max(0, os.path.getsize(vcf_check_text_report) - 1024))
+            last_line = open_file.read().rstrip(b'\n').rsplit(b'\n', 1)[-1].decode(errors='replace')
+        if last_line.startswith('According to the VCF specification'):
+            return 'not' not in last_line
+        return None
+
     def parse_bcftools_norm_report(self, norm_report):
         total = split = realigned = skipped = 0
         error_list = []
@@ -247,11 +431,12 @@ class EloadValidation(Eload):
             nb_sv = int(open_file.readline().split()[0])
         return nb_sv
 
-    def _generate_csv_mappings(self):
+    def _generate_csv_mappings(self, vcf_files_to_validate=None):
+        """Write the csv of VCF files to validate with their reference. Restricted to vcf_files_to_validate if set."""
         vcf_files_mapping_csv = os.path.join(self.eload_dir, 'vcf_files_mapping.csv')
         with open(vcf_files_mapping_csv, 'w', newline='') as file:
             writer = csv.writer(file)
-            writer.writerow(['vcf', 'fasta', 'report', 'assembly_accession'])
+            writer.writerow(['vcf', 'fasta', 'report', 'assembly_accession', 'analysis_alias'])
             analyses = self.eload_cfg.query('submission', 'analyses')
             for analysis_alias, analysis_data in analyses.items():
                 fasta = analysis_data['assembly_fasta']
@@ -259,21 +444,34 @@ class EloadValidation(Eload):
                 assembly_accession = analysis_data['assembly_accession']
                 if analysis_data['vcf_files']:
                     for vcf_file in analysis_data['vcf_files']:
-                        writer.writerow([vcf_file, fasta, report, assembly_accession])
+                        if vcf_files_to_validate is None or vcf_file in vcf_files_to_validate:
+                            writer.writerow([vcf_file, fasta, report, assembly_accession, analysis_alias])
                 else:
                     self.warning(f"VCF files for analysis {analysis_alias} not found")
         return vcf_files_mapping_csv
 
-    def _run_validation_workflow(self, validation_tasks):
+    def _run_validation_workflow(self, validation_tasks, vcf_files_to_validate=None, fail_fast=None):
         output_dir = self.create_nextflow_temp_output_directory()
-        vcf_files_mapping_csv = self._generate_csv_mappings()
+        vcf_files_mapping_csv = self._generate_csv_mappings(vcf_files_to_validate)
         cfg['executable']['python']['script_path'] = os.path.dirname(os.path.dirname(__file__))
         validation_config = {
             'vcf_files_mapping': vcf_files_mapping_csv,
             'output_dir': output_dir,
             'executable': cfg['executable'],
-            'validation_tasks': validation_tasks
+            'validation_tasks': validation_tasks,
+            'sv_check_processes': cfg.query('validation', 'sv_check_processes', ret_default=1),
+            'shard_validation': cfg.query('validation', 'shard_validation', ret_default=False),
+            'shard_records': cfg.query('validation', 'shard_records', ret_default=5000000),
+            'vcf_profile_cache': self.vcf_profile_cache.db_path,
+            'fail_fast': fail_fast
         }
+        if cfg.query('genome_downloader', 'output_directory'):
+            genome_dir = os.path.abspath(cfg.query('genome_downloader', 'output_directory'))
+            validation_config['contig_alias_cache'] = os.path.join(genome_dir, 'contig_alias_cache.sqlite')
+            validation_config['custom_genome_store'] = os.path.join(genome_dir, 'custom_genomes')
+            validation_config['custom_genome_store_size'] = cfg.query(
+                'validation', 'custom_genome_store_size', ret_default=100
+            )
         # run the validation
         validation_confg_file = os.path.join(self.eload_dir, 'validation_confg_file.yaml')
         with open(validation_confg_file, 'w') as open_file:
@@ -301,20 +499,42 @@ class EloadValidation(Eload):
         else:
             return None
 
-    def _collect_validation_workflow_results(self, output_dir, validation_tasks):
+    def _collect_validation_workflow_results(self, output_dir, validation_tasks, vcf_files_per_task=None):
         # Collect information from the output and summarise in the config
-        vcf_files = self._get_vcf_files()
+        if vcf_files_per_task is None:
+            vcf_files_per_task = dict((task, self._get_vcf_files()) for task in validation_tasks)
         if 'vcf_check' in validation_tasks:
-            self._collect_vcf_check_results(vcf_files, output_dir)
+            self._collect_vcf_check_results(vcf_files_per_task['vcf_check'], output_dir)
         if 'assembly_check' in validation_tasks:
-            self._collect_assembly_check_results(vcf_files, output_dir)
+            self._collect_assembly_check_results(vcf_files_per_task['assembly_check'], output_dir)
         if 'normalisation_check' in validation_tasks:
-            self._collect_normalisation_check_results(vcf_files, output_dir)
+            self._collect_normalisation_check_results(vcf_files_per_task['normalisation_check'], output_dir)
         if 'structural_variant_check' in validation_tasks:
-            self._collect_structural_variant_check_results(vcf_files, output_dir)
+            self._collect_structural_variant_check_results(vcf_files_per_task['structural_variant_check'], output_dir)
+
+    def _set_file_results(self, validation_task, vcf_file, results, process_failed=False):
+        """Store the results of a VCF file with its fingerprint, unless the process failed so that it is run again."""
+        if not process_failed:
+            results['fingerprint'] = self._vcf_fingerprint(validation_task, vcf_file)
+        self.eload_cfg.set('validation', validation_task, 'files', self._vcf_result_key(validation_task, vcf_file),
+                           value=results)
+
+    def _get_all_file_results(self, validation_task):
+        return (self.eload_cfg.query('validation', validation_task, 'files', ret_default={}) or {}).values()
+
+    def _get_truncation_reason(self, output_dir, check_dir, vcf_name):
+        """Reason why the check of the VCF was stopped early in fail fast mode, or None if it ran to completion."""
+        truncated_marker = resolve_single_file_path(os.path.join(output_dir, check_dir, vcf_name + '.truncated'))
+        if truncated_marker:
+            with open(truncated_marker) as open_file:
+                return open_file.read().strip()
+        return None
+
+    def _set_truncated(self, validation_task):
+        truncated = any(results.get('truncated') for results in self._get_all_file_results(validation_task))
+        self.eload_cfg.set('validation', validation_task, 'truncated', value=truncated)
 
     def _collect_vcf_check_results(self, vcf_files, output_dir):
-        total_error = 0
         # detect output files for vcf check
         for vcf_file in vcf_files:
             vcf_name = os.path.basename(vcf_file)
@@ -342,22 +562,32 @@ class EloadValidation(Eload):
                 tmp_vcf_check_db_report,
                 os.path.join(self._get_dir('vcf_check'), vcf_name + '.vcf_validator.db')
             )
-            if vcf_check_log and vcf_check_text_report and vcf_check_db_report:
-                valid, error_list, error_count, warning_count = self.parse_vcf_check_report(vcf_check_text_report)
+            truncation_reason = self._get_truncation_reason(output_dir, 'vcf_format', vcf_name)
+            process_failed = not (vcf_check_log and vcf_check_text_report and vcf_check_db_report)
+            if not process_failed:
+                db_report_results = self.parse_vcf_check_db_report(vcf_check_db_report, vcf_check_text_report)
+                if db_report_results:
+                    valid, error_list, error_count, warning_count = db_report_results
+                else:
+                    valid, error_list, error_count, warning_count = self.parse_vcf_check_report(vcf_check_text_report)
             else:
-                valid, error_list, error_count, warning_count = (False, ['Process failed'], 1, 0)
-            total_error += error_count
+                valid, error_list, error_count, warning_count = (False, [truncation_reason or 'Process failed'], 1, 0)
 
-            self.eload_cfg.set('validation', 'vcf_check', 'files', vcf_name, value={
+            results = {
                 'error_list': error_list, 'nb_error': error_count, 'nb_warning': warning_count,
                 'vcf_check_log': vcf_check_log, 'vcf_check_text_report': vcf_check_text_report,
                 'vcf_check_db_report': vcf_check_db_report
-            })
+            }
+            if truncation_reason:
+                # Results of a stopped check are incomplete so they are not kept for the next validation
+                results['truncated'] = truncation_reason
+            self._set_file_results('vcf_check', vcf_file, results, process_failed or bool(truncation_reason))
+        total_error = sum(results['nb_error'] for results in self._get_all_file_results('vcf_check'))
         self.eload_cfg.set('validation', 'vcf_check', 'pass', value=total_error == 0)
+        self._set_truncated('vcf_check')
 
     def _collect_assembly_check_results(self, vcf_files, output_dir):
         # detect output files for assembly check
-        total_error = 0
         for vcf_file in vcf_files:
             vcf_name = os.path.basename(vcf_file)
 
@@ -384,7 +614,9 @@ class EloadValidation(Eload):
                 tmp_assembly_check_text_report,
                 os.path.join(self._get_dir('assembly_check'), vcf_name + '.text_assembly_report.txt')
             )
-            if assembly_check_log and assembly_check_valid_vcf and assembly_check_text_report:
+            truncation_reason = self._get_truncation_reason(output_dir, 'assembly_check', vcf_name)
+            process_failed = not (assembly_check_log and assembly_check_valid_vcf and assembly_check_text_report)
+            if not process_failed:
                 error_list_from_log, nb_error_from_log, match, total = \
                     self.parse_assembly_check_log(assembly_check_log)
                 mismatch_list, nb_mismatch, error_list_from_report, nb_error_from_report = \
@@ -392,20 +624,25 @@ class EloadValidation(Eload):
                 nb_error = nb_error_from_log + nb_error_from_report
                 error_list = error_list_from_log + error_list_from_report
             else:
-                error_list, mismatch_list, nb_mismatch, nb_error, match, total = (['Process failed'], [], 0, 1, 0, 0)
-            total_error += nb_error + nb_mismatch
-            self.eload_cfg.set('validation', 'assembly_check', 'files', vcf_name, value={
+                error_list, mismatch_list, nb_mismatch, nb_error, match, total = \
+                    ([truncation_reason or 'Process failed'], [], 0, 1, 0, 0)
+            results = {
                 'error_list': error_list, 'mismatch_list': mismatch_list, 'nb_mismatch': nb_mismatch,
                 'nb_error': nb_error, 'ref_match': match,
                 'nb_variant': total, 'assembly_check_log': assembly_check_log,
                 'assembly_check_valid_vcf': assembly_check_valid_vcf,
                 'assembly_check_text_report': assembly_check_text_report
-            })
+            }
+            if truncation_reason:
+                results['truncated'] = truncation_reason
+            self._set_file_results('assembly_check', vcf_file, results, process_failed or bool(truncation_reason))
+        total_error = sum(results['nb_error'] + results['nb_mismatch']
+                          for results in self._get_all_file_results('assembly_check'))
         self.eload_cfg.set('validation', 'assembly_check', 'pass', value=total_error == 0)
+        self._set_truncated('assembly_check')
 
     def _collect_normalisation_check_results(self, vcf_files, output_dir):
         # detect output files for bcftools norm
-        total_error = 0
         for vcf_file in vcf_files:
             vcf_name = os.path.basename(vcf_file)
             uncompressed_vcf_name = vcf_name
@@ -433,13 +670,13 @@ class EloadValidation(Eload):
                 error_list, total, split, realigned, skipped = self.parse_bcftools_norm_report(normalisation_log)
             else:
                 error_list, total, split, realigned, skipped = (['Process failed'], 0, 0, 0, 0)
-            self.eload_cfg.set('validation', 'normalisation_check', 'files', vcf_file, value={
+            self._set_file_results('normalisation_check', vcf_file, {
                 'error_list': error_list, 'nb_variant': total, 'nb_split': split,
                 'nb_realigned': realigned, 'nb_skipped': skipped,
                 'normalisation_log': normalisation_log,
                 'normalised_vcf': normalised_vcf,
-            })
-            total_error += len(error_list)
+            }, process_failed=not normalisation_log)
+        total_error = sum(len(results['error_list']) for results in self._get_all_file_results('normalisation_check'))
         self.eload_cfg.set('validation', 'normalisation_check', 'pass', value=total_error == 0)
 
     def _collect_structural_variant_check_results(self, vcf_files, output_dir):
@@ -466,8 +703,8 @@ class EloadValidation(Eload):
 
             if sv_check_log and sv_check_sv_vcf:
                 nb_sv = self.parse_sv_check_log(sv_check_log)
-                self.eload_cfg.set('validation', 'structural_variant_check', 'files', os.path.basename(vcf_file),
-                                   value={'has_structural_variant': nb_sv > 0, 'number_sv': nb_sv})
+                self._set_file_results('structural_variant_check', vcf_file,
+                                       {'has_structural_variant': nb_sv > 0, 'number_sv': nb_sv})
         self.eload_cfg.set('validation', 'structural_variant_check', 'pass', value=True)
 
     def _metadata_check_report(self):
@@ -486,6 +723,12 @@ class EloadValidation(Eload):
 """.format(**report_data))
         return '\n'.join(reports)
 
+    @staticmethod
+    def _truncated_report(results):
+        if results.get('truncated'):
+            return f"    - results truncated: {results['truncated']}\n"
+        return ''
+
     def _vcf_check_report(self):
         reports = []
         for vcf_file in self.eload_cfg.query('validation', 'vcf_check', 'files', ret_default=[]):
@@ -501,7 +744,7 @@ class EloadValidation(Eload):
     - number of warning: {nb_warning}
     - first 10 errors: {10_error_list}
     - see report for detail: {vcf_check_text_report}
-""".format(**report_data))
+""".format(**report_data) + self._truncated_report(results))
         return '\n'.join(reports)
 
     def _assembly_check_report(self):
@@ -522,7 +765,7 @@ class EloadValidation(Eload):
     - first 10 errors: {10_error_list}
     - first 10 mismatches: {10_mismatch_list}
     - see report for detail: {assembly_check_text_report}
-""".format(**report_data))
+""".format(**report_data) + self._truncated_report(results))
         return '\n'.join(reports)
 
     def _sample_check_report(self):
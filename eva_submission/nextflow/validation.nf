@@ -15,13 +15,44 @@ def helpMessage() {
 params.vcf_files_mapping = null
 params.output_dir = null
 // executables
-params.executable = ["vcf_assembly_checker": "vcf_assembly_checker", "vcf_validator": "vcf_validator", "bgzip": "bgzip"]
+params.executable = ["vcf_assembly_checker": "vcf_assembly_checker", "vcf_validator": "vcf_validator", "bgzip": "bgzip", "tabix": "tabix", "bcftools": "bcftools"]
 // validation tasks
 params.validation_tasks = ["assembly_check", "vcf_check", "normalisation_check", "structural_variant_check"]
+// number of processes used to scan each bgzipped VCF for structural variants
+params.sv_check_processes = 1
+// SQLite database where the contig alias responses are cached between runs
+params.contig_alias_cache = null
+// directory where the renamed genomes are shared between runs and its maximum size in GB
+params.custom_genome_store = null
+params.custom_genome_store_size = 100
+// SQLite database where the profiles of the VCF files are cached
+params.vcf_profile_cache = null
+// split the indexed VCFs in shards of whole contigs with at least this number of records for vcf_check and assembly_check
+params.shard_validation = false
+params.shard_records = 5000000
+// stop vcf_check and assembly_check of a file after this number of errors and cancel the ones of the same analysis
+params.fail_fast = null
 // help
 params.help = null
 
 
+/*
+* Command running a check that writes its reports in output_dir.
+* When fail_fast is set, the command is stopped once it reported that number of errors and the checks of the other
+* files of the analysis are cancelled.
+*/
+def checkCommand(check, command, output_dir, log_file, truncated_marker, analysis) {
+    if (!params.fail_fast) {
+        return "$command > $log_file 2>&1"
+    }
+    def cancel_marker = "${params.output_dir}/fail_fast/${analysis.replaceAll(/[^A-Za-z0-9_.-]/, '_')}_${check}"
+    return "PYTHONPATH=\"$params.executable.python.script_path\" $params.executable.python.interpreter " +
+           "-m eva_submission.steps.run_with_error_budget --check $check --max_errors $params.fail_fast " +
+           "--output_dir $output_dir --log_file $log_file --truncated_marker $truncated_marker " +
+           "--cancel_marker $cancel_marker -- $command"
+}
+
+
 // Show help message
 if (params.help) exit 0, helpMessage()
 
@@ -37,12 +68,50 @@ workflow {
     vcf_channel = Channel.fromPath(params.vcf_files_mapping)
         .splitCsv(header:true)
         .map{row -> tuple(file(row.vcf), file(row.fasta), file(row.report))}
-
+    // The checks that can fail fast also need the analysis of each file
+    whole_vcf_channel = Channel.fromPath(params.vcf_files_mapping)
+        .splitCsv(header:true)
+        .map{row -> tuple(file(row.vcf), file(row.fasta), file(row.report), row.analysis_alias ?: "")}
+
+    if (params.shard_validation && ("vcf_check" in params.validation_tasks || "assembly_check" in params.validation_tasks)) {
+        whole_vcf_channel
+            .map{vcf, fasta, report, analysis -> tuple(vcf, [file("${vcf}.csi"), file("${vcf}.tbi")].find{it.exists()}, fasta, report, analysis)}
+            .branch{
+                indexed: it[1] != null
+                not_indexed: true
+            }
+            .set{vcf_by_index}
+        whole_vcf_channel = vcf_by_index.not_indexed.map{vcf, index, fasta, report, analysis -> tuple(vcf, fasta, report, analysis)}
+        plan_vcf_shards(vcf_by_index.indexed)
+        // The number of shards of each VCF is passed along so that its merge starts as soon as its shards are done
+        shard_channel = plan_vcf_shards.out.shards.flatMap{vcf, index, fasta, report, analysis, shards_csv ->
+            def rows = shards_csv.splitCsv(header:true)
+            rows.collect{row ->
+                tuple(vcf, index, fasta, report, analysis, row.shard, row.regions_file, row.line_offset, row.header_lines, rows.size())
+            }
+        }
+    }
     if ("vcf_check" in params.validation_tasks) {
-        check_vcf_valid(vcf_channel)
+        check_vcf_valid(whole_vcf_channel)
+        if (params.shard_validation) {
+            check_vcf_valid_shard(shard_channel)
+            merge_vcf_valid_shards(
+                check_vcf_valid_shard.out.shard_output
+                    .map{vcf_name, nb_shards, shard_dir -> tuple(groupKey(vcf_name, nb_shards as int), shard_dir)}
+                    .groupTuple()
+            )
+        }
     }
     if ("assembly_check" in params.validation_tasks) {
-        check_vcf_reference(vcf_channel)
+        check_vcf_reference(whole_vcf_channel)
+        if (params.shard_validation) {
+            check_vcf_reference_shard(shard_channel)
+            merge_vcf_reference_shards(
+                check_vcf_reference_shard.out.shard_output
+                    .map{vcf_name, nb_shards, shard_dir -> tuple(groupKey(vcf_name, nb_shards as int), shard_dir)}
+                    .groupTuple()
+            )
+        }
     }
     if ("normalisation_check" in params.validation_tasks) {
         fasta_channel = Channel.fromPath(params.vcf_files_mapping)
@@ -71,19 +140,24 @@ process check_vcf_valid {
             mode: "copy"
 
     input:
-    tuple path(vcf), path(fasta), path(report)
+    tuple path(vcf), path(fasta), path(report), val(analysis)
 
     output:
-    path "vcf_format/*.errors.*.db", emit: vcf_validation_db
-    path "vcf_format/*.errors.*.txt", emit: vcf_validation_txt
-    path "vcf_format/*.vcf_format.log", emit: vcf_validation_log
+    path "vcf_format/*.errors.*.db", emit: vcf_validation_db, optional: params.fail_fast as boolean
+    path "vcf_format/*.errors.*.txt", emit: vcf_validation_txt, optional: params.fail_fast as boolean
+    path "vcf_format/*.vcf_format.log", emit: vcf_validation_log, optional: params.fail_fast as boolean
+    path "vcf_format/*.truncated", emit: vcf_validation_truncated, optional: true
 
     script:
+    def command = checkCommand(
+        "vcf_check", "$params.executable.vcf_validator -i $vcf  -r database,text -o vcf_format --require-evidence",
+        "vcf_format", "vcf_format/${vcf}.vcf_format.log", "vcf_format/${vcf}.truncated", analysis
+    )
     """
     trap 'if [[ \$? == 1 ]]; then exit 0; fi' EXIT
 
     mkdir -p vcf_format
-    $params.executable.vcf_validator -i $vcf  -r database,text -o vcf_format --require-evidence > vcf_format/${vcf}.vcf_format.log 2>&1
+    $command
     """
 }
 
@@ -97,25 +171,164 @@ process check_vcf_reference {
             mode: "copy"
 
     input:
-    tuple path(vcf), path(fasta), path(report)
+    tuple path(vcf), path(fasta), path(report), val(analysis)
 
     output:
-    path "assembly_check/*valid_assembly_report*", emit: vcf_assembly_valid
-    path "assembly_check/*text_assembly_report*", emit: assembly_check_report
-    path "assembly_check/*.assembly_check.log", emit: assembly_check_log
+    path "assembly_check/*valid_assembly_report*", emit: vcf_assembly_valid, optional: params.fail_fast as boolean
+    path "assembly_check/*text_assembly_report*", emit: assembly_check_report, optional: params.fail_fast as boolean
+    path "assembly_check/*.assembly_check.log", emit: assembly_check_log, optional: params.fail_fast as boolean
+    path "assembly_check/*.truncated", emit: assembly_check_truncated, optional: true
 
     script:
+    def command = checkCommand(
+        "assembly_check", "$params.executable.vcf_assembly_checker -i $vcf -f $fasta -a $report -r summary,text,valid  -o assembly_check --require-genbank",
+        "assembly_check", "assembly_check/${vcf}.assembly_check.log", "assembly_check/${vcf}.truncated", analysis
+    )
     """
     trap 'if [[ \$? == 1 || \$? == 139 ]]; then exit 0; fi' EXIT
 
     mkdir -p assembly_check
-    $params.executable.vcf_assembly_checker -i $vcf -f $fasta -a $report -r summary,text,valid  -o assembly_check --require-genbank > assembly_check/${vcf}.assembly_check.log 2>&1
+    $command
+    """
+}
+
+
+/*
+* Split an indexed VCF in shards of whole contigs
+*/
+process plan_vcf_shards {
+
+    input:
+    tuple path(vcf), path(index), path(fasta), path(report), val(analysis)
+
+    output:
+    tuple path(vcf), path(index), path(fasta), path(report), val(analysis), path("${vcf}.shards.csv"), emit: shards
+
+    script:
+    """
+    export PYTHONPATH="$params.executable.python.script_path"
+    $params.executable.python.interpreter -m eva_submission.steps.plan_vcf_shards \
+    --vcf_file $vcf --records_per_shard $params.shard_records --output_csv ${vcf}.shards.csv \
+    --bcftools $params.executable.bcftools
+    """
+}
+
+
+/*
+* Validate the VCF file format of one shard of the VCF
+*/
+process check_vcf_valid_shard {
+
+    input:
+    tuple path(vcf), path(index), path(fasta), path(report), val(analysis), val(shard), val(regions_file), val(line_offset), val(header_lines), val(nb_shards)
+
+    output:
+    tuple val("${vcf}"), val(nb_shards), path("shard_${shard}"), emit: shard_output
+
+    script:
+    def shard_vcf = regions_file ? "${vcf}.shard_${shard}.vcf" : "$vcf"
+    def extract_shard = regions_file ? "$params.executable.tabix -h -R $regions_file $vcf > $shard_vcf" : ""
+    def remove_shard = regions_file ? "rm $shard_vcf" : ""
+    def command = checkCommand(
+        "vcf_check", "$params.executable.vcf_validator -i $shard_vcf -r database,text -o shard_${shard}/vcf_format --require-evidence",
+        "shard_${shard}/vcf_format", "shard_${shard}/vcf_format/${shard_vcf}.vcf_format.log",
+        "shard_${shard}/vcf_format/${shard_vcf}.truncated", analysis
+    )
+    """
+    mkdir -p shard_${shard}/vcf_format
+    echo '{"shard": $shard, "line_offset": $line_offset, "header_lines": $header_lines}' > shard_${shard}/shard_info.json
+    $extract_shard
+    $command || [[ \$? == 1 ]]
+    $remove_shard
+    """
+}
+
+
+/*
+* Merge the results of the VCF file format validation of the shards of a VCF
+*/
+process merge_vcf_valid_shards {
+    publishDir "$params.output_dir",
+            overwrite: false,
+            mode: "copy"
+
+    input:
+    tuple val(vcf_name), path(shard_dirs)
+
+    output:
+    path "vcf_format/*.errors.*.db", emit: vcf_validation_db, optional: true
+    path "vcf_format/*.errors.*.txt", emit: vcf_validation_txt, optional: true
+    path "vcf_format/*.vcf_format.log", emit: vcf_validation_log
+    path "vcf_format/*.truncated", emit: vcf_validation_truncated, optional: true
+
+    script:
+    """
+    export PYTHONPATH="$params.executable.python.script_path"
+    $params.executable.python.interpreter -m eva_submission.steps.merge_validation_shards \
+    --check vcf_check --vcf_name $vcf_name --shard_dirs $shard_dirs --output_dir vcf_format
+    """
+}
+
+
+/*
+* Validate the VCF reference allele of one shard of the VCF
+*/
+process check_vcf_reference_shard {
+
+    input:
+    tuple path(vcf), path(index), path(fasta), path(report), val(analysis), val(shard), val(regions_file), val(line_offset), val(header_lines), val(nb_shards)
+
+    output:
+    tuple val("${vcf}"), val(nb_shards), path("shard_${shard}"), emit: shard_output
+
+    script:
+    def shard_vcf = regions_file ? "${vcf}.shard_${shard}.vcf" : "$vcf"
+    def extract_shard = regions_file ? "$params.executable.tabix -h -R $regions_file $vcf > $shard_vcf" : ""
+    def remove_shard = regions_file ? "rm $shard_vcf" : ""
+    def command = checkCommand(
+        "assembly_check", "$params.executable.vcf_assembly_checker -i $shard_vcf -f $fasta -a $report -r summary,text,valid  -o shard_${shard}/assembly_check --require-genbank",
+        "shard_${shard}/assembly_check", "shard_${shard}/assembly_check/${shard_vcf}.assembly_check.log",
+        "shard_${shard}/assembly_check/${shard_vcf}.truncated", analysis
+    )
+    """
+    mkdir -p shard_${shard}/assembly_check
+    echo '{"shard": $shard, "line_offset": $line_offset, "header_lines": $header_lines}' > shard_${shard}/shard_info.json
+    $extract_shard
+    $command || { status=\$?; [[ \$status == 1 || \$status == 139 ]]; }
+    $remove_shard
+    """
+}
+
+
+/*
+* Merge the results of the VCF reference allele validation of the shards of a VCF
+*/
+process merge_vcf_reference_shards {
+    publishDir "$params.output_dir",
+            overwrite: true,
+            mode: "copy"
+
+    input:
+    tuple val(vcf_name), path(shard_dirs)
+
+    output:
+    path "assembly_check/*valid_assembly_report*", emit: vcf_assembly_valid, optional: true
+    path "assembly_check/*text_assembly_report*", emit: assembly_check_report, optional: true
+    path "assembly_check/*.assembly_check.log", emit: assembly_check_log, optional: true
+    path "assembly_check/*.truncated", emit: assembly_check_truncated, optional: true
+
+    script:
+    """
+    export PYTHONPATH="$params.executable.python.script_path"
+    $params.executable.python.interpreter -m eva_submission.steps.merge_validation_shards \
+    --check assembly_check --vcf_name $vcf_name --shard_dirs $shard_dirs --output_dir assembly_check
     """
 }
 
 
 /*
 * Convert the genome to the same naming convention as the VCF
+* When a custom genome store is configured, the output links to a genome previously converted with the same names
 */
 process prepare_genome {
 
@@ -126,11 +339,14 @@ process prepare_genome {
     tuple val(assembly_accession), path("${fasta.getSimpleName()}_custom.fa"), emit: custom_fasta
 
     script:
+    def contig_alias_cache_option = params.contig_alias_cache ? "--contig_alias_cache $params.contig_alias_cache" : ""
+    def custom_genome_store_option = params.custom_genome_store ? "--custom_genome_store $params.custom_genome_store --custom_genome_store_size $params.custom_genome_store_size" : ""
+    def vcf_profile_cache_option = params.vcf_profile_cache ? "--vcf_profile_cache $params.vcf_profile_cache" : ""
     """
     export PYTHONPATH="$params.executable.python.script_path"
     $params.executable.python.interpreter -m eva_submission.steps.rename_contigs_from_insdc_in_assembly \
     --assembly_accession $assembly_accession --assembly_fasta $fasta --custom_fasta ${fasta.getSimpleName()}_custom.fa \
-    --assembly_report $report --vcf_files $vcf_files
+    --assembly_report $report --vcf_files $vcf_files $contig_alias_cache_option $custom_genome_store_option $vcf_profile_cache_option
     """
 }
 
@@ -168,6 +384,8 @@ process normalise_vcf {
  * Detect the structural variant in VCF
  */
 process detect_sv {
+    cpus params.sv_check_processes
+
     publishDir "$params.output_dir",
             overwrite: false,
             mode: "copy"
@@ -180,14 +398,14 @@ process detect_sv {
     path "sv_check/*_sv_list.vcf.gz", emit: sv_list_vcf
 
     script:
+    def vcf_profile_cache_option = params.vcf_profile_cache ? "--vcf_profile_cache $params.vcf_profile_cache" : ""
     """
     mkdir -p sv_check
 
     export PYTHONPATH="$params.executable.python.script_path"
     $params.executable.python.interpreter -m eva_submission.steps.structural_variant_detection \
-    --vcf_file $vcf_file --output_vcf_file_with_sv sv_check/${vcf_file.getSimpleName()}_sv_list.vcf \
+    --vcf_file $vcf_file --output_vcf_file_with_sv sv_check/${vcf_file.getSimpleName()}_sv_list.vcf.gz \
+    --nb_processes $params.sv_check_processes $vcf_profile_cache_option \
     > sv_check/${vcf_file.getSimpleName()}_sv_check.log 2>&1
-    $params.executable.bgzip -c sv_check/${vcf_file.getSimpleName()}_sv_list.vcf > sv_check/${vcf_file.getSimpleName()}_sv_list.vcf.gz
-    rm sv_check/${vcf_file.getSimpleName()}_sv_list.vcf
     """
 }
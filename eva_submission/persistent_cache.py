@@ -0,0 +1,67 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from ebi_eva_common_pyutils.logger import AppLogger
+
+
+class PersistentCache(AppLogger):
+    """
+    Key/value cache stored in a SQLite database so that it can be shared between processes and runs.
+    Values are serialised to JSON and expire after the time to live (in seconds) set on the cache.
+    """
+
+    def __init__(self, db_path, table='cache', ttl=7 * 24 * 3600):
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} '
+                         f'(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        # The timeout lets concurrent writers wait for each other instead of failing
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key, default=None):
+        """Return the value stored for the key or the default if it is missing or expired."""
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT value, created FROM {self.table} WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return default
+        value, created = row
+        if time.time() - created > self.ttl:
+            self.debug(f'Cached entry {key} in {self.db_path} has expired')
+            return default
+        return json.loads(value)
+
+    def set(self, key, value):
+        with self._connect() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)',
+                         (key, json.dumps(value), time.time()))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute(f'DELETE FROM {self.table} WHERE key=?', (key,))
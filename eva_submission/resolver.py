@@ -0,0 +1,139 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from ebi_eva_common_pyutils.config import cfg
+from ebi_eva_common_pyutils.logger import AppLogger
+
+from eva_submission.persistent_cache import PersistentCache
+
+# Number of days the results of the lookups are kept in the persistent cache by default. The lookups that did not find
+# anything are kept for less time as the remote services might know about them later.
+default_lookup_ttl_days = 30
+default_negative_lookup_ttl_days = 1
+
+
+def is_negative(result):
+    """Whether the result of a lookup means that nothing was found: None, empty or only made of None."""
+    if isinstance(result, (list, tuple)) and result:
+        return all(value is None for value in result)
+    return result is None or result == [] or result == ''
+
+
+class Resolver(AppLogger):
+    """
+    Runs the lookups of remote services, such as NCBI or Ensembl, keeping their results in memory and optionally in
+    PersistentCaches shared between the ELOADs so that repeated lookups are answered locally. The lookups that did not
+    find anything are kept in their own cache, which usually has a shorter time to live. Lookups raising an exception
+    are not cached.
+    A lookup is identified by its name and its arguments, which must be serialisable to JSON like its result. Results
+    read from the persistent caches have their tuples converted to lists.
+    The number of lookups answered from the caches (hits) and run remotely (misses) are counted per lookup name.
+    """
+
+    def __init__(self, cache=None, negative_cache=None, max_workers=4):
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.max_workers = max_workers
+        self.hits = Counter()
+        self.misses = Counter()
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, args):
+        return name + ':' + json.dumps(args)
+
+    def _cached_result(self, key):
+        """Return a tuple containing the result cached for the key or None if it is not cached."""
+        with self._lock:
+            if key in self._results:
+                return (self._results[key],)
+        if self.cache:
+            result = self.cache.get(key)
+            if result is not None:
+                return (result,)
+        if self.negative_cache:
+            # Negative results are wrapped as they can be None
+            negative_result = self.negative_cache.get(key)
+            if negative_result is not None:
+                return (negative_result['result'],)
+        return None
+
+    def resolve(self, name, function, *args):
+        """Return the result of function(*args), from the caches if this lookup was already done."""
+        key = self._key(name, args)
+        cached_result = self._cached_result(key)
+        if cached_result is not None:
+            result, = cached_result
+            with self._lock:
+                self.hits[name] += 1
+                self._results[key] = result
+            return result
+
+        result = function(*args)
+        if is_negative(result):
+            if self.negative_cache:
+                self.negative_cache.set(key, {'result': result})
+        elif self.cache:
+            self.cache.set(key, result)
+        with self._lock:
+            self.misses[name] += 1
+            self._results[key] = result
+        return result
+
+    def resolve_concurrently(self, lookups):
+        """
+        Run the lookups, provided as (name, function, args) tuples, in a pool of at most max_workers threads.
+        Return the futures of their results in the same order.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [executor.submit(self.resolve, name, function, *args) for name, function, args in lookups]
+
+    def counters(self):
+        """Number of hits and misses of each lookup."""
+        return dict(
+            (name, {'hits': self.hits[name], 'misses': self.misses[name]})
+            for name in sorted(set(self.hits) | set(self.misses))
+        )
+
+    def log_counters(self):
+        for name, counters in self.counters().items():
+            self.info(f'Lookup {name}: {counters["hits"]} cached, {counters["misses"]} remote')
+
+
+def open_lookup_cache(db_path, ttl_days=default_lookup_ttl_days, table='remote_lookup'):
+    """PersistentCache storing the results of the remote lookups in the SQLite database."""
+    return PersistentCache(db_path, table=table, ttl=ttl_days * 24 * 3600)
+
+
+def get_resolver():
+    """
+    Resolver using the persistent caches and the parallelism set in the remote_lookups config. Without cache path in
+    the config, the results are only kept in the memory of the Resolver.
+    """
+    cache_path = cfg.query('remote_lookups', 'cache')
+    cache = negative_cache = None
+    if cache_path:
+        cache = open_lookup_cache(
+            cache_path, cfg.query('remote_lookups', 'ttl_days', ret_default=default_lookup_ttl_days)
+        )
+        negative_cache = open_lookup_cache(
+            cache_path, cfg.query('remote_lookups', 'negative_ttl_days', ret_default=default_negative_lookup_ttl_days),
+            table='remote_lookup_negative'
+        )
+    return Resolver(cache, negative_cache, max_workers=cfg.query('remote_lookups', 'max_workers', ret_default=4))
@@ -1,21 +1,29 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-import pysam
 from ebi_eva_common_pyutils.logger import logging_config as log_cfg
 
 from eva_submission.eload_utils import cast_list
+from eva_submission.vcf_profile import get_vcf_samples
 from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader
 
 logger = log_cfg.get_logger(__name__)
 
 
-def get_samples_from_vcf(vcf_file):
+def get_samples_from_vcf(vcf_file, vcf_profile_cache=None):
     """
-    Get the list of samples present in a single VCF file
+    Get the list of samples present in a single VCF file from the cache if they have already been read or otherwise
+    from the header
     """
-    with pysam.VariantFile(vcf_file, 'r') as vcf_in:
-        samples = list(vcf_in.header.samples)
-    return samples
+    return get_vcf_samples(vcf_file, vcf_profile_cache)
+
+
+def get_samples_from_vcfs(vcf_files, vcf_profile_cache=None, max_workers=8):
+    """Get the list of samples present in each VCF file, reading the headers of the files in parallel."""
+    vcf_files = list(dict.fromkeys(vcf_files))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        samples_per_file = executor.map(lambda vcf_file: get_samples_from_vcf(vcf_file, vcf_profile_cache), vcf_files)
+        return dict(zip(vcf_files, samples_per_file))
 
 
 def get_sample_names(sample_rows):
@@ -34,17 +42,17 @@ def get_sample_names(sample_rows):
     return sample_names
 
 
-def compare_names_in_files_and_samples(files, sample_rows, analysis_alias):
+def compare_names_in_files_and_samples(files, sample_rows, analysis_alias, vcf_profile_cache=None):
     """
     Compare the sample names provided in vcf files and the one provided in a set of sample rows.
     This is meant to compare the samples and files provided for a single analysis.
     """
     has_difference = False
     sample_names_in_vcf = set()
-    for file_path in files:
-        # remove trailing spaces coming from the spreadsheet
-        file_path = file_path.strip()
-        sample_names_in_vcf.update(get_samples_from_vcf(file_path))
+    # remove trailing spaces coming from the spreadsheet
+    samples_per_file = get_samples_from_vcfs([file_path.strip() for file_path in files], vcf_profile_cache)
+    for samples in samples_per_file.values():
+        sample_names_in_vcf.update(samples)
 
     sample_name_in_spreadsheet = get_sample_names(sample_rows)
     diff_submission_submitted_file = list(set(sample_name_in_spreadsheet) -
@@ -78,7 +86,7 @@ def get_vcf_file_paths(file_rows, vcf_dir):
     ]
 
 
-def compare_spreadsheet_and_vcf(eva_files_sheet, vcf_dir):
+def compare_spreadsheet_and_vcf(eva_files_sheet, vcf_dir, vcf_profile_cache=None):
     """
     Take a spreadsheet following EVA standard and compare the samples in it to the ones found in the VCF files
     """
@@ -93,11 +101,18 @@ def compare_spreadsheet_and_vcf(eva_files_sheet, vcf_dir):
         samples_per_analysis[None] = eva_xls_reader.samples
         files_per_analysis[None] = eva_xls_reader.files
 
+    # Read the headers of the files of all the analyses in parallel before comparing them
+    get_samples_from_vcfs(
+        [file_path.strip() for analysis_alias in samples_per_analysis
+         for file_path in get_vcf_file_paths(files_per_analysis.get(analysis_alias, []), vcf_dir)],
+        vcf_profile_cache
+    )
     for analysis_alias in samples_per_analysis:
         has_differences, diff_submitted_file_submission, diff_submission_submitted_file = compare_names_in_files_and_samples(
             get_vcf_file_paths(files_per_analysis[analysis_alias], vcf_dir),
             samples_per_analysis[analysis_alias],
-            analysis_alias
+            analysis_alias,
+            vcf_profile_cache
         )
         results_per_analysis_alias[analysis_alias] = (
             has_differences,
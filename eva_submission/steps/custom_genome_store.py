@@ -0,0 +1,131 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+from ebi_eva_common_pyutils.logger import AppLogger
+
+
+class CustomGenomeStore(AppLogger):
+    """
+    Shared directory of genomes renamed to the naming convention used in submitted VCFs.
+    Each genome is stored under the assembly accession and a hash of the mapping between the original and the new
+    contig names, so that submissions using the same assembly and naming convention can reuse the same file.
+    The least recently used genomes are removed when the genomes only held by the store grow above its maximum size.
+    Submissions use the genomes through hard links so that removing a genome from the store never breaks a submission
+    still using it. The genomes still linked from submissions are not counted in the maximum size, which therefore
+    does not bound the disk space used by them.
+    """
+
+    def __init__(self, store_dir, max_size):
+        """
+        :param store_dir: directory where the renamed genomes are stored
+        :param max_size: maximum size of the store in bytes
+        """
+        self.store_dir = store_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def mapping_hash(contig_name_mapping):
+        serialised_mapping = json.dumps(sorted(contig_name_mapping.items()), separators=(',', ':'))
+        return hashlib.sha256(serialised_mapping.encode()).hexdigest()
+
+    def entry_path(self, assembly_accession, contig_name_mapping):
+        return os.path.join(self.store_dir, assembly_accession, self.mapping_hash(contig_name_mapping) + '.fa')
+
+    def get(self, assembly_accession, contig_name_mapping):
+        """Return the path to the stored genome or None if it is not in the store. Record the use for eviction."""
+        custom_fasta = self.entry_path(assembly_accession, contig_name_mapping)
+        if not os.path.isfile(custom_fasta):
+            return None
+        # The modification time records the last use of the entry
+        os.utime(custom_fasta)
+        return custom_fasta
+
+    def get_or_create(self, assembly_accession, contig_name_mapping, create_genome):
+        """
+        Return the path to the stored genome, creating it with create_genome(output_path) if it is not in the store.
+        """
+        custom_fasta = self.get(assembly_accession, contig_name_mapping)
+        if custom_fasta:
+            self.info(f'Found renamed genome for {assembly_accession} in {custom_fasta}')
+            return custom_fasta
+        custom_fasta = self.entry_path(assembly_accession, contig_name_mapping)
+        os.makedirs(os.path.dirname(custom_fasta), exist_ok=True)
+        # Write to a temporary file so that concurrent processes never see a partial genome
+        tmp_custom_fasta = f'{custom_fasta}.{os.getpid()}.tmp'
+        try:
+            create_genome(tmp_custom_fasta)
+            os.replace(tmp_custom_fasta, custom_fasta)
+        finally:
+            if os.path.exists(tmp_custom_fasta):
+                os.remove(tmp_custom_fasta)
+        self.info(f'Added renamed genome for {assembly_accession} to {custom_fasta}')
+        self.evict(keep=[custom_fasta])
+        return custom_fasta
+
+    def link_or_create(self, assembly_accession, contig_name_mapping, create_genome, output_fasta):
+        """
+        Hard link output_fasta to the stored genome, creating it with create_genome(output_path) if it is not in the
+        store. The genome is copied when the store is on another file system.
+        """
+        if os.path.lexists(output_fasta):
+            os.remove(output_fasta)
+        while True:
+            custom_fasta = self.get_or_create(assembly_accession, contig_name_mapping, create_genome)
+            try:
+                os.link(custom_fasta, output_fasta)
+            except FileNotFoundError:
+                # Removed by the eviction of another process before it could be linked
+                continue
+            except OSError:
+                shutil.copyfile(custom_fasta, output_fasta)
+            return custom_fasta
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used genomes until the genomes only held by the store are below its maximum size.
+        Genomes with other hard links are still used by submissions: removing them would not free any space, so they
+        are neither removed nor counted in the maximum size.
+        """
+        entries = []
+        for custom_fasta in glob.glob(os.path.join(self.store_dir, '*', '*.fa')):
+            try:
+                stat = os.stat(custom_fasta)
+            except FileNotFoundError:
+                # Removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, stat.st_nlink, custom_fasta))
+        linked_size = sum(size for _, size, nb_links, _ in entries if nb_links > 1)
+        total_size = sum(size for _, size, nb_links, _ in entries if nb_links == 1)
+        for _, size, nb_links, custom_fasta in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if custom_fasta in keep or nb_links > 1:
+                continue
+            self.info(f'Remove {custom_fasta} from the renamed genome store')
+            try:
+                os.remove(custom_fasta)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        if total_size > self.max_size:
+            self.warning(f'The renamed genomes only held by the store use {total_size} bytes, above the maximum size of '
+                         f'{self.max_size} bytes, because they are in use')
+        if linked_size:
+            self.info(f'The renamed genomes still used by submissions use {linked_size} bytes in addition to the '
+                      f'maximum size of the store')
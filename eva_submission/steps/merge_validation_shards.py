@@ -0,0 +1,265 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import glob
+import json
+import os
+import re
+import shutil
+import sqlite3
+from argparse import ArgumentParser
+from contextlib import closing
+
+from eva_submission.vcf_validator_report import errors_table, get_table_columns, get_tables, has_errors_table
+
+line_number_regex = re.compile(r'^Line (\d+)(.*)$', re.DOTALL)
+vcf_check_conclusion = 'According to the VCF specification, the input file is'
+assembly_check_matches_regex = re.compile(r'^\[info\] Number of matches: (\d+)/(\d+)')
+
+
+class Shard:
+    """Output directory of the validation of one shard with the information needed to convert its line numbers."""
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, 'shard_info.json')) as open_file:
+            shard_info = json.load(open_file)
+        self.shard = int(shard_info['shard'])
+        self.line_offset = int(shard_info['line_offset'])
+        self.header_lines = int(shard_info['header_lines'])
+
+    def find_file(self, pattern):
+        files = glob.glob(os.path.join(self.shard_dir, pattern))
+        return files[0] if len(files) == 1 else None
+
+    def convert_line(self, line):
+        """
+        Convert the line number at the start of a report line to the line number in the complete VCF.
+        Return None for the lines reported in the header of every shard but the first one, as these are duplicates.
+        """
+        match = line_number_regex.match(line)
+        if not match:
+            return line
+        line_number = int(match.group(1))
+        if line_number > self.header_lines:
+            return f'Line {line_number + self.line_offset}{match.group(2)}'
+        return line if self.shard == 0 else None
+
+
+def load_shards(shard_dirs):
+    return sorted((Shard(shard_dir) for shard_dir in shard_dirs), key=lambda shard: shard.shard)
+
+
+def concatenate_files(input_files, output_file):
+    with open(output_file, 'wb') as open_output:
+        for input_file in input_files:
+            with open(input_file, 'rb') as open_input:
+                shutil.copyfileobj(open_input, open_output)
+
+
+def merge_truncated_markers(shards, check_dir, vcf_name, output_dir):
+    """Write the marker of a VCF if the check was stopped early on any of its shards, with the reasons of each one."""
+    reasons = []
+    for shard in shards:
+        marker = shard.find_file(os.path.join(check_dir, '*.truncated'))
+        if marker:
+            with open(marker) as open_file:
+                reasons.append(f'Shard {shard.shard}: {open_file.read().strip()}')
+    if reasons:
+        with open(os.path.join(output_dir, vcf_name + '.truncated'), 'w') as open_file:
+            open_file.write('\n'.join(reasons) + '\n')
+
+
+def merge_line_reports(shard_reports, output_report, skip_line=None):
+    """
+    Merge the text reports of the shards converting their line numbers. The lines that are not about a specific line
+    of the VCF are only written once.
+    """
+    written_lines = set()
+    with open(output_report, 'w') as open_output:
+        for shard, report in shard_reports:
+            with open(report) as open_input:
+                for line in open_input:
+                    line = line.rstrip('\n')
+                    if skip_line and skip_line(line):
+                        continue
+                    converted_line = shard.convert_line(line)
+                    if converted_line is None:
+                        continue
+                    if not line_number_regex.match(converted_line):
+                        if converted_line in written_lines:
+                            continue
+                        written_lines.add(converted_line)
+                    open_output.write(converted_line + '\n')
+
+
+def _copy_shard_errors(connection, shard):
+    """
+    Copy the errors of the database attached as shard into the main database, converting their line numbers.
+    Each error is a row of the Error table and a row with the same id in the table of each of its subclasses, so the
+    rows of all these tables are copied with their ids shifted after the ids already in the main database. The errors
+    of the header are only copied from the first shard.
+    """
+    tables = get_tables(connection, 'shard')
+    existing_tables = get_tables(connection)
+    for table in tables:
+        if table not in existing_tables:
+            create_table, = connection.execute(
+                "SELECT sql FROM shard.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            connection.execute(create_table)
+    id_offset = connection.execute(f'SELECT coalesce(max(id), 0) FROM "{errors_table}"').fetchone()[0]
+    first_line = 0 if shard.shard == 0 else shard.header_lines
+    copied_ids = f'SELECT id FROM shard."{errors_table}" WHERE line > :first_line'
+    for table in [errors_table] + [table for table in tables if table != errors_table]:
+        columns = get_table_columns(connection, table, 'shard')
+        if 'id' not in columns:
+            # Tables that are not about a specific error are only copied from the first shard
+            if shard.shard == 0:
+                connection.execute(f'INSERT INTO "{table}" SELECT * FROM shard."{table}"')
+            continue
+        selected_columns = []
+        for column in columns:
+            if column == 'id':
+                selected_columns.append('id + :id_offset')
+            elif table == errors_table and column == 'line':
+                selected_columns.append('CASE WHEN line > :header_lines THEN line + :line_offset ELSE line END')
+            else:
+                selected_columns.append(f'"{column}"')
+        quoted_columns = ', '.join(f'"{column}"' for column in columns)
+        connection.execute(
+            f'INSERT INTO "{table}" ({quoted_columns}) '
+            f'SELECT {", ".join(selected_columns)} FROM shard."{table}" WHERE id IN ({copied_ids}) ORDER BY id',
+            {'id_offset': id_offset, 'first_line': first_line, 'header_lines': shard.header_lines,
+             'line_offset': shard.line_offset}
+        )
+
+
+def merge_vcf_check_databases(shard_databases, output_database):
+    """
+    Merge the SQLite reports of vcf_validator by copying the errors of all the shards in a new report, converting
+    their line numbers. Raise a ValueError if a report is not empty but does not have the Error table of vcf_validator
+    reports, rather than dropping its errors.
+    """
+    if os.path.exists(output_database):
+        os.remove(output_database)
+    with closing(sqlite3.connect(output_database)) as connection:
+        for shard, database in shard_databases:
+            # Databases can only be attached outside of a transaction
+            connection.execute('ATTACH DATABASE ? AS shard', (database,))
+            if get_tables(connection, 'shard'):
+                if not has_errors_table(connection, 'shard'):
+                    raise ValueError(f'{database} does not have the {errors_table} table of a vcf_validator report')
+                _copy_shard_errors(connection, shard)
+                connection.commit()
+            connection.execute('DETACH DATABASE shard')
+
+
+def merge_vcf_check_shards(vcf_name, shard_dirs, output_dir):
+    """
+    Merge the outputs of vcf_validator on the shards of a VCF into the log and reports expected for the whole VCF.
+    The reports are only written if they are available for all the shards.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shards = load_shards(shard_dirs)
+    logs = [shard.find_file(os.path.join('vcf_format', '*.vcf_format.log')) for shard in shards]
+    concatenate_files([log for log in logs if log], os.path.join(output_dir, vcf_name + '.vcf_format.log'))
+    merge_truncated_markers(shards, 'vcf_format', vcf_name, output_dir)
+
+    text_reports = [(shard, shard.find_file(os.path.join('vcf_format', '*.errors.*.txt'))) for shard in shards]
+    db_reports = [(shard, shard.find_file(os.path.join('vcf_format', '*.errors.*.db'))) for shard in shards]
+    if all(report for _, report in text_reports + db_reports):
+        valid = True
+        for _, report in text_reports:
+            with open(report) as open_file:
+                for line in open_file:
+                    if line.startswith(vcf_check_conclusion) and 'not' in line:
+                        valid = False
+        text_report = os.path.join(output_dir, vcf_name + '.errors.sharded.txt')
+        merge_line_reports(text_reports, text_report, skip_line=lambda line: line.startswith(vcf_check_conclusion))
+        with open(text_report, 'a') as open_file:
+            open_file.write(f'{vcf_check_conclusion} {"valid" if valid else "not valid"}\n')
+        merge_vcf_check_databases(db_reports, os.path.join(output_dir, vcf_name + '.errors.sharded.db'))
+
+
+def merge_assembly_check_logs(shard_logs, output_log):
+    """
+    Merge the logs of vcf_assembly_checker keeping every error and warning in the order of the shards and writing the
+    number of matches summed over the shards at the end, like in the log of the whole VCF.
+    """
+    nb_match = nb_total = 0
+    with open(output_log, 'w') as open_output:
+        for log in shard_logs:
+            with open(log) as open_file:
+                for line in open_file:
+                    match = assembly_check_matches_regex.match(line)
+                    if match:
+                        nb_match += int(match.group(1))
+                        nb_total += int(match.group(2))
+                    elif line.startswith('[error]') or line.startswith('[warning]'):
+                        open_output.write(line if line.endswith('\n') else line + '\n')
+        percentage = f'{nb_match / nb_total * 100:g}%' if nb_total else '-nan%'
+        open_output.write(f'[info] Number of matches: {nb_match}/{nb_total}\n')
+        open_output.write(f'[info] Percentage of matches: {percentage}\n')
+
+
+def merge_valid_reports(shard_reports, output_report):
+    """Merge the valid reports keeping the header lines of the first shard only."""
+    with open(output_report, 'w') as open_output:
+        for shard, report in shard_reports:
+            with open(report) as open_input:
+                for line in open_input:
+                    if shard.shard == 0 or not line.startswith('#'):
+                        open_output.write(line)
+
+
+def merge_assembly_check_shards(vcf_name, shard_dirs, output_dir):
+    """
+    Merge the outputs of vcf_assembly_checker on the shards of a VCF into the log and reports expected for the whole
+    VCF. Each output is only written if it is available for all the shards.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shards = load_shards(shard_dirs)
+    logs = [shard.find_file(os.path.join('assembly_check', '*.assembly_check.log')) for shard in shards]
+    if all(logs):
+        merge_assembly_check_logs(logs, os.path.join(output_dir, vcf_name + '.assembly_check.log'))
+    merge_truncated_markers(shards, 'assembly_check', vcf_name, output_dir)
+    text_reports = [(shard, shard.find_file(os.path.join('assembly_check', '*text_assembly_report*')))
+                    for shard in shards]
+    if all(report for _, report in text_reports):
+        merge_line_reports(text_reports, os.path.join(output_dir, vcf_name + '.text_assembly_report.sharded.txt'))
+    valid_reports = [(shard, shard.find_file(os.path.join('assembly_check', '*valid_assembly_report*')))
+                     for shard in shards]
+    if all(report for _, report in valid_reports):
+        merge_valid_reports(valid_reports, os.path.join(output_dir, vcf_name + '.valid_assembly_report.sharded.txt'))
+
+
+def main():
+    argparse = ArgumentParser(description='Merge the validation outputs of the shards of a VCF')
+    argparse.add_argument('--check', required=True, choices=['vcf_check', 'assembly_check'],
+                          help='The validation check that produced the outputs')
+    argparse.add_argument('--vcf_name', required=True, type=str, help='Name of the VCF that was split in shards')
+    argparse.add_argument('--shard_dirs', required=True, type=str, nargs='+',
+                          help='Output directories of the shards, each containing a shard_info.json file')
+    argparse.add_argument('--output_dir', required=True, type=str,
+                          help='Directory where the merged log and reports will be written')
+
+    args = argparse.parse_args()
+    if args.check == 'vcf_check':
+        merge_vcf_check_shards(args.vcf_name, args.shard_dirs, args.output_dir)
+    else:
+        merge_assembly_check_shards(args.vcf_name, args.shard_dirs, args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import csv
+import os
+import subprocess
+from argparse import ArgumentParser
+
+from eva_submission.vcf_utils import open_vcf_binary, read_header
+
+
+def get_records_per_contig(vcf_file, bcftools='bcftools'):
+    """
+    Provides the contigs of an indexed VCF with their number of records, in the order they appear in the file, using
+    the statistics stored in its index. Return None if there are no index up to date or it does not store these.
+    """
+    index_files = [index for index in (vcf_file + '.csi', vcf_file + '.tbi') if os.path.isfile(index)]
+    if not index_files or os.path.getmtime(index_files[0]) < os.path.getmtime(vcf_file):
+        return None
+    try:
+        stats = subprocess.run([bcftools, 'index', '--stats', vcf_file], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    records_per_contig = []
+    for line in stats.stdout.splitlines():
+        # Each line contains the contig name, its length and its number of records
+        contig, _, nb_records = line.split('\t')
+        records_per_contig.append((contig, int(nb_records)))
+    return records_per_contig or None
+
+
+# End of the regions covering whole contigs, beyond the end of any contig that can be indexed
+max_position = 2 ** 31 - 1
+
+
+def write_regions_file(contigs, regions_file):
+    """
+    Write the regions covering the contigs in the tab separated format read by tabix -R, in the order of the contigs
+    which tabix keeps in its output. A file is used as there can be too many contigs for the command line.
+    """
+    with open(regions_file, 'w') as open_file:
+        for contig in contigs:
+            open_file.write(f'{contig}\t1\t{max_position}\n')
+
+
+def plan_shards(records_per_contig, records_per_shard):
+    """
+    Group consecutive contigs in shards of at least records_per_shard records, except for the last one.
+    Return a list of (contigs, line_offset) where line_offset is the number of records found before the shard.
+    """
+    shards = []
+    contigs = []
+    nb_records = line_offset = 0
+    for contig, contig_records in records_per_contig:
+        if contig_records == 0:
+            continue
+        contigs.append(contig)
+        nb_records += contig_records
+        if nb_records >= records_per_shard:
+            shards.append((contigs, line_offset))
+            line_offset += nb_records
+            contigs = []
+            nb_records = 0
+    if contigs:
+        shards.append((contigs, line_offset))
+    return shards
+
+
+def write_vcf_shards(vcf_file, records_per_shard, output_csv, bcftools='bcftools'):
+    """
+    Write the csv describing the shards of the VCF with, for each shard, the path to the file of the regions to
+    extract, the number of records before the shard and the number of header lines, which are needed to convert the
+    line numbers reported for the shard to line numbers in the VCF. The regions files are written next to the csv.
+    If the VCF can not be sharded, a single shard without regions file covers the whole file.
+    """
+    with open_vcf_binary(vcf_file) as open_input:
+        header_lines, _ = read_header(open_input)
+    records_per_contig = get_records_per_contig(vcf_file, bcftools)
+    shards = plan_shards(records_per_contig, records_per_shard) if records_per_contig else []
+    if not shards:
+        shards = [([], 0)]
+    output_dir = os.path.dirname(os.path.abspath(output_csv))
+    with open(output_csv, 'w') as open_file:
+        writer = csv.writer(open_file)
+        writer.writerow(['shard', 'regions_file', 'line_offset', 'header_lines'])
+        for shard, (contigs, line_offset) in enumerate(shards):
+            regions_file = ''
+            if contigs:
+                regions_file = os.path.join(output_dir, f'{os.path.basename(vcf_file)}.shard_{shard}.regions')
+                write_regions_file(contigs, regions_file)
+            writer.writerow([shard, regions_file, line_offset, len(header_lines)])
+
+
+def main():
+    argparse = ArgumentParser(description='Split an indexed VCF in shards of whole contigs that can be validated '
+                                          'independently')
+    argparse.add_argument('--vcf_file', required=True, type=str, help='Path to the VCF to split')
+    argparse.add_argument('--records_per_shard', required=True, type=int,
+                          help='Minimum number of records in each shard')
+    argparse.add_argument('--output_csv', required=True, type=str,
+                          help='Path to the csv file where the shards will be described')
+    argparse.add_argument('--bcftools', type=str, default='bcftools',
+                          help='Path to bcftools used to read the number of records from the index')
+
+    args = argparse.parse_args()
+    write_vcf_shards(args.vcf_file, args.records_per_shard, args.output_csv, args.bcftools)
+
+
+if __name__ == "__main__":
+    main()
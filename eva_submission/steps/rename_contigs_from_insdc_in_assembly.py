@@ -11,41 +11,110 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import gzip
+import os
+import re
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 from csv import DictReader, excel_tab
 
+import pysam
 import requests
 from cached_property import cached_property
 from ebi_eva_common_pyutils.logger import AppLogger
 from retry import retry
 
+from eva_submission.persistent_cache import PersistentCache
+from eva_submission.steps.custom_genome_store import CustomGenomeStore
+from eva_submission.vcf_profile import get_vcf_profile, open_vcf_profile_cache
+from eva_submission.vcf_utils import open_vcf_binary, read_header
+
+contig_header_regex = re.compile(rb'##contig=<.*?\bID=([^,>]+)')
+
+# Size of the reads when scanning a fasta file and maximum size of each kernel copy
+read_size = 16 * 1024 * 1024
+copy_size = 1024 * 1024 * 1024
+
 
 class RenameContigsInAssembly(AppLogger):
     """
     This class renames sequences based on the one provided in a set of VCFs
     """
-    def __init__(self, assembly_accession, assembly_fasta_path, assembly_report_path, input_vcfs):
+    contig_alias_max_workers = 8
+
+    def __init__(self, assembly_accession, assembly_fasta_path, assembly_report_path, input_vcfs,
+                 contig_alias_cache=None, vcf_profile_cache=None):
+        """
+        :param contig_alias_cache: optional PersistentCache storing the contig alias synonyms of each assembly
+        :param vcf_profile_cache: optional PersistentCache storing the VcfProfile of the VCF files
+        """
         self.input_vcfs = input_vcfs
         self.assembly_accession = assembly_accession
         self.assembly_fasta_path = assembly_fasta_path
         self.assembly_report_path = assembly_report_path
+        self.contig_alias_cache = contig_alias_cache
+        self.vcf_profile_cache = vcf_profile_cache
 
     @cached_property
     def contigs_found_in_vcf(self):
-        """Provides the contigs present in the VCF file"""
+        """
+        Provides the contigs present in the VCF files. For each file the contigs are taken from its VcfProfile if it has
+        already been computed, then from the index if it exists, and otherwise from the VcfProfile computed with a scan
+        of all the data lines. The contigs declared in the ##contig header lines are only added when they include all
+        the contigs of the index, as VCFs often only declare some of the contigs they use.
+        """
         contigs = set()
         for input_vcf in self.input_vcfs:
-            if input_vcf.endswith('.gz'):
-                vcf_in = gzip.open(input_vcf, mode="rt")
-            else:
-                vcf_in = open(input_vcf, mode="r")
-            for line in vcf_in:
-                if line.startswith("#"):
-                    continue
-                contigs.add(line.split('\t')[0])
+            vcf_contigs = None
+            vcf_profile = get_vcf_profile(input_vcf, self.vcf_profile_cache, compute=False)
+            if vcf_profile:
+                vcf_contigs = set(vcf_profile.contigs)
+            if vcf_contigs is None:
+                vcf_contigs = self._get_contigs_from_index(input_vcf)
+                if vcf_contigs is not None:
+                    vcf_contigs = self._get_contigs_from_header(input_vcf, vcf_contigs) or vcf_contigs
+            if vcf_contigs is None:
+                self.info(f'No index found for {input_vcf}: contigs are retrieved from the records')
+                vcf_contigs = self._get_contigs_from_records(input_vcf, self.vcf_profile_cache)
+            contigs.update(vcf_contigs)
         return contigs
 
+    @staticmethod
+    def _get_contigs_from_index(input_vcf):
+        """
+        Provides the contigs listed in the CSI or TBI index of the VCF or None if there are no index up to date.
+        The index only lists contigs that have at least one record.
+        """
+        for index_file in (input_vcf + '.csi', input_vcf + '.tbi'):
+            if os.path.isfile(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(input_vcf):
+                try:
+                    with pysam.TabixFile(input_vcf, index=index_file) as tabix_file:
+                        return set(tabix_file.contigs)
+                except (OSError, ValueError):
+                    continue
+        return None
+
+    @staticmethod
+    def _get_contigs_from_header(input_vcf, contigs_with_records):
+        """
+        Provides the contigs declared in the ##contig header lines of the VCF or None if they do not include all the
+        contigs with records, in which case the header is incomplete and cannot be trusted.
+        """
+        contigs = set()
+        with open_vcf_binary(input_vcf) as open_input:
+            header_lines, _ = read_header(open_input)
+        for line in header_lines:
+            match = contig_header_regex.match(line)
+            if match:
+                contigs.add(match.group(1).decode())
+        if contigs and contigs.issuperset(contigs_with_records):
+            return contigs
+        return None
+
+    @staticmethod
+    def _get_contigs_from_records(input_vcf, vcf_profile_cache=None):
+        """Provides the contigs found in the first column of all the data lines of the VCF from its VcfProfile."""
+        return set(get_vcf_profile(input_vcf, vcf_profile_cache).contigs)
+
     @staticmethod
     def _get_assembly_report(assembly_report):
         """Parse the assembly report and return each row as a dict."""
@@ -97,20 +166,47 @@ class RenameContigsInAssembly(AppLogger):
                 if naming_convention in entity and entity[naming_convention]:
                     contig_alias_map_tmp[entity[naming_convention]] = entity['insdcAccession']
 
-    @cached_property
-    def contig_alias_map(self):
+    def _download_contig_alias_synonyms(self):
         """
-        Dictionary of INSDC accession to naming convention used in the VCF constructed based on the contig alias.
+        Retrieve all the pages of chromosomes for the assembly from the contig alias and return the mapping of each
+        non-INSDC name to the INSDC accession. The pages after the first one are downloaded concurrently.
         """
         contig_alias_map_tmp = {}
-        page = 0
         size = 1000
-        response_json = self._contig_alias_assembly_get(page=page, size=size)
+        response_json = self._contig_alias_assembly_get(page=0, size=size)
         self._add_chromosomes_to_map(response_json.get('_embedded', {}), contig_alias_map_tmp)
-        while 'next' in response_json['_links']:
-            page += 1
-            response_json = self._contig_alias_assembly_get(page=page, size=size)
-            self._add_chromosomes_to_map(response_json.get('_embedded', {}), contig_alias_map_tmp)
+        total_pages = response_json.get('page', {}).get('totalPages')
+        if total_pages is not None:
+            with ThreadPoolExecutor(max_workers=self.contig_alias_max_workers) as executor:
+                for page_json in executor.map(lambda page: self._contig_alias_assembly_get(page=page, size=size),
+                                              range(1, total_pages)):
+                    self._add_chromosomes_to_map(page_json.get('_embedded', {}), contig_alias_map_tmp)
+        else:
+            page = 0
+            while 'next' in response_json['_links']:
+                page += 1
+                response_json = self._contig_alias_assembly_get(page=page, size=size)
+                self._add_chromosomes_to_map(response_json.get('_embedded', {}), contig_alias_map_tmp)
+        return contig_alias_map_tmp
+
+    def _get_contig_alias_synonyms(self):
+        """Provides the non-INSDC to INSDC mapping of the assembly from the cache or from the contig alias."""
+        if self.contig_alias_cache:
+            contig_alias_map_tmp = self.contig_alias_cache.get(self.assembly_accession)
+            if contig_alias_map_tmp is not None:
+                self.debug(f'Contig alias synonyms for {self.assembly_accession} found in the cache')
+                return contig_alias_map_tmp
+        contig_alias_map_tmp = self._download_contig_alias_synonyms()
+        if self.contig_alias_cache:
+            self.contig_alias_cache.set(self.assembly_accession, contig_alias_map_tmp)
+        return contig_alias_map_tmp
+
+    @cached_property
+    def contig_alias_map(self):
+        """
+        Dictionary of INSDC accession to naming convention used in the VCF constructed based on the contig alias.
+        """
+        contig_alias_map_tmp = self._get_contig_alias_synonyms()
         contig_alias_map = {}
         # Reverse the map to get the INSDC to Non-INSDC name found in the VCF files
         for contig in self.contigs_found_in_vcf:
@@ -118,20 +214,146 @@ class RenameContigsInAssembly(AppLogger):
                 contig_alias_map[contig_alias_map_tmp[contig]] = contig
         return contig_alias_map
 
+    def _get_new_contig_name(self, contig_name):
+        """Provides the name used in the VCF for an INSDC accession or the accession itself if there are none."""
+        assembly_report_name = self.assembly_report_map.get(contig_name)
+        contig_alias_name = self.contig_alias_map.get(contig_name)
+        if assembly_report_name:
+            return assembly_report_name
+        elif contig_alias_name:
+            return contig_alias_name
+        return contig_name
+
+    @cached_property
+    def fasta_header_positions(self):
+        return get_fasta_header_positions(self.assembly_fasta_path)
+
+    @cached_property
+    def contig_name_mapping(self):
+        """Dictionary of each sequence name in the genome to the name it will have in the custom genome."""
+        return dict(
+            (contig_name, self._get_new_contig_name(contig_name))
+            for _, _, contig_name in self.fasta_header_positions
+        )
+
     def rewrite_changing_names(self, output_fasta):
-        """Create a new fasta file with contig names use in the VCF."""
-        with open(self.assembly_fasta_path) as open_input, open(output_fasta, 'w') as open_output:
-            for line in open_input:
-                if line.startswith('>'):
-                    contig_name = line.split()[0][1:]
-                    assembly_report_name = self.assembly_report_map.get(contig_name)
-                    contig_alias_name = self.contig_alias_map.get(contig_name)
-                    if assembly_report_name:
-                        contig_name = assembly_report_name
-                    elif contig_alias_name:
-                        contig_name = contig_alias_name
-                    line = '>' + contig_name + '\n'
-                open_output.write(line)
+        """
+        Create a new fasta file with contig names use in the VCF.
+        Only the header lines are rewritten: the sequences are copied byte for byte from the input file by the kernel.
+        """
+        header_positions = self.fasta_header_positions
+        input_fd = os.open(self.assembly_fasta_path, os.O_RDONLY)
+        output_fd = os.open(output_fasta, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            fasta_size = os.fstat(input_fd).st_size
+            # Anything before the first header is copied as is
+            copy_byte_range(input_fd, output_fd, 0, header_positions[0][0] if header_positions else fasta_size)
+            for i, (header_start, sequence_start, contig_name) in enumerate(header_positions):
+                sequence_end = header_positions[i + 1][0] if i + 1 < len(header_positions) else fasta_size
+                header = '>' + self.contig_name_mapping[contig_name] + '\n'
+                write_all(output_fd, header.encode())
+                copy_byte_range(input_fd, output_fd, sequence_start, sequence_end)
+        finally:
+            os.close(input_fd)
+            os.close(output_fd)
+
+    def link_from_custom_genome_store(self, output_fasta, custom_genome_store):
+        """
+        Link output_fasta to the genome with the same contig names in the store, creating it if it does not exist.
+        """
+        custom_genome_store.link_or_create(
+            self.assembly_accession, self.contig_name_mapping, self.rewrite_changing_names, output_fasta
+        )
+
+
+def write_all(output_fd, data):
+    while data:
+        data = data[os.write(output_fd, data):]
+
+
+def copy_byte_range(input_fd, output_fd, start, end):
+    """
+    Copy the bytes between start and end of the input file to the current position of the output file.
+    Use copy_file_range or sendfile when available so that the data does not go through the interpreter.
+    """
+    offset = start
+    while offset < end:
+        count = min(end - offset, copy_size)
+        copied = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copied = os.copy_file_range(input_fd, output_fd, count, offset)
+            except OSError:
+                pass
+        if not copied and hasattr(os, 'sendfile'):
+            try:
+                copied = os.sendfile(output_fd, input_fd, offset, count)
+            except OSError:
+                pass
+        if not copied:
+            data = os.pread(input_fd, min(count, read_size), offset)
+            if not data:
+                raise EOFError(f'Could not read bytes {offset}-{end} from the input file')
+            write_all(output_fd, data)
+            copied = len(data)
+        offset += copied
+
+
+def get_fasta_header_positions(fasta_path):
+    """
+    Provides for each sequence of a fasta file a tuple with the position of the header line, the position of the first
+    base and the sequence name. Use the fasta index (.fai) when it is up to date, otherwise find the header lines in a
+    single pass over the file.
+    """
+    fai_path = fasta_path + '.fai'
+    if os.path.isfile(fai_path) and os.path.getmtime(fai_path) >= os.path.getmtime(fasta_path):
+        header_positions = _get_fasta_header_positions_from_fai(fasta_path, fai_path)
+        if header_positions is not None:
+            return header_positions
+    return _get_fasta_header_positions_from_scan(fasta_path)
+
+
+def _get_fasta_header_positions_from_fai(fasta_path, fai_path):
+    """Locate the header lines just before the sequence offsets stored in the index. Return None if they don't match"""
+    header_positions = []
+    with open(fai_path) as open_fai, open(fasta_path, 'rb') as open_fasta:
+        for line in open_fai:
+            contig_name, _, sequence_start = line.split('\t')[:3]
+            sequence_start = int(sequence_start)
+            window_start = max(sequence_start - 64 * 1024, 0)
+            open_fasta.seek(window_start)
+            window = open_fasta.read(sequence_start - window_start)
+            header_start = window.rfind(b'>')
+            if header_start == -1 or window[header_start + 1:].split()[0].decode() != contig_name:
+                return None
+            header_positions.append((window_start + header_start, sequence_start, contig_name))
+    return header_positions
+
+
+def _get_fasta_header_positions_from_scan(fasta_path):
+    """Find the header lines by searching the '>' at the start of a line in large blocks of the file."""
+    header_starts = []
+    with open(fasta_path, 'rb') as open_fasta:
+        block_start = 0
+        previous_byte = b'\n'
+        block = open_fasta.read(read_size)
+        while block:
+            position = block.find(b'>')
+            while position != -1:
+                preceding_byte = block[position - 1:position] if position else previous_byte
+                if preceding_byte == b'\n':
+                    header_starts.append(block_start + position)
+                position = block.find(b'>', position + 1)
+            block_start += len(block)
+            previous_byte = block[-1:]
+            block = open_fasta.read(read_size)
+
+        header_positions = []
+        for header_start in header_starts:
+            open_fasta.seek(header_start)
+            header = open_fasta.readline()
+            header_positions.append((header_start, header_start + len(header), header[1:].split()[0].decode()))
+    return header_positions
 
 
 def main():
@@ -147,12 +369,38 @@ def main():
                           help='The path to the file containing the assembly report')
     argparse.add_argument('--vcf_files', required=True, type=str, nargs='+',
                           help='Path to one or several VCF files')
+    argparse.add_argument('--contig_alias_cache', required=False, type=str,
+                          help='Path to the SQLite database where the contig alias responses are cached')
+    argparse.add_argument('--contig_alias_cache_ttl', required=False, type=float, default=7,
+                          help='Number of days after which the cached contig alias responses are refreshed')
+    argparse.add_argument('--custom_genome_store', required=False, type=str,
+                          help='Directory where the renamed genomes are shared between runs. When provided, '
+                               'custom_fasta is a hard link to the genome in the store')
+    argparse.add_argument('--custom_genome_store_size', required=False, type=float, default=100,
+                          help='Maximum size in GB of the renamed genomes only held by the store, the ones still '
+                               'used by submissions are not counted')
+    argparse.add_argument('--vcf_profile_cache', required=False, type=str,
+                          help='Path to the SQLite database where the profiles of the VCF files are cached')
 
     args = argparse.parse_args()
-    RenameContigsInAssembly(
+    contig_alias_cache = None
+    if args.contig_alias_cache:
+        contig_alias_cache = PersistentCache(args.contig_alias_cache, table='contig_alias',
+                                             ttl=args.contig_alias_cache_ttl * 24 * 3600)
+    vcf_profile_cache = None
+    if args.vcf_profile_cache:
+        vcf_profile_cache = open_vcf_profile_cache(args.vcf_profile_cache)
+    rename_contigs = RenameContigsInAssembly(
         assembly_accession=args.assembly_accession, assembly_fasta_path=args.assembly_fasta,
-        assembly_report_path=args.assembly_report, input_vcfs=args.vcf_files
-    ).rewrite_changing_names(args.custom_fasta)
+        assembly_report_path=args.assembly_report, input_vcfs=args.vcf_files, contig_alias_cache=contig_alias_cache,
+        vcf_profile_cache=vcf_profile_cache
+    )
+    if args.custom_genome_store:
+        custom_genome_store = CustomGenomeStore(args.custom_genome_store,
+                                                max_size=int(args.custom_genome_store_size * 1024 ** 3))
+        rename_contigs.link_from_custom_genome_store(args.custom_fasta, custom_genome_store)
+    else:
+        rename_contigs.rewrite_changing_names(args.custom_fasta)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import glob
+import os
+import signal
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, REMAINDER
+
+
+def is_vcf_check_error(line):
+    return 'warning' not in line and not line.startswith('According to the VCF specification')
+
+
+def is_assembly_check_mismatch(line):
+    return 'does not match the reference sequence' in line
+
+
+def is_assembly_check_log_error(line):
+    return line.startswith('[error]')
+
+
+# For each check, the outputs where the errors are reported and how to recognise an error line in each of them
+error_outputs = {
+    'vcf_check': [('*.errors.*.txt', is_vcf_check_error)],
+    'assembly_check': [('*text_assembly_report*', is_assembly_check_mismatch),
+                       ('*.assembly_check.log', is_assembly_check_log_error)]
+}
+
+
+class ErrorCounter:
+    """Count the errors reported in the outputs of a check, only reading what was added since the last count."""
+
+    def __init__(self, check, output_dir):
+        self.output_dir = output_dir
+        self.error_outputs = error_outputs[check]
+        self.positions = {}
+        self.nb_errors = 0
+
+    def count(self):
+        for pattern, is_error in self.error_outputs:
+            for output_file in glob.glob(os.path.join(self.output_dir, pattern)):
+                with open(output_file, 'rb') as open_file:
+                    open_file.seek(self.positions.get(output_file, 0))
+                    data = open_file.read()
+                # Only count complete lines, the rest will be read next time
+                complete_data = data[:data.rfind(b'\n') + 1]
+                self.positions[output_file] = self.positions.get(output_file, 0) + len(complete_data)
+                for line in complete_data.decode(errors='replace').splitlines():
+                    if is_error(line):
+                        self.nb_errors += 1
+        return self.nb_errors
+
+
+def write_marker(marker_file, reason):
+    os.makedirs(os.path.dirname(os.path.abspath(marker_file)), exist_ok=True)
+    with open(marker_file, 'w') as open_file:
+        open_file.write(reason + '\n')
+
+
+def run_with_error_budget(command, check, max_errors, output_dir, log_file, truncated_marker, cancel_marker=None,
+                          poll_interval=5):
+    """
+    Run the check command and stop it once max_errors errors have been reported in its outputs.
+    When the check is stopped, the reason is written to truncated_marker and cancel_marker is created so that the
+    checks of the other files of the same analysis, which watch this file, stop as well.
+    Return the exit code of the command or 1 if it was stopped.
+    """
+    if cancel_marker and os.path.exists(cancel_marker):
+        write_marker(truncated_marker, f'Cancelled because another file of the analysis exceeded {max_errors} errors')
+        return 1
+    error_counter = ErrorCounter(check, output_dir)
+    with open(log_file, 'w') as open_log:
+        # The command runs in its own process group so that it can be stopped with all its children
+        process = subprocess.Popen(command, stdout=open_log, stderr=subprocess.STDOUT, start_new_session=True)
+        reason = None
+        while process.poll() is None:
+            time.sleep(poll_interval)
+            if error_counter.count() >= max_errors:
+                reason = f'Stopped after {error_counter.nb_errors} errors (fail fast set to {max_errors})'
+                if cancel_marker:
+                    write_marker(cancel_marker, reason)
+            elif cancel_marker and os.path.exists(cancel_marker):
+                reason = f'Cancelled because another file of the analysis exceeded {max_errors} errors'
+            if reason:
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait()
+                write_marker(truncated_marker, reason)
+                return 1
+    return process.returncode
+
+
+def main():
+    argparse = ArgumentParser(description='Run a validation check and stop it once it reported a number of errors')
+    argparse.add_argument('--check', required=True, choices=list(error_outputs),
+                          help='The validation check run by the command')
+    argparse.add_argument('--max_errors', required=True, type=int,
+                          help='Number of errors after which the check is stopped')
+    argparse.add_argument('--output_dir', required=True, type=str,
+                          help='Directory where the command writes its reports')
+    argparse.add_argument('--log_file', required=True, type=str,
+                          help='File where the standard output and error of the command are written')
+    argparse.add_argument('--truncated_marker', required=True, type=str,
+                          help='File created with the reason why the check was stopped, if it was')
+    argparse.add_argument('--cancel_marker', type=str,
+                          help='File shared by the checks of an analysis: it is created when one of them exceeds the '
+                               'number of errors and the others stop when they find it')
+    argparse.add_argument('--poll_interval', type=float, default=5,
+                          help='Number of seconds between two counts of the errors')
+    argparse.add_argument('command', nargs=REMAINDER, help='The command running the check, after --')
+
+    args = argparse.parse_args()
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    sys.exit(run_with_error_budget(command, args.check, args.max_errors, args.output_dir, args.log_file,
+                                   args.truncated_marker, args.cancel_marker, args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
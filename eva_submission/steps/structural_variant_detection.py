@@ -1,41 +1,194 @@
 #!/usr/bin/env python
-import re
 import gzip
+import os
+import struct
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 
+import pysam
 
-def detect_structural_variant(vcf_file, output_vcf):
-    # Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Pages: 6, 16)
-    symbolic_allele_pattern = "^<(DEL|INS|DUP|INV|CNV|BND)"
-    # Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Page: 17)
-    complex_rearrangements_breakend_pattern = "^[ATCGNatgcn]+\[.+:.+\[$|^[ATCGNatgcn]+\].+:.+\]$|^\].+:.+\][ATCGNatgcn]+$|^\[.+:.+\[[ATCGNatgcn]+$"
-    # Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Page: 18)
-    complex_rearrangements_special_breakend_pattern = "^[ATGCNatgcn]+<[0-9A-Za-z!#$%&+./:;?@^_|~-][0-9A-Za-z!#$%&*+./:;=?@^_|~-]*>$"
-    # Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Page: 22)
-    single_breakend_pattern = "^\.[ATGCNatgcn]+|[ATGCNatgcn]+\.$"
-    sv_regex = re.compile(f'{symbolic_allele_pattern}|{complex_rearrangements_breakend_pattern}|'
-                          f'{complex_rearrangements_special_breakend_pattern}|{single_breakend_pattern}')
+from eva_submission.vcf_profile import get_vcf_profile, open_vcf_profile_cache, set_vcf_profile, VcfProfileBuilder
+from eva_submission.vcf_utils import open_vcf_binary, read_header, iterate_data_blocks, is_structural_variant_line, \
+    find_structural_variant_lines
+
+# Approximate size of the compressed chunks scanned by each worker when processing a BGZF file in parallel
+bgzf_chunk_size = 16 * 1024 * 1024
+# Ref: https://samtools.github.io/hts-specs/SAMv1.pdf (Section 4.1)
+bgzf_block_header = struct.Struct('<4sIBBHBBHH')
+bgzf_magic = b'\x1f\x8b\x08\x04'
+
+
+def open_vcf_output(output_vcf):
+    """Open the output VCF in binary mode, compressed with BGZF if the path ends with .gz"""
+    if output_vcf.endswith('.gz'):
+        return pysam.BGZFile(output_vcf, mode='wb')
+    return open(output_vcf, mode='wb')
+
+
+def _bgzf_block_size_at(open_input, offset):
+    """Return the total size of the BGZF block starting at the offset or None if there is no valid block header."""
+    open_input.seek(offset)
+    header = open_input.read(bgzf_block_header.size)
+    if len(header) < bgzf_block_header.size:
+        return None
+    magic, _, _, _, extra_length, subfield_id1, subfield_id2, subfield_length, block_size_minus_one = \
+        bgzf_block_header.unpack(header)
+    if magic != bgzf_magic or extra_length != 6 or (subfield_id1, subfield_id2) != (66, 67) or subfield_length != 2:
+        return None
+    return block_size_minus_one + 1
+
+
+def is_bgzf(vcf_file):
+    with open(vcf_file, 'rb') as open_input:
+        return _bgzf_block_size_at(open_input, 0) is not None
+
+
+def _find_bgzf_block_start(open_input, offset, file_size):
+    """
+    Find the first BGZF block starting at or after the offset. A candidate block header is only accepted if it is
+    followed by another valid block header or by the end of the file, which makes false positives in the compressed
+    data very unlikely.
+    """
+    window_size = 256 * 1024
+    while offset < file_size:
+        open_input.seek(offset)
+        window = open_input.read(window_size + bgzf_block_header.size)
+        position = window.find(bgzf_magic)
+        while position != -1 and position < window_size:
+            candidate = offset + position
+            candidate_size = _bgzf_block_size_at(open_input, candidate)
+            if candidate_size and (candidate + candidate_size == file_size or
+                                   _bgzf_block_size_at(open_input, candidate + candidate_size)):
+                return candidate
+            position = window.find(bgzf_magic, position + 1)
+        offset += window_size
+    return file_size
+
+
+def split_bgzf_file(vcf_file, chunk_size=bgzf_chunk_size):
+    """Split a BGZF file in (start, end) offsets ranges aligned with the BGZF blocks boundaries."""
+    file_size = os.path.getsize(vcf_file)
+    boundaries = [0]
+    with open(vcf_file, 'rb') as open_input:
+        for offset in range(chunk_size, file_size, chunk_size):
+            block_start = _find_bgzf_block_start(open_input, max(offset, boundaries[-1] + 1), file_size)
+            if block_start < file_size:
+                boundaries.append(block_start)
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _scan_bgzf_chunk(vcf_file, start, end, build_profile=False):
+    """
+    Decompress the BGZF blocks found between the start and end offsets and scan the complete lines they contain.
+    Return a tuple with:
+     - the bytes up to and including the first new line, which might complete a line started in the previous chunk
+     - the header lines found after the first line
+     - the structural variant lines found after the first line
+     - the bytes after the last new line or None if the chunk does not contain any new line
+     - the VcfProfileBuilder of the data lines found after the first line if build_profile is True, otherwise None
+    """
+    with open(vcf_file, 'rb') as open_input:
+        open_input.seek(start)
+        data = gzip.decompress(open_input.read(end - start))
+    first_newline = data.find(b'\n')
+    if first_newline == -1:
+        return data, b'', [], None, None
+    last_newline = data.rfind(b'\n')
+    block = data[first_newline + 1:last_newline + 1]
+    header_end = 0
+    while block.startswith(b'#', header_end):
+        header_end = block.find(b'\n', header_end) + 1
+    sv_lines = list(find_structural_variant_lines(block[header_end:]))
+    profile_builder = None
+    if build_profile:
+        profile_builder = VcfProfileBuilder()
+        profile_builder.add_lines(block[header_end:], nb_structural_variants=len(sv_lines))
+    return data[:first_newline + 1], block[:header_end], sv_lines, data[last_newline + 1:], profile_builder
+
+
+def _detect_structural_variant_in_bgzf_parallel(vcf_file, open_output, nb_processes, profile_builder=None):
+    """
+    Scan the chunks of a BGZF file in a pool of processes and write the header and the structural variant lines in the
+    order they appear in the file. Return the number of structural variant lines.
+    When a VcfProfileBuilder is provided, the profiles of the chunks are merged into it in the order of the file.
+    """
     nb_sv = 0
-    if vcf_file.endswith('.gz'):
-        ctx = gzip.open(vcf_file, mode="rt")
-    else:
-        ctx = open(vcf_file, mode="r")
-    has_sv_in_vcf = False
-    with ctx as open_input, open(output_vcf, 'w') as open_output:
-        for line in open_input:
-            if line.startswith("#"):
-                open_output.write(line)
+
+    def write_line(line):
+        is_sv = not line.startswith(b'#') and is_structural_variant_line(line)
+        if line.startswith(b'#') or is_sv:
+            open_output.write(line)
+        if profile_builder:
+            profile_builder.add_lines(line, nb_structural_variants=int(is_sv))
+        return is_sv
+
+    chunks = split_bgzf_file(vcf_file)
+    pending = b''
+    with ProcessPoolExecutor(max_workers=nb_processes) as executor:
+        results = executor.map(_scan_bgzf_chunk, [vcf_file] * len(chunks), *zip(*chunks),
+                               [profile_builder is not None] * len(chunks))
+        for first_line, chunk_header, chunk_sv_lines, last_bytes, chunk_profile_builder in results:
+            if last_bytes is None:
+                pending += first_line
                 continue
-            sp_line = line.split('\t')
-            alt_allele_column = sp_line[4]
-            alternate_alleles = alt_allele_column.split(",")
-            for alternate_allele in alternate_alleles:
-                if re.search(sv_regex, alternate_allele):
-                    open_output.write(line)
-                    nb_sv += 1
-                    has_sv_in_vcf = True
-                    break
-    if has_sv_in_vcf:
+            nb_sv += write_line(pending + first_line)
+            open_output.write(chunk_header + b''.join(chunk_sv_lines))
+            nb_sv += len(chunk_sv_lines)
+            if profile_builder:
+                profile_builder.add_lines(chunk_header, nb_structural_variants=0)
+                profile_builder.merge(chunk_profile_builder)
+            pending = last_bytes
+    if pending:
+        nb_sv += write_line(pending)
+    return nb_sv
+
+
+def _detect_structural_variant_in_blocks(vcf_file, open_output, profile_builder=None):
+    """
+    Scan the VCF file block by block and write the header and the structural variant lines to the output.
+    Return the number of structural variant lines. The blocks are also added to the VcfProfileBuilder if provided.
+    """
+    nb_sv = 0
+    with open_vcf_binary(vcf_file) as open_input:
+        header_lines, first_line = read_header(open_input)
+        open_output.write(b''.join(header_lines))
+        if profile_builder:
+            profile_builder.add_header(header_lines)
+        for block in iterate_data_blocks(open_input, first_line):
+            sv_lines = list(find_structural_variant_lines(block))
+            if sv_lines:
+                open_output.write(b''.join(sv_lines))
+                nb_sv += len(sv_lines)
+            if profile_builder:
+                profile_builder.add_lines(block, nb_structural_variants=len(sv_lines))
+    return nb_sv
+
+
+def detect_structural_variant(vcf_file, output_vcf, nb_processes=1, vcf_profile_cache=None):
+    """
+    Extract the lines containing structural variants from the VCF file and write them with the header to output_vcf.
+    When more than one process is requested and the input is compressed with BGZF, the file is split in chunks of
+    BGZF blocks that are scanned in parallel. The output is the same in both cases.
+    If the VcfProfile of the file has already been computed and does not report any structural variant, only the
+    header is written. Otherwise the whole file is read, so its VcfProfile is gathered at the same time and recorded
+    for the other checks.
+    """
+    vcf_profile = get_vcf_profile(vcf_file, vcf_profile_cache, compute=False)
+    profile_builder = None if vcf_profile else VcfProfileBuilder()
+    with open_vcf_output(output_vcf) as open_output:
+        if vcf_profile and vcf_profile.nb_structural_variants == 0:
+            with open_vcf_binary(vcf_file) as open_input:
+                header_lines, _ = read_header(open_input)
+            open_output.write(b''.join(header_lines))
+            nb_sv = 0
+        elif nb_processes > 1 and vcf_file.endswith('.gz') and is_bgzf(vcf_file):
+            nb_sv = _detect_structural_variant_in_bgzf_parallel(vcf_file, open_output, nb_processes, profile_builder)
+        else:
+            nb_sv = _detect_structural_variant_in_blocks(vcf_file, open_output, profile_builder)
+    if profile_builder:
+        set_vcf_profile(vcf_file, profile_builder.profile(), vcf_profile_cache)
+    if nb_sv:
         print(f'{nb_sv} lines containing structural variants')
 
 
@@ -46,13 +199,18 @@ def main():
     argparse.add_argument('--vcf_file', required=True, type=str,
                           help='Path to VCF where the detection of SV should be performed')
     argparse.add_argument('--output_vcf_file_with_sv', required=True, type=str,
-                          help='Path to VCF where the detected SVs will be output')
+                          help='Path to VCF where the detected SVs will be output. '
+                               'The output is compressed with BGZF if the path ends with .gz')
+    argparse.add_argument('--nb_processes', type=int, default=1,
+                          help='Number of processes used to scan a VCF compressed with BGZF')
+    argparse.add_argument('--vcf_profile_cache', type=str,
+                          help='Path to the SQLite database where the profiles of the VCF files are cached')
 
     args = argparse.parse_args()
-    detect_structural_variant(vcf_file=args.vcf_file, output_vcf=args.output_vcf_file_with_sv)
+    vcf_profile_cache = open_vcf_profile_cache(args.vcf_profile_cache) if args.vcf_profile_cache else None
+    detect_structural_variant(vcf_file=args.vcf_file, output_vcf=args.output_vcf_file_with_sv,
+                              nb_processes=args.nb_processes, vcf_profile_cache=vcf_profile_cache)
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,251 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Profile of a VCF file gathered in a single pass and shared by the validation checks.
+Profiles are cached in memory for the duration of the process and optionally in a PersistentCache, keyed by the
+fingerprint of the file so that a modified file is profiled again. The steps that already read the whole file, such as
+the structural variant detection, gather the profile while doing so and record it with set_vcf_profile.
+The sample names, which only need the header, are cached the same way so they can be provided without a profile.
+"""
+
+import hashlib
+import os
+import threading
+
+from eva_submission.persistent_cache import PersistentCache
+from eva_submission.vcf_utils import open_vcf_binary, read_header, iterate_data_blocks, \
+    find_structural_variant_lines, read_header_samples
+
+# Profiles are keyed by the fingerprint of the file so they never become stale: the time to live only bounds the size
+# of the cache
+vcf_profile_cache_ttl = 30 * 24 * 3600
+# Profiles computed by this process, keyed by fingerprint
+_profiles = {}
+# One lock per fingerprint so that concurrent checks wait for the profile being computed instead of computing it again
+_profile_locks = {}
+_profile_locks_lock = threading.Lock()
+# Sample names read from the header by this process, keyed by fingerprint
+_samples = {}
+
+
+def file_fingerprint(file_path, sample_size=1024 * 1024):
+    """
+    Fingerprint of a file made of its size, modification time and a hash of its size, beginning and end.
+    The content in the middle of large files is not read so this stays fast regardless of the size of the file.
+    """
+    stat = os.stat(file_path)
+    file_hash = hashlib.md5()
+    file_hash.update(str(stat.st_size).encode())
+    with open(file_path, 'rb') as open_file:
+        file_hash.update(open_file.read(sample_size))
+        if stat.st_size > sample_size:
+            open_file.seek(max(sample_size, stat.st_size - sample_size))
+            file_hash.update(open_file.read(sample_size))
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': file_hash.hexdigest()}
+
+
+class VcfProfile:
+    """
+    Facts about a VCF file:
+     - samples: the sample names in the header
+     - contigs: the sorted contigs used in the data lines
+     - nb_variants: the number of data lines
+     - has_genotypes: whether all the data lines have GT in their FORMAT
+     - has_allele_frequencies: whether all the data lines have AF or AC and AN in their INFO
+     - nb_structural_variants: the number of data lines containing at least one structural variant allele
+     - max_allele_length: the length of the longest reference or alternate allele
+     - is_sorted: whether the data lines of each contig are grouped together and sorted by position
+    """
+
+    facts = ('samples', 'contigs', 'nb_variants', 'has_genotypes', 'has_allele_frequencies',
+             'nb_structural_variants', 'max_allele_length', 'is_sorted')
+
+    def __init__(self, samples, contigs, nb_variants, has_genotypes, has_allele_frequencies, nb_structural_variants,
+                 max_allele_length, is_sorted):
+        self.samples = samples
+        self.contigs = contigs
+        self.nb_variants = nb_variants
+        self.has_genotypes = has_genotypes
+        self.has_allele_frequencies = has_allele_frequencies
+        self.nb_structural_variants = nb_structural_variants
+        self.max_allele_length = max_allele_length
+        self.is_sorted = is_sorted
+
+    def to_dict(self):
+        return dict((fact, getattr(self, fact)) for fact in self.facts)
+
+    @classmethod
+    def from_dict(cls, profile_dict):
+        return cls(**dict((fact, profile_dict[fact]) for fact in cls.facts))
+
+    @classmethod
+    def from_vcf(cls, vcf_file):
+        """Read the VCF file once and gather all the facts of the profile."""
+        builder = VcfProfileBuilder()
+        with open_vcf_binary(vcf_file) as open_input:
+            header_lines, first_line = read_header(open_input)
+            builder.add_header(header_lines)
+            for block in iterate_data_blocks(open_input, first_line):
+                builder.add_lines(block)
+        return builder.profile()
+
+
+class VcfProfileBuilder:
+    """
+    Gather the facts of a VcfProfile from consecutive blocks of complete VCF lines, so that the steps already reading
+    the whole file can profile it at the same time. Builders of consecutive parts of a file, such as the chunks of a
+    file scanned in parallel, are combined with merge.
+    """
+
+    def __init__(self):
+        self.samples = []
+        self.contigs = set()
+        self.nb_variants = self.nb_structural_variants = self.max_allele_length = 0
+        self.has_genotypes = self.has_allele_frequencies = self.is_sorted = True
+        # Contig and position of the first and last data lines, used to check the sort order across builders
+        self.first_line = self.last_line = None
+
+    def add_header(self, header_lines):
+        if header_lines and header_lines[-1].startswith(b'#CHROM'):
+            self.samples = [sample.decode() for sample in header_lines[-1].rstrip(b'\r\n').split(b'\t')[9:]]
+
+    def add_lines(self, block, nb_structural_variants=None):
+        """
+        Add a block of complete lines following the ones already added. Header lines are skipped.
+        The number of structural variant lines in the block is counted unless it is provided.
+        """
+        if nb_structural_variants is None:
+            nb_structural_variants = sum(1 for line in find_structural_variant_lines(block) if line[:1] != b'#')
+        self.nb_structural_variants += nb_structural_variants
+        current_contig, current_position = self.last_line or (None, 0)
+        for line in block.splitlines():
+            if not line or line.startswith(b'#'):
+                if line.startswith(b'#CHROM'):
+                    self.add_header([line])
+                continue
+            columns = line.split(b'\t', 9)
+            contig, position, reference, alternates, info = \
+                columns[0], int(columns[1]), columns[3], columns[4], columns[7]
+            self.nb_variants += 1
+            if self.first_line is None:
+                self.first_line = (contig, position)
+            if contig != current_contig:
+                if contig in self.contigs:
+                    self.is_sorted = False
+                self.contigs.add(contig)
+                current_contig = contig
+                current_position = 0
+            if position < current_position:
+                self.is_sorted = False
+            current_position = position
+            self.max_allele_length = max(self.max_allele_length, len(reference),
+                                         max(len(alternate) for alternate in alternates.split(b',')))
+            if self.has_genotypes:
+                self.has_genotypes = len(columns) > 8 and b'GT' in columns[8].split(b':')
+            if self.has_allele_frequencies:
+                info_keys = set(key_value.split(b'=', 1)[0] for key_value in info.split(b';'))
+                self.has_allele_frequencies = b'AF' in info_keys or (b'AC' in info_keys and b'AN' in info_keys)
+        if current_contig is not None:
+            self.last_line = (current_contig, current_position)
+
+    def merge(self, other):
+        """Add the facts of the builder of the lines that directly follow the ones of this builder."""
+        if other.first_line is not None:
+            # Only the last contig of this builder can continue at the beginning of the other one
+            continued_contigs = set()
+            if self.last_line and other.first_line[0] == self.last_line[0] \
+                    and other.first_line[1] >= self.last_line[1]:
+                continued_contigs.add(self.last_line[0])
+            self.is_sorted = self.is_sorted and other.is_sorted and \
+                self.contigs.intersection(other.contigs).issubset(continued_contigs)
+            self.first_line = self.first_line or other.first_line
+            self.last_line = other.last_line
+        self.samples = self.samples or other.samples
+        self.contigs.update(other.contigs)
+        self.nb_variants += other.nb_variants
+        self.nb_structural_variants += other.nb_structural_variants
+        self.max_allele_length = max(self.max_allele_length, other.max_allele_length)
+        self.has_genotypes = self.has_genotypes and other.has_genotypes
+        self.has_allele_frequencies = self.has_allele_frequencies and other.has_allele_frequencies
+
+    def profile(self):
+        return VcfProfile(
+            samples=self.samples, contigs=sorted(contig.decode() for contig in self.contigs),
+            nb_variants=self.nb_variants,
+            # The genotypes are only expected when the file has samples
+            has_genotypes=self.has_genotypes or not self.samples,
+            has_allele_frequencies=self.has_allele_frequencies, nb_structural_variants=self.nb_structural_variants,
+            max_allele_length=self.max_allele_length, is_sorted=self.is_sorted
+        )
+
+
+def open_vcf_profile_cache(db_path):
+    """PersistentCache storing the profiles of the VCF files in the SQLite database."""
+    return PersistentCache(db_path, table='vcf_profile', ttl=vcf_profile_cache_ttl)
+
+
+def _fingerprint_key(fingerprint):
+    return '{size}:{mtime}:{hash}'.format(**fingerprint)
+
+
+def get_vcf_profile(vcf_file, cache=None, compute=True):
+    """
+    Provides the VcfProfile of the VCF file from the memory of this process, then from the PersistentCache if one is
+    provided and otherwise profiles the file and stores the result in both.
+    Return None if the profile is not cached and compute is False.
+    """
+    key = _fingerprint_key(file_fingerprint(vcf_file))
+    with _profile_locks_lock:
+        profile_lock = _profile_locks.setdefault(key, threading.Lock())
+    with profile_lock:
+        if key not in _profiles and cache:
+            profile_dict = cache.get(key)
+            if profile_dict:
+                _profiles[key] = VcfProfile.from_dict(profile_dict)
+        if key not in _profiles and compute:
+            _profiles[key] = VcfProfile.from_vcf(vcf_file)
+            if cache:
+                cache.set(key, _profiles[key].to_dict())
+        return _profiles.get(key)
+
+
+def set_vcf_profile(vcf_file, profile, cache=None):
+    """Record the VcfProfile of the VCF file, gathered by a step that read the whole file, in memory and in the cache."""
+    key = _fingerprint_key(file_fingerprint(vcf_file))
+    _profiles[key] = profile
+    if cache:
+        cache.set(key, profile.to_dict())
+
+
+def get_vcf_samples(vcf_file, cache=None):
+    """
+    Provides the sample names of the VCF file from the memory of this process, then from its VcfProfile or the
+    PersistentCache if one is provided and otherwise reads them from the header and stores them in both.
+    """
+    key = _fingerprint_key(file_fingerprint(vcf_file))
+    if key in _samples:
+        return _samples[key]
+    samples = None
+    vcf_profile = get_vcf_profile(vcf_file, cache, compute=False)
+    if vcf_profile:
+        samples = vcf_profile.samples
+    elif cache:
+        samples = cache.get('samples:' + key)
+    if samples is None:
+        samples = read_header_samples(vcf_file)
+        if cache:
+            cache.set('samples:' + key, samples)
+    _samples[key] = samples
+    return samples
@@ -0,0 +1,178 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Lightweight helpers to read VCF files in large binary blocks rather than line by line and to find the structural
+variant lines in these blocks.
+This module only depends on the standard library so it can be used by the steps run from Nextflow.
+"""
+
+import gzip
+import re
+
+# Size of the binary blocks read from the input VCF
+block_size = 16 * 1024 * 1024
+
+# Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Pages: 6, 16)
+symbolic_allele_pattern = rb"^<(DEL|INS|DUP|INV|CNV|BND)"
+# Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Page: 17)
+complex_rearrangements_breakend_pattern = rb"^[ATCGNatgcn]+\[.+:.+\[$|^[ATCGNatgcn]+\].+:.+\]$|^\].+:.+\][ATCGNatgcn]+$|^\[.+:.+\[[ATCGNatgcn]+$"
+# Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Page: 18)
+complex_rearrangements_special_breakend_pattern = rb"^[ATGCNatgcn]+<[0-9A-Za-z!#$%&+./:;?@^_|~-][0-9A-Za-z!#$%&*+./:;=?@^_|~-]*>$"
+# Ref: https://samtools.github.io/hts-specs/VCFv4.3.pdf (Page: 22)
+single_breakend_pattern = rb"^\.[ATGCNatgcn]+|[ATGCNatgcn]+\.$"
+sv_regex = re.compile(b'|'.join((symbolic_allele_pattern, complex_rearrangements_breakend_pattern,
+                                 complex_rearrangements_special_breakend_pattern, single_breakend_pattern)))
+
+# Every structural variant allele contains one of '<', '[' or ']' or starts/ends with a '.' next to a base.
+# To find these without looking at individual lines, data blocks are translated so that all the bases become 'A',
+# the allele separators become tabs, the brackets become '<' and anything else becomes 'x'. The candidate lines are
+# then located with a handful of substring searches on the translated block.
+sv_prefilter_table = bytearray(b'x' * 256)
+for character in b'ATGCNatgcn':
+    sv_prefilter_table[character] = ord('A')
+for character in b'\t,':
+    sv_prefilter_table[character] = ord('\t')
+for character in b'<[]':
+    sv_prefilter_table[character] = ord('<')
+sv_prefilter_table[ord('.')] = ord('.')
+sv_prefilter_table[ord('\n')] = ord('\n')
+sv_prefilter_table = bytes(sv_prefilter_table)
+sv_prefilter_patterns = (b'<', b'\t.A', b'A.\t', b'A.\n')
+
+
+def open_vcf_binary(vcf_file):
+    """Open a VCF file, compressed or not, in binary mode."""
+    if vcf_file.endswith('.gz'):
+        return gzip.open(vcf_file, mode="rb")
+    return open(vcf_file, mode="rb")
+
+
+def read_header(open_input):
+    """
+    Read the header of a VCF opened in binary mode.
+    Return the header lines and the first data line, which is empty if the VCF does not contain any data.
+    """
+    header_lines = []
+    for line in open_input:
+        if not line.startswith(b'#'):
+            return header_lines, line
+        header_lines.append(line)
+    return header_lines, b''
+
+
+def iterate_data_blocks(open_input, first_line):
+    """Read the rest of a VCF opened in binary mode and yield blocks of complete data lines."""
+    remainder = first_line
+    while True:
+        block = open_input.read(block_size)
+        if not block:
+            break
+        last_newline = block.rfind(b'\n')
+        if last_newline == -1:
+            remainder += block
+            continue
+        yield remainder + block[:last_newline + 1]
+        remainder = block[last_newline + 1:]
+    if remainder:
+        yield remainder
+
+
+def is_structural_variant_line(line):
+    """Check if any of the alternate alleles of a VCF data line (in bytes) is a structural variant."""
+    alternate_alleles = line.split(b'\t', 5)[4]
+    return any(sv_regex.search(alternate_allele) for alternate_allele in alternate_alleles.split(b','))
+
+
+def find_candidate_line_starts(block):
+    """Return the sorted start positions of the lines of a block that might contain a structural variant."""
+    translated_block = block.translate(sv_prefilter_table) + b'\n'
+    line_starts = set()
+    for pattern in sv_prefilter_patterns:
+        position = translated_block.find(pattern)
+        while position != -1:
+            line_start = block.rfind(b'\n', 0, position) + 1
+            line_starts.add(line_start)
+            # Skip the rest of the line
+            position = translated_block.find(b'\n', position)
+            position = translated_block.find(pattern, position)
+    return sorted(line_starts)
+
+
+def find_structural_variant_lines(block):
+    """
+    Yield the lines containing structural variants from a block of complete VCF data lines, in the order they appear.
+    Only the lines flagged by the byte-level prefilter are split and checked with the structural variant regex.
+    """
+    for line_start in find_candidate_line_starts(block):
+        line_end = block.find(b'\n', line_start)
+        line_end = len(block) if line_end == -1 else line_end + 1
+        line = block[line_start:line_end]
+        if is_structural_variant_line(line):
+            yield line
+
+
+def get_nb_samples(header_lines):
+    """Number of samples declared in the #CHROM line of the header, counted without splitting the sample names."""
+    if header_lines and header_lines[-1].startswith(b'#CHROM'):
+        return max(header_lines[-1].rstrip(b'\r\n').count(b'\t') - 8, 0)
+    return 0
+
+
+def get_contig_lengths(header_lines):
+    """Return the contigs declared with a length in the ##contig lines of the header, with their length."""
+    contig_lengths = []
+    for line in header_lines:
+        if line.startswith(b'##contig=<'):
+            match_id = re.search(rb'[<,]ID=([^,>]+)', line)
+            match_length = re.search(rb'[<,]length=(\d+)', line)
+            if match_id and match_length:
+                contig_lengths.append((match_id.group(1).decode(), int(match_length.group(1))))
+    return contig_lengths
+
+
+def read_data_lines(open_input, first_line, nb_lines):
+    """Return up to nb_lines data lines of a VCF opened in binary mode, starting with first_line."""
+    data_lines = [first_line] if first_line else []
+    for line in open_input:
+        if len(data_lines) >= nb_lines:
+            break
+        data_lines.append(line)
+    return data_lines[:nb_lines]
+
+
+def has_genotypes_and_allele_frequencies(data_line):
+    """
+    Check, from the raw text of a VCF data line, if GT is in its FORMAT and if its INFO contains AF or AC and AN.
+    Only the fixed columns are split so the cost does not depend on the number of samples.
+    """
+    columns = data_line.rstrip(b'\r\n').split(b'\t', 9)
+    has_genotypes = len(columns) > 8 and b'GT' in columns[8].split(b':')
+    info_keys = set(key_value.split(b'=', 1)[0] for key_value in columns[7].split(b';'))
+    has_allele_frequencies = b'AF' in info_keys or (b'AC' in info_keys and b'AN' in info_keys)
+    return has_genotypes, has_allele_frequencies
+
+
+def read_header_samples(vcf_file):
+    """
+    Read the sample names from the #CHROM line of a VCF, compressed or not.
+    Reading stops at the #CHROM line so only the blocks containing the header are decompressed.
+    """
+    with open_vcf_binary(vcf_file) as open_input:
+        for line in open_input:
+            if line.startswith(b'#CHROM'):
+                return [sample.decode() for sample in line.rstrip(b'\r\n').split(b'\t')[9:]]
+            if not line.startswith(b'#'):
+                break
+    return []
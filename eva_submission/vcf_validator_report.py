@@ -0,0 +1,48 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Helpers to read the SQLite report written by vcf_validator with "--report database".
+The report is generated by ODB from the polymorphic Error class hierarchy of vcf_validator: the Error table holds the
+members common to all the errors (id, typeid, line, message and severity) and each subclass has its own table, such as
+MetaSectionError or FormatBodyError, keyed by the id of the error and holding the members specific to the subclass.
+This module only depends on the standard library so it can be used by the steps run from Nextflow.
+"""
+
+# Table of the root of the Error class hierarchy and the columns read from it
+errors_table = 'Error'
+errors_columns = {'id', 'typeid', 'line', 'message', 'severity'}
+
+# Values of the ErrorSeverity enum stored in the severity column
+warning_severity = 0
+error_severity = 1
+
+
+def get_table_columns(connection, table, schema='main'):
+    """Provides the columns of the table, which are empty if the table does not exist."""
+    return [row[1] for row in connection.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def has_errors_table(connection, schema='main'):
+    """Whether the database has the Error table of a vcf_validator report."""
+    return errors_columns.issubset(get_table_columns(connection, errors_table, schema))
+
+
+def get_tables(connection, schema='main'):
+    """Provides the tables of the database except the internal ones of SQLite, in the order they were created."""
+    return [
+        row[0] for row in connection.execute(
+            f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+        )
+    ]
@@ -16,6 +16,8 @@ from retry import retry
 from ebi_eva_common_pyutils.config import cfg
 from ebi_eva_common_pyutils.logger import logging_config as log_cfg
 
+from eva_submission.resolver import get_resolver
+
 annotation_metadata_collection_name = 'annotationMetadata_2_0'
 annotation_collection_name = 'annotations_2_0'
 
@@ -98,7 +100,9 @@ def check_vep_version_installed(vep_version):
 def get_vep_cache_version_from_ftp(assembly_accession, ensembl_assembly_name=None):
     logger.info('Getting vep_cache_version from Ensembl.')
     logger.info(f'Getting species and supported assembly from Ensembl using assembly accession: {assembly_accession}')
-    species_name, assembly_name, current_release_only, taxonomy_id = get_species_and_assembly(assembly_accession)
+    species_name, assembly_name, current_release_only, taxonomy_id = get_resolver().resolve(
+        'species_and_assembly', get_species_and_assembly, assembly_accession
+    )
     if ensembl_assembly_name:
         assembly_name = ensembl_assembly_name
     if assembly_name is None:
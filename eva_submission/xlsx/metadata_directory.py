@@ -0,0 +1,342 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Backends for XlsxReader and XlsxWriter working on metadata provided as a directory of text files instead of an xlsx,
+for the submissions with more samples than the spreadsheet template can handle. Each worksheet is a file named after
+it, such as Sample.tsv or "Submitter Details.json":
+ - TSV files have the headers of the worksheet on their first line and one row per line.
+ - JSON files have one JSON object per line, keyed by the headers of the worksheet.
+The files are read row by row every time the rows are iterated over, so they are never all held in memory.
+As text files do not have typed cells, the values of the columns that are integers or dates in the validation schema
+are converted when they are valid.
+"""
+
+import csv
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import yaml
+
+from eva_submission.xlsx.xlsx_parser import XlsxBaseParser, XlsxReader, XlsxWriter, OPTIONAL_HEADERS_KEY_NAME
+
+# Extensions of the files of the worksheets, in order of preference when a worksheet has several
+metadata_file_extensions = ('.tsv', '.json')
+
+integer_regex = re.compile(r'^[+-]?\d+$')
+
+
+def find_worksheet_files(metadata_dir):
+    """Provides the file of each worksheet found in the directory keyed by the name of the worksheet."""
+    worksheet_files = {}
+    for extension in reversed(metadata_file_extensions):
+        for file_name in os.listdir(metadata_dir):
+            if file_name.endswith(extension):
+                worksheet_files[file_name[:-len(extension)]] = os.path.join(metadata_dir, file_name)
+    return worksheet_files
+
+
+def is_metadata_directory(path):
+    """Whether the path is a directory containing the file of at least one worksheet."""
+    return os.path.isdir(path) and bool(find_worksheet_files(path))
+
+
+def _iter_tsv(worksheet_file):
+    """Yield the line number and the list of values of each line of the TSV file."""
+    # The byte order mark added by spreadsheet software when exporting to text is ignored
+    with open(worksheet_file, newline='', encoding='utf-8-sig') as open_file:
+        yield from enumerate(csv.reader(open_file, delimiter='\t'), 1)
+
+
+def _iter_json(worksheet_file):
+    """Yield the line number and the object of each non empty line of the JSON file."""
+    with open(worksheet_file, encoding='utf-8-sig') as open_file:
+        for line_num, line in enumerate(open_file, 1):
+            if line.strip():
+                yield line_num, json.loads(line)
+
+
+def load_header_types(validation_conf_filename):
+    """Provides the headers of each worksheet that are integers or dates in the validation schema with their type."""
+    with open(validation_conf_filename) as open_file:
+        validation_schema = yaml.safe_load(open_file)
+    header_types = {}
+    for worksheet, worksheet_schema in validation_schema.items():
+        header_types[worksheet] = dict(
+            (header.strip(), rules['type'])
+            for header, rules in worksheet_schema.get('schema', {}).get('schema', {}).items()
+            if rules.get('type') in ('integer', 'date')
+        )
+    return header_types
+
+
+def _serialise(value):
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+class MetadataDirectoryParser(XlsxBaseParser):
+    """
+    XlsxBaseParser reading the worksheets from the files of a directory. The workbook attribute is the file of each
+    worksheet keyed by its name. The headers of a TSV file are on its first line, those of a JSON file are the keys of
+    its first object followed by the optional headers of the worksheet as they might only be in the other objects.
+    Rows are numbered like the lines of the files, starting at 1.
+    """
+
+    # Per worksheet, the type of the headers which values are converted from text
+    header_types = {}
+
+    def _load_workbook(self, xls_filename, read_only):
+        if not os.path.isdir(xls_filename):
+            raise NotADirectoryError(f'{xls_filename} is not a directory')
+        return find_worksheet_files(xls_filename)
+
+    def close(self):
+        pass
+
+    def _is_json(self, title):
+        return self.workbook[title].endswith('.json')
+
+    def _sheet_titles(self):
+        return list(self.workbook)
+
+    def _header_row(self, title):
+        return 0 if self._is_json(title) else 1
+
+    def _max_row(self, title):
+        with open(self.workbook[title], 'rb') as open_file:
+            return sum(1 for _ in open_file)
+
+    def _row_values(self, title, row):
+        if self._is_json(title):
+            for _, record in _iter_json(self.workbook[title]):
+                optional_headers = self.xls_conf[title].get(OPTIONAL_HEADERS_KEY_NAME, [])
+                return list(record) + [header for header in optional_headers if header not in record]
+            return []
+        for row_num, values in _iter_tsv(self.workbook[title]):
+            if row_num == row:
+                return values
+        return []
+
+    def _iter_records(self, title):
+        """Yield the row number and the content of each row of the worksheet: a dict for JSON, a list for TSV."""
+        if self._is_json(title):
+            return _iter_json(self.workbook[title])
+        return _iter_tsv(self.workbook[title])
+
+    @staticmethod
+    def _convert_value(value, value_type):
+        """Convert the text of a cell to the type of its column, leaving it unchanged if it is not valid."""
+        if value == '':
+            return None
+        if value_type is None or not isinstance(value, str):
+            return value
+        text = value.strip()
+        if value_type == 'integer' and integer_regex.match(text):
+            return int(text)
+        if value_type == 'date':
+            try:
+                return datetime.datetime.fromisoformat(text)
+            except ValueError:
+                pass
+        return value
+
+    def _iter_row_values(self, worksheet, first_row):
+        headers = self.headers[worksheet]
+        header_types = self.header_types.get(worksheet, {})
+        value_types = [header_types.get(header) for header in headers]
+        is_json = self._is_json(worksheet)
+        for row_num, record in self._iter_records(worksheet):
+            if row_num < first_row:
+                continue
+            values = [record.get(header) for header in headers] if is_json else record
+            yield row_num, tuple(
+                self._convert_value(value, value_type) for value, value_type in zip(values, value_types)
+            )
+
+
+class MetadataDirectoryReader(MetadataDirectoryParser, XlsxReader):
+    """
+    XlsxReader streaming the rows of the worksheets from the files of a metadata directory.
+    """
+
+    def __init__(self, xls_filename, conf_filename, validation_conf_filename=None):
+        """
+        Constructor
+        :param xls_filename: metadata directory path
+        :param conf_filename: configuration file path
+        :param validation_conf_filename: validation schema used to convert the integers and dates, which are otherwise
+        read as text
+        """
+        super().__init__(xls_filename, conf_filename)
+        if validation_conf_filename:
+            self.header_types = load_header_types(validation_conf_filename)
+
+
+class MetadataDirectoryWriter(MetadataDirectoryParser, XlsxWriter):
+    """
+    XlsxWriter for the files of a metadata directory: the edits are kept until the directory is saved, then the files
+    of the worksheets modified are rewritten row by row. Only the headers already in a file can be written.
+    The rows provided to set_rows are not kept but read when the directory is saved, so they can be streamed from a
+    generator.
+    """
+
+    def __init__(self, xls_filename, conf_filename):
+        super().__init__(xls_filename, conf_filename)
+        self.metadata_dir = xls_filename
+        # Per worksheet, the values to write keyed by row and column
+        self._edits = {}
+        # Per worksheet, the row from which all the existing rows are deleted
+        self._deleted_from = {}
+        # Per worksheet, the rows to write from the top of the worksheet and whether the rows after them are deleted
+        self._row_sources = {}
+
+    def write_rows(self, rows, remove_when_missing_values=True):
+        worksheet = self.active_worksheet
+        if worksheet is None:
+            raise ValueError('No worksheet is specified!')
+
+        edits = self._edits.setdefault(worksheet, {})
+        for row_data in rows:
+            cells = self._row_cells(worksheet, row_data, remove_when_missing_values)
+            edits.setdefault(row_data['row_num'], {}).update(cells)
+
+    def set_rows(self, rows, empty_remaining_rows=False):
+        """Set the rows of the worksheet from its top. The rows are only iterated over when the directory is saved."""
+        worksheet = self.active_worksheet
+        if worksheet is None:
+            raise ValueError('No worksheet is specified!')
+        # The rows set replace the previous edits
+        self._edits.pop(worksheet, None)
+        self._deleted_from.pop(worksheet, None)
+        self._row_sources[worksheet] = (rows, empty_remaining_rows)
+
+    def _delete_rows_from(self, worksheet, row_num):
+        edits = self._edits.get(worksheet, {})
+        for edited_row_num in [edited_row_num for edited_row_num in edits if edited_row_num >= row_num]:
+            del edits[edited_row_num]
+        self._deleted_from[worksheet] = min(row_num, self._deleted_from.get(worksheet, row_num))
+
+    def _patch_record(self, worksheet, record, values):
+        """Copy of the record, a dict for JSON or a list for TSV, with the values written in their column."""
+        headers = self.headers[worksheet]
+        if self._is_json(worksheet):
+            record = dict(record)
+            for column, value in values.items():
+                record[headers[column - 1]] = value
+        else:
+            record = list(record) + [None] * (len(headers) - len(record))
+            for column, value in values.items():
+                record[column - 1] = value
+        return record
+
+    def _set_records(self, worksheet):
+        """
+        Yield the row number and the content of each row of the worksheet once the rows provided to set_rows are
+        written over the existing ones. Both are read at the same time, one row after the other.
+        """
+        rows, empty_remaining_rows = self._row_sources[worksheet]
+        first_row = self._header_row(worksheet) + 1
+        empty_record = {} if self._is_json(worksheet) else []
+        records = self._iter_records(worksheet)
+        next_record = next(records, None)
+        while next_record and next_record[0] < first_row:
+            yield next_record
+            next_record = next(records, None)
+        for row_num, row in enumerate(rows, start=first_row):
+            record = empty_record
+            if next_record and next_record[0] == row_num:
+                record = next_record[1]
+                next_record = next(records, None)
+            row['row_num'] = row_num
+            cells = self._row_cells(worksheet, row, remove_when_missing_values=True)
+            yield row_num, self._patch_record(worksheet, record, dict(cells))
+        if not empty_remaining_rows:
+            if next_record:
+                yield next_record
+            yield from records
+
+    def _patched_records(self, worksheet):
+        """Yield the row number and the content of each row of the worksheet once the edits are applied."""
+        edits = self._edits.get(worksheet, {})
+        deleted_from = self._deleted_from.get(worksheet)
+        last_row_num = self._header_row(worksheet)
+        if worksheet in self._row_sources:
+            records = self._set_records(worksheet)
+        else:
+            records = self._iter_records(worksheet)
+        for row_num, record in records:
+            if deleted_from is not None and row_num >= deleted_from:
+                break
+            last_row_num = row_num
+            if row_num in edits:
+                record = self._patch_record(worksheet, record, edits[row_num])
+            yield row_num, record
+        # Rows written after the end of the file
+        empty_record = {} if self._is_json(worksheet) else []
+        for row_num in sorted(edited_row_num for edited_row_num in edits if edited_row_num > last_row_num):
+            yield row_num, self._patch_record(worksheet, empty_record, edits[row_num])
+
+    def _write_worksheet(self, worksheet, open_file):
+        if self._is_json(worksheet):
+            previous_row_num = 0
+            for row_num, record in self._patched_records(worksheet):
+                # Empty lines keep the row numbers of the following rows
+                open_file.write('\n' * (row_num - previous_row_num - 1))
+                record = dict(
+                    (header, _serialise(value)) for header, value in record.items()
+                    if value is not None and value != ''
+                )
+                open_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                previous_row_num = row_num
+        else:
+            tsv_writer = csv.writer(open_file, delimiter='\t', lineterminator='\n')
+            previous_row_num = 0
+            for row_num, record in self._patched_records(worksheet):
+                for _ in range(row_num - previous_row_num - 1):
+                    tsv_writer.writerow([])
+                tsv_writer.writerow(['' if value is None else _serialise(value) for value in record])
+                previous_row_num = row_num
+
+    def save(self, filename):
+        """
+        Write the directory to filename, which can be the directory edited. The file of each modified worksheet is
+        replaced once it is complete and the other files are copied if the directory is different.
+        """
+        os.makedirs(filename, exist_ok=True)
+        same_directory = os.path.samefile(filename, self.metadata_dir)
+        for worksheet, worksheet_file in self.workbook.items():
+            output_file = os.path.join(filename, os.path.basename(worksheet_file))
+            if worksheet not in self._edits and worksheet not in self._deleted_from \
+                    and worksheet not in self._row_sources:
+                if not same_directory:
+                    shutil.copyfile(worksheet_file, output_file)
+                continue
+            with tempfile.NamedTemporaryFile('w', dir=filename, suffix='.tmp', newline='', encoding='utf-8',
+                                             delete=False) as open_file:
+                tmp_filename = open_file.name
+                try:
+                    self._write_worksheet(worksheet, open_file)
+                except Exception:
+                    open_file.close()
+                    os.remove(tmp_filename)
+                    raise
+            os.replace(tmp_filename, output_file)
@@ -51,7 +51,7 @@ class XlsxBaseParser(AppLogger):
         with open(conf_filename, 'r') as conf_file:
             self.xls_conf = yaml.full_load(conf_file)
         try:
-            self.workbook = load_workbook(xls_filename, read_only=read_only)
+            self.workbook = self._load_workbook(xls_filename, read_only)
         except Exception as e:
             self.error('Error loading %s', xls_filename)
             raise e
@@ -61,6 +61,24 @@ class XlsxBaseParser(AppLogger):
         self.headers = {}
         self.valid = None
 
+    def _load_workbook(self, xls_filename, read_only):
+        return load_workbook(xls_filename, read_only=read_only)
+
+    def close(self):
+        self.workbook.close()
+
+    def _sheet_titles(self):
+        return self.workbook.sheetnames
+
+    def _max_row(self, title):
+        return self.workbook[title].max_row
+
+    def _row_values(self, title, row):
+        return [cell.value for cell in self.workbook[title][row]]
+
+    def _header_row(self, title):
+        return self.xls_conf[title].get(HEADERS_KEY_ROW, 1)
+
     @property
     def active_worksheet(self):
         return self._active_worksheet
@@ -84,7 +102,7 @@ class XlsxBaseParser(AppLogger):
             return self.worksheets
 
         self.worksheets = []
-        sheet_titles = self.workbook.sheetnames
+        sheet_titles = self._sheet_titles()
 
         for title in self.xls_conf[WORKSHEETS_KEY_NAME]:
             # Check worksheet exists
@@ -92,13 +110,12 @@ class XlsxBaseParser(AppLogger):
                 continue
 
             # Check number of rows
-            worksheet = self.workbook[title]
-            header_row = self.xls_conf[title].get(HEADERS_KEY_ROW, 1)
-            if worksheet.max_row < header_row + 1:
+            header_row = self._header_row(title)
+            if self._max_row(title) < header_row + 1:
                 continue
             # Check required headers are present
-            self.headers[title] = [cell.value if cell.value is None else cell.value.strip()
-                                   for cell in worksheet[header_row]]
+            self.headers[title] = [value if value is None else value.strip()
+                                   for value in self._row_values(title, header_row)]
             required_headers = self.xls_conf[title].get(REQUIRED_HEADERS_KEY_NAME, [])
             if set(required_headers) <= set(self.headers[title]):  # issubset
                 self.worksheets.append(title)
@@ -157,12 +174,97 @@ class XlsxReader(XlsxBaseParser):
         :type conf_filename: basestring
         """
         super().__init__(xls_filename, conf_filename, read_only=True)
+        # Per worksheet, the configured headers with their column index and cast
+        self._columns = {}
+        # Per worksheet, the iterator over the rows that have not been read yet
+        self._row_iterators = {}
 
     def __iter__(self):
         return self
 
+    def __next__(self):
+        return self.next()
+
     def base_row_offset(self, worksheet):
-        return self.xls_conf[worksheet].get(HEADERS_KEY_ROW, 1)
+        return self._header_row(worksheet)
+
+    def _column_indices(self, worksheet):
+        """
+        Provides the configured headers of the worksheet with the index of their column, or None if the header is not
+        in the worksheet. Computed once per worksheet.
+        """
+        if worksheet not in self._columns:
+            header_indices = {}
+            for index, header in enumerate(self.headers[worksheet]):
+                header_indices.setdefault(header, index)
+            required_headers = self.xls_conf[worksheet].get(REQUIRED_HEADERS_KEY_NAME, [])
+            optional_headers = self.xls_conf[worksheet].get(OPTIONAL_HEADERS_KEY_NAME, [])
+            casts = self.xls_conf[worksheet].get(CAST_KEY_NAME, {})
+            self._columns[worksheet] = tuple(
+                (header, header_indices.get(header), casts.get(header))
+                for header in required_headers + optional_headers
+            )
+        return self._columns[worksheet]
+
+    def _iter_row_values(self, worksheet, first_row):
+        """Yield the row number and the tuple of cell values of each row of the worksheet from first_row."""
+        return enumerate(self.workbook[worksheet].iter_rows(min_row=first_row, values_only=True), first_row)
+
+    def _row_iterator(self, worksheet):
+        """
+        Provides the iterator over the rows of the worksheet, created once so that each row is only read once even in
+        read-only mode where openpyxl streams the worksheet from its start every time iter_rows is called.
+        """
+        if worksheet not in self._row_iterators:
+            if worksheet not in self.row_offset:
+                self.row_offset[worksheet] = self.base_row_offset(worksheet)
+            self._row_iterators[worksheet] = self._iter_row_values(worksheet, self.row_offset[worksheet] + 1)
+        return self._row_iterators[worksheet]
+
+    def _row_data(self, columns, row_num, row):
+        """Return the configured values of the row with its row number or None if the row does not contain data."""
+        num_cells = len(row)
+        data = {}
+        has_notnull = False
+        for header, header_index, cast in columns:
+            if header_index is None or header_index >= num_cells:
+                data[header] = None
+                continue
+            value = row[header_index]
+            if value is not None:
+                has_notnull = True
+            data[header] = self.trim_value(self.cast_value(value, cast))
+
+        if has_notnull:
+            data['row_num'] = row_num
+            return data
+        return None
+
+    def _next_data(self, worksheet):
+        """Return the next row of the worksheet that contains data or None when the worksheet is exhausted."""
+        columns = self._column_indices(worksheet)
+        for row_num, row in self._row_iterator(worksheet):
+            self.row_offset[worksheet] = row_num
+            data = self._row_data(columns, row_num, row)
+            if data is not None:
+                return data
+            # no data on this row, continue to next
+        return None
+
+    def iter_rows(self, worksheet):
+        """
+        Iterate over the data rows of the worksheet from its first row. Every call reads the worksheet again,
+        independently of the active worksheet and of the rows already returned by next.
+        """
+        if self.worksheets is None:
+            self.valid_worksheets()
+        if worksheet not in self.worksheets:
+            raise ValueError('Worksheet ' + worksheet + ' is not valid!')
+        columns = self._column_indices(worksheet)
+        for row_num, row in self._iter_row_values(worksheet, self.base_row_offset(worksheet) + 1):
+            data = self._row_data(columns, row_num, row)
+            if data is not None:
+                yield data
 
     def next(self):
         """
@@ -176,43 +278,10 @@ class XlsxReader(XlsxBaseParser):
             self.warning('No worksheet is specified!')
             raise StopIteration
 
-        if worksheet not in self.row_offset:
-            self.row_offset[worksheet] = self.base_row_offset(worksheet)
-        self.row_offset[worksheet] += 1
-
-        required_headers = self.xls_conf[worksheet].get(REQUIRED_HEADERS_KEY_NAME, [])
-        optional_headers = self.xls_conf[worksheet].get(OPTIONAL_HEADERS_KEY_NAME, [])
-
-        for row in self.workbook[worksheet].iter_rows(min_row=self.row_offset[worksheet]):
-            num_cells = 0
-            for cell in row:
-                num_cells += 1
-
-            data = {}
-            has_notnull = False
-            for header in required_headers+optional_headers:
-                header_index = num_cells
-                if header in self.headers[worksheet]:
-                    header_index = self.headers[worksheet].index(header)
-                if header_index >= num_cells:
-                    data[header] = None
-                    continue
-
-                cell = row[header_index]
-                if cell.value is not None:
-                    has_notnull = True
-                data[header] = self.trim_value(self.cast_value(
-                    cell.value, self.xls_conf[worksheet].get(CAST_KEY_NAME, {}).get(header)
-                ))
-
-            if has_notnull:
-                data['row_num'] = self.row_offset[worksheet]
-                return data
-
-            # no data on this row, continue to next
-            self.row_offset[worksheet] += 1
-
-        raise StopIteration
+        data = self._next_data(worksheet)
+        if data is None:
+            raise StopIteration
+        return data
 
     def get_rows(self):
         """
@@ -226,44 +295,11 @@ class XlsxReader(XlsxBaseParser):
             self.warning('No worksheet is specified!')
             return None
 
-        if worksheet not in self.row_offset:
-            self.row_offset[worksheet] = self.base_row_offset(worksheet)
-        self.row_offset[worksheet] += 1
-
-        required_headers = self.xls_conf[worksheet].get(REQUIRED_HEADERS_KEY_NAME, [])
-        optional_headers = self.xls_conf[worksheet].get(OPTIONAL_HEADERS_KEY_NAME, [])
-
         rows = []
-
-        for row in self.workbook[worksheet].iter_rows(min_row=self.row_offset[worksheet]):
-            num_cells = 0
-            for cell in row:
-                num_cells += 1
-
-            data = {}
-            has_notnull = False
-            for header in required_headers+optional_headers:
-                header_index = num_cells
-                if header in self.headers[worksheet]:
-                    header_index = self.headers[worksheet].index(header)
-                if header_index >= num_cells:
-                    data[header] = None
-                    continue
-
-                cell = row[header_index]
-                if cell.value is not None:
-                    has_notnull = True
-                data[header] = self.trim_value(self.cast_value(
-                    cell.value, self.xls_conf[worksheet].get(CAST_KEY_NAME, {}).get(header)
-                ))
-
-            if has_notnull:
-                data['row_num'] = self.row_offset[worksheet]
-                rows.append(data)
-
-            # no data on this row, continue to next
-            self.row_offset[worksheet] += 1
-
+        data = self._next_data(worksheet)
+        while data is not None:
+            rows.append(data)
+            data = self._next_data(worksheet)
         return rows
 
 
@@ -281,59 +317,100 @@ class XlsxWriter(XlsxBaseParser):
         :type conf_filename: basestring
         """
         super().__init__(xls_filename, conf_filename, read_only=False)
+        # Per worksheet, the configured headers present in the worksheet with their column and whether they are required
+        self._columns = {}
 
-    def edit_row(self, row_data: dict, remove_when_missing_values=True):
+    def _column_indices(self, worksheet):
+        """
+        Provides the configured headers found in the worksheet with their column number and whether they are
+        required. Computed once per worksheet.
+        """
+        if worksheet not in self._columns:
+            headers = self.headers[worksheet]
+            required_headers = self.xls_conf[worksheet].get(REQUIRED_HEADERS_KEY_NAME, [])
+            optional_headers = self.xls_conf[worksheet].get(OPTIONAL_HEADERS_KEY_NAME, [])
+            self._columns[worksheet] = tuple(
+                [(header, headers.index(header) + 1, True) for header in required_headers] +
+                [(header, headers.index(header) + 1, False) for header in optional_headers if header in headers]
+            )
+        return self._columns[worksheet]
+
+    def _row_cells(self, worksheet, row_data, remove_when_missing_values):
+        """Column and value of each cell to write for the row, checking all the required values are provided."""
+        if 'row_num' not in row_data:
+            raise KeyError('No row specified in dict ' + str(row_data))
+        cells = []
+        for header, column, required in self._column_indices(worksheet):
+            if header in row_data:
+                cells.append((column, row_data[header]))
+            elif required:
+                raise ValueError('Header {0} is required but is not provided in row {1}'.format(
+                    header, row_data['row_num']))
+            elif remove_when_missing_values:
+                # When data is missing remove the value from the cell
+                cells.append((column, ''))
+        return cells
+
+    def write_rows(self, rows, remove_when_missing_values=True):
+        """
+        Write the rows, each identified by its row_num, in the active worksheet. Only the cells which value changed
+        are written.
+        """
         worksheet = self.active_worksheet
         if worksheet is None:
             raise ValueError('No worksheet is specified!')
 
-        if 'row_num' not in row_data:
-            raise KeyError('No row specified in dict ' + str(row_data))
-        row_num = row_data['row_num']
-
-        required_headers = self.xls_conf[worksheet].get(REQUIRED_HEADERS_KEY_NAME, [])
-        optional_headers = self.xls_conf[worksheet].get(OPTIONAL_HEADERS_KEY_NAME, [])
-
-        for header in required_headers:
-            header_index = self.headers[worksheet].index(header)
-            if header not in row_data:
-                raise ValueError('Header {0} is required but is not provided in row {1}'.format(header, row_num))
-            self.workbook[worksheet].cell(column=header_index+1, row=row_num, value=row_data[header])
-
-        for header in optional_headers:
-            if header in self.headers[worksheet]:
-                header_index = self.headers[worksheet].index(header)
-                if header not in row_data and remove_when_missing_values:
-                    # When data is missing remove the value from the cell
-                    self.workbook[worksheet].cell(column=header_index+1, row=row_num, value='')
-                elif header in row_data:
-                    self.workbook[worksheet].cell(column=header_index+1, row=row_num, value=row_data[header])
+        sheet = self.workbook[worksheet]
+        # Cells that exist in the worksheet keyed by their row and column: looking them up there avoids creating empty
+        # cells that are not going to be written
+        existing_cells = sheet._cells
+        for row_data in rows:
+            cells = self._row_cells(worksheet, row_data, remove_when_missing_values)
+            row_num = row_data['row_num']
+            for column, value in cells:
+                cell = existing_cells.get((row_num, column))
+                if cell is None:
+                    if value is not None:
+                        sheet.cell(row=row_num, column=column, value=value)
+                elif cell.value != value or type(cell.value) is not type(value):
+                    cell.value = value
+
+    def edit_row(self, row_data: dict, remove_when_missing_values=True):
+        self.write_rows([row_data], remove_when_missing_values)
 
     def set_rows(self, rows, empty_remaining_rows=False):
         """
-        Write a set of rows from the top of the spreadsheet.
+        Write a set of rows from the top of the spreadsheet. The rows can be any iterable, such as a generator.
         """
         worksheet = self.active_worksheet
         if worksheet is None:
             raise ValueError('No worksheet is specified!')
 
-        first_row = self.xls_conf[worksheet].get(HEADERS_KEY_ROW, 1) + 1
-        for i, row in enumerate(rows):
-            row['row_num'] = first_row + i
-            self.edit_row(row)
+        first_row = self._header_row(worksheet) + 1
+        nb_rows = 0
+
+        def numbered_rows():
+            nonlocal nb_rows
+            for row in rows:
+                row['row_num'] = first_row + nb_rows
+                nb_rows += 1
+                yield row
+
+        self.write_rows(numbered_rows())
         if empty_remaining_rows:
-            self.workbook[worksheet].delete_rows(first_row + len(rows), amount=self.workbook[worksheet].max_row - first_row + len(rows))
+            self._delete_rows_from(worksheet, first_row + nb_rows)
+
+    def _delete_rows_from(self, worksheet, row_num):
+        """Delete all the rows of the worksheet from row_num."""
+        max_row = self.workbook[worksheet].max_row
+        if max_row >= row_num:
+            self.workbook[worksheet].delete_rows(row_num, amount=max_row - row_num + 1)
 
     def update_rows(self, rows):
         """
         Update a set of rows with their row num
         """
-        worksheet = self.active_worksheet
-        if worksheet is None:
-            raise ValueError('No worksheet is specified!')
-
-        for row in rows:
-            self.edit_row(row)
+        self.write_rows(rows)
 
     def save(self, filename):
         self.workbook.save(filename)
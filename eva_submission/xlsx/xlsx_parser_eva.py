@@ -12,34 +12,280 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import hashlib
+import json
 import os
+import threading
 from collections import defaultdict
+from types import MappingProxyType
 
 from cached_property import cached_property
-from ebi_eva_common_pyutils.logger import AppLogger
+from ebi_eva_common_pyutils.config import cfg
+from ebi_eva_common_pyutils.logger import AppLogger, logging_config as log_cfg
 
-from eva_submission import ETC_DIR
+from eva_submission import ETC_DIR, __version__
+from eva_submission.xlsx.metadata_directory import MetadataDirectoryReader, MetadataDirectoryWriter
 from eva_submission.xlsx.xlsx_parser import XlsxReader, XlsxWriter
+from eva_submission.xlsx.xlsx_parser_lxml import XlsxLxmlReader, XlsxPatchWriter
+
+logger = log_cfg.get_logger(__name__)
+
+# Spreadsheets parsed by this process keyed by their absolute path, with the modification time, size and inode they had
+_parsed_spreadsheets = {}
+_parsed_spreadsheets_lock = threading.Lock()
+# Extensions of the spreadsheet files that can be read by openpyxl
+spreadsheet_extensions = ('.xlsx', '.xlsm')
+# Version of the content of the snapshot files, to be changed when their content changes
+snapshot_format = 2
+
+
+class ParsedSpreadsheet:
+    """
+    Immutable snapshot of the valid worksheets of a spreadsheet: each worksheet is a tuple of read-only rows.
+    """
+
+    def __init__(self, valid_worksheets, base_row_offsets, sheets):
+        self.valid_worksheets = tuple(valid_worksheets)
+        self.base_row_offsets = MappingProxyType(dict(base_row_offsets))
+        self.sheets = MappingProxyType(dict(
+            (worksheet, tuple(MappingProxyType(row) for row in rows)) for worksheet, rows in sheets.items()
+        ))
+
+    @classmethod
+    def from_xlsx(cls, metadata_file):
+        # The backend reading the spreadsheet can be selected with the metadata_reader config
+        if cfg.query('metadata_reader', ret_default='openpyxl') == 'lxml':
+            reader_class = XlsxLxmlReader
+        else:
+            reader_class = XlsxReader
+        reader = reader_class(metadata_file, os.path.join(ETC_DIR, 'eva_project_conf.yaml'))
+        valid_worksheets = reader.valid_worksheets()
+        sheets = {}
+        for worksheet in valid_worksheets:
+            reader.active_worksheet = worksheet
+            sheets[worksheet] = reader.get_rows()
+        reader.close()
+        return cls(valid_worksheets,
+                   dict((worksheet, reader.base_row_offset(worksheet)) for worksheet in valid_worksheets), sheets)
+
+    def to_snapshot(self):
+        """Column oriented content of the spreadsheet: for each worksheet, its columns and the values of each row."""
+        sheets = {}
+        for worksheet, rows in self.sheets.items():
+            columns = tuple(rows[0]) if rows else ()
+            sheets[worksheet] = (columns, [tuple(row[column] for column in columns) for row in rows])
+        return {'valid_worksheets': self.valid_worksheets, 'base_row_offsets': dict(self.base_row_offsets),
+                'sheets': sheets}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        sheets = dict(
+            (worksheet, [dict(zip(columns, values)) for values in rows])
+            for worksheet, (columns, rows) in snapshot['sheets'].items()
+        )
+        return cls(snapshot['valid_worksheets'], snapshot['base_row_offsets'], sheets)
+
+    def get_rows(self, worksheet):
+        if worksheet not in self.sheets:
+            raise ValueError('Worksheet ' + worksheet + ' is not valid!')
+        return self.sheets[worksheet]
+
+
+class StreamedRows:
+    """Rows of a worksheet that are read again from its file every time they are iterated over."""
+
+    def __init__(self, reader, worksheet):
+        self.reader = reader
+        self.worksheet = worksheet
+
+    def __iter__(self):
+        return self.reader.iter_rows(self.worksheet)
+
+
+class StreamedSpreadsheet:
+    """
+    Valid worksheets of metadata provided as a directory of TSV or JSON files. Unlike ParsedSpreadsheet, the rows are
+    not held in memory but streamed from the files.
+    """
+
+    def __init__(self, metadata_dir):
+        self.reader = MetadataDirectoryReader(metadata_dir, os.path.join(ETC_DIR, 'eva_project_conf.yaml'),
+                                              os.path.join(ETC_DIR, 'eva_project_validation.yaml'))
+        self.valid_worksheets = tuple(self.reader.valid_worksheets())
+        self.base_row_offsets = dict(
+            (worksheet, self.reader.base_row_offset(worksheet)) for worksheet in self.valid_worksheets
+        )
+
+    def get_rows(self, worksheet):
+        if worksheet not in self.valid_worksheets:
+            raise ValueError('Worksheet ' + worksheet + ' is not valid!')
+        return StreamedRows(self.reader, worksheet)
+
+
+def is_metadata_directory_path(metadata_file):
+    """
+    Whether the metadata is provided as a directory rather than a spreadsheet. Paths with the extension of a
+    spreadsheet are not checked on the file system.
+    """
+    return not metadata_file.lower().endswith(spreadsheet_extensions) and os.path.isdir(metadata_file)
+
+
+def _spreadsheet_state(metadata_file):
+    stat = os.stat(metadata_file)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def default_snapshot_dir():
+    """Directory where the snapshots are persisted when none is provided, set with the metadata_snapshot_dir config."""
+    return cfg.query('metadata_snapshot_dir')
+
+
+def _spreadsheet_md5(metadata_file):
+    md5 = hashlib.md5()
+    with open(metadata_file, 'rb') as open_file:
+        for chunk in iter(lambda: open_file.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def snapshot_path(snapshot_dir, spreadsheet_md5):
+    """File of the snapshot directory where the parsed content of the spreadsheet with this md5 is persisted."""
+    return os.path.join(snapshot_dir, spreadsheet_md5 + '.json')
+
+
+def _snapshot_key(spreadsheet_md5):
+    """The snapshot is only valid for the same content of the spreadsheet, parsed by the same version."""
+    return {'md5': spreadsheet_md5, 'version': __version__, 'format': snapshot_format}
+
+
+def _encode_value(value):
+    """Cells that are dates or times are stored in the snapshot as their ISO format tagged with their type."""
+    for value_type in (datetime.datetime, datetime.date, datetime.time):
+        if isinstance(value, value_type):
+            return {'__type__': value_type.__name__, 'value': value.isoformat()}
+    raise TypeError(f'{type(value).__name__} values cannot be stored in a snapshot')
+
+
+def _decode_value(json_object):
+    value_types = {'datetime': datetime.datetime, 'date': datetime.date, 'time': datetime.time}
+    if json_object.get('__type__') in value_types:
+        return value_types[json_object['__type__']].fromisoformat(json_object['value'])
+    return json_object
+
+
+def load_snapshot(snapshot_dir, snapshot_key):
+    """Return the ParsedSpreadsheet stored in the snapshot of the spreadsheet or None if it is missing or stale."""
+    try:
+        with open(snapshot_path(snapshot_dir, snapshot_key['md5'])) as open_file:
+            snapshot = json.load(open_file, object_hook=_decode_value)
+        if snapshot.get('key') == snapshot_key:
+            return ParsedSpreadsheet.from_snapshot(snapshot)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.debug(f'Could not load the snapshot {snapshot_key["md5"]} from {snapshot_dir}: {e}')
+    return None
+
+
+def save_snapshot(snapshot_dir, snapshot_key, parsed_spreadsheet):
+    """Write the snapshot of the spreadsheet. Failing to write it only means that it will be parsed again."""
+    snapshot = parsed_spreadsheet.to_snapshot()
+    snapshot['key'] = snapshot_key
+    output_path = snapshot_path(snapshot_dir, snapshot_key['md5'])
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(tmp_path, 'w') as open_file:
+            json.dump(snapshot, open_file, default=_encode_value)
+        # Replaced atomically so that concurrent processes never read a partial snapshot
+        os.replace(tmp_path, output_path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug(f'Could not save the snapshot {snapshot_key["md5"]} to {snapshot_dir}: {e}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_parsed_spreadsheet(metadata_file, snapshot_dir=None):
+    """
+    Provides the ParsedSpreadsheet of the file, only parsing it if it was not parsed by this process since it was
+    last modified and if there is no snapshot of its content in the snapshot directory. The snapshots are only
+    persisted in snapshot_dir, or the configured metadata_snapshot_dir, never next to the spreadsheet.
+    """
+    path = os.path.abspath(metadata_file)
+    state = _spreadsheet_state(path)
+    with _parsed_spreadsheets_lock:
+        if path in _parsed_spreadsheets and _parsed_spreadsheets[path][0] == state:
+            return _parsed_spreadsheets[path][1]
+    snapshot_dir = snapshot_dir or default_snapshot_dir()
+    parsed_spreadsheet = None
+    if snapshot_dir:
+        snapshot_key = _snapshot_key(_spreadsheet_md5(path))
+        parsed_spreadsheet = load_snapshot(snapshot_dir, snapshot_key)
+    if parsed_spreadsheet is None:
+        parsed_spreadsheet = ParsedSpreadsheet.from_xlsx(path)
+        if snapshot_dir:
+            save_snapshot(snapshot_dir, snapshot_key, parsed_spreadsheet)
+    with _parsed_spreadsheets_lock:
+        _parsed_spreadsheets[path] = (state, parsed_spreadsheet)
+    return parsed_spreadsheet
+
+
+def invalidate_parsed_spreadsheet(metadata_file):
+    """Forget the parsed content of the file so that it is parsed again when next read."""
+    with _parsed_spreadsheets_lock:
+        _parsed_spreadsheets.pop(os.path.abspath(metadata_file), None)
 
 
 class EvaXlsxReader(AppLogger):
+    """
+    Reader for the EVA metadata spreadsheet. The spreadsheet is only parsed once per process, as long as it is not
+    modified, and each reader provides its own copy of the rows.
+    The metadata can also be a directory with a TSV or JSON file per worksheet, in which case the rows are streamed
+    from the files: iter_rows and worksheet_rows provide them without holding the whole worksheet in memory.
+    """
+
+    def __init__(self, metadata_file, snapshot_dir=None):
+        """
+        :param metadata_file: spreadsheet or metadata directory
+        :param snapshot_dir: directory, such as the one of the ELOAD, where the parsed content of the spreadsheet is
+        persisted between processes
+        """
+        self.metadata_file = metadata_file
+        if is_metadata_directory_path(metadata_file):
+            self.spreadsheet = StreamedSpreadsheet(metadata_file)
+        else:
+            self.spreadsheet = get_parsed_spreadsheet(metadata_file, snapshot_dir)
 
-    def __init__(self, metadata_file):
-        conf = os.path.join(ETC_DIR, 'eva_project_conf.yaml')
-        self.reader = XlsxReader(metadata_file, conf)
-        self.metadata_file=metadata_file
+    def valid_worksheets(self):
+        return list(self.spreadsheet.valid_worksheets)
+
+    def base_row_offset(self, worksheet):
+        return self.spreadsheet.base_row_offsets[worksheet]
 
     def _get_all_rows(self, active_sheet):
-        self.reader.active_worksheet = active_sheet
-        return self.reader.get_rows()
+        return [dict(row) for row in self.spreadsheet.get_rows(active_sheet)]
+
+    def iter_rows(self, worksheet):
+        """Iterate over copies of the rows of the worksheet."""
+        for row in self.spreadsheet.get_rows(worksheet):
+            yield dict(row)
+
+    def worksheet_rows(self, worksheet):
+        """
+        Rows of the worksheet that can be iterated over several times: copies of all the rows of a spreadsheet, or the
+        rows of a metadata directory which are streamed from its file on each iteration.
+        """
+        if isinstance(self.spreadsheet, StreamedSpreadsheet):
+            return self.spreadsheet.get_rows(worksheet)
+        return self._get_all_rows(worksheet)
 
     @cached_property
     def project(self):
-        self.reader.active_worksheet = 'Project'
-        try:
-            return self.reader.next()
-        except StopIteration:
-            self.error('No project was found in the spreadsheet %s', self.metadata_file)
+        projects = self._get_all_rows('Project')
+        if projects:
+            return projects[0]
+        self.error('No project was found in the spreadsheet %s', self.metadata_file)
 
     @cached_property
     def submitters(self):
@@ -86,12 +332,28 @@ class EvaXlsxReader(AppLogger):
             files_per_analysis[row.get('Analysis Alias')].append(row)
         return files_per_analysis
 
+    def iter_samples_of_analysis(self, analysis_alias):
+        """Iterate over the samples of the analysis, reading the other samples without keeping them."""
+        for row in self.iter_rows('Sample'):
+            if analysis_alias in [alias.strip() for alias in row.get('Analysis Alias').split(',')]:
+                yield row
+
+    def iter_files_of_analysis(self, analysis_alias):
+        """Iterate over the files of the analysis, reading the other files without keeping them."""
+        for row in self.iter_rows('Files'):
+            if row.get('Analysis Alias') == analysis_alias:
+                yield row
+
 
 class EvaXlsxWriter(AppLogger):
 
     def __init__(self, metadata_source, metadata_dest=None):
         conf = os.path.join(ETC_DIR, 'eva_project_conf.yaml')
-        self.writer = XlsxWriter(metadata_source, conf)
+        # Only the worksheets modified are rewritten when the spreadsheet, or the metadata directory, is saved
+        if is_metadata_directory_path(metadata_source):
+            self.writer = MetadataDirectoryWriter(metadata_source, conf)
+        else:
+            self.writer = XlsxPatchWriter(metadata_source, conf)
         self.metadata_source = metadata_source
         if metadata_dest:
             self.metadata_dest = metadata_dest
@@ -108,6 +370,7 @@ class EvaXlsxWriter(AppLogger):
 
     def save(self):
         self.writer.save(self.metadata_dest)
+        invalidate_parsed_spreadsheet(self.metadata_dest)
 
     def set_files(self, file_dicts):
         self._set_all_rows('Files', file_dicts)
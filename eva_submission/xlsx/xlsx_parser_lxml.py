@@ -0,0 +1,598 @@
+# Copyright 2023 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Alternate backends for XlsxReader and XlsxWriter working on the XML of the worksheets with lxml instead of openpyxl.
+The reader streams the shared strings, the styles and the sheets straight from the xlsx zip and converts the cell
+values the same way as openpyxl in read-only mode so the rows returned are identical, while avoiding the creation of
+openpyxl objects for every cell.
+The writer patches the xlsx in place: only the worksheets that were modified, and the styles when a date style needs
+to be added, are rewritten. All the other parts of the xlsx are copied without being decompressed.
+"""
+
+import copy
+import datetime
+import os
+import posixpath
+import struct
+import tempfile
+import zipfile
+
+from lxml import etree
+from openpyxl.cell.cell import get_time_format
+from openpyxl.compat import NUMERIC_TYPES, safe_string
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE, \
+    is_date_format, is_timedelta_format
+from openpyxl.utils import column_index_from_string, get_column_letter, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, to_excel, WINDOWS_EPOCH, CALENDAR_MAC_1904
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+from openpyxl.xml.functions import whitespace
+
+from eva_submission.xlsx.xlsx_parser import XlsxBaseParser, XlsxReader, XlsxWriter
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+ROW_TAG = f'{{{MAIN_NS}}}row'
+CELL_TAG = f'{{{MAIN_NS}}}c'
+VALUE_TAG = f'{{{MAIN_NS}}}v'
+FORMULA_TAG = f'{{{MAIN_NS}}}f'
+INLINE_STRING_TAG = f'{{{MAIN_NS}}}is'
+TEXT_TAG = f'{{{MAIN_NS}}}t'
+RICH_TEXT_RUN_TAG = f'{{{MAIN_NS}}}r'
+SHARED_STRING_TAG = f'{{{MAIN_NS}}}si'
+DIMENSION_TAG = f'{{{MAIN_NS}}}dimension'
+SHEET_DATA_TAG = f'{{{MAIN_NS}}}sheetData'
+NUMBER_FORMATS_TAG = f'{{{MAIN_NS}}}numFmts'
+NUMBER_FORMAT_TAG = f'{{{MAIN_NS}}}numFmt'
+CELL_STYLES_TAG = f'{{{MAIN_NS}}}cellXfs'
+CELL_STYLE_TAG = f'{{{MAIN_NS}}}xf'
+
+# Flag of the zip members whose CRC and sizes are written after their data rather than in their local header
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+zip_copy_size = 1024 * 1024
+
+
+def _text_content(element):
+    """Text of a shared or inline string without its formatting, ignoring the phonetic runs like openpyxl does."""
+    if len(element) == 1 and element[0].tag == TEXT_TAG:
+        # Most common case of a plain text
+        return element[0].text or ''
+    snippets = []
+    plain_text = element.find(TEXT_TAG)
+    if plain_text is not None and plain_text.text is not None:
+        snippets.append(plain_text.text)
+    for run in element.iterfind(RICH_TEXT_RUN_TAG):
+        run_text = run.findtext(TEXT_TAG)
+        if run_text is not None:
+            snippets.append(run_text)
+    return ''.join(snippets)
+
+
+def _cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def _clear(element):
+    """Free the memory used by the element and the siblings already processed."""
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+class XlsxLxmlParser(XlsxBaseParser):
+    """
+    Parser reading the worksheets with lxml iterparse. The workbook attribute is the xlsx zip file.
+    """
+
+    def _load_workbook(self, xls_filename, read_only):
+        archive = zipfile.ZipFile(xls_filename)
+        try:
+            self._read_workbook_parts(archive)
+        except Exception:
+            archive.close()
+            raise
+        return archive
+
+    def close(self):
+        self.workbook.close()
+
+    def _relationships(self, archive, part):
+        """Targets of the relationships of a part of the package, keyed by relationship id, with their type."""
+        rels_path = posixpath.join(posixpath.dirname(part), '_rels', posixpath.basename(part) + '.rels')
+        relationships = {}
+        if rels_path not in archive.namelist():
+            return relationships
+        for relationship in etree.fromstring(archive.read(rels_path)):
+            target = relationship.get('Target')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+            relationships[relationship.get('Id')] = (relationship.get('Type'), target)
+        return relationships
+
+    def _read_workbook_parts(self, archive):
+        workbook_part = next(
+            target for rel_type, target in self._relationships(archive, '').values()
+            if rel_type.endswith('/officeDocument')
+        )
+        workbook_rels = self._relationships(archive, workbook_part)
+        workbook_xml = etree.fromstring(archive.read(workbook_part))
+
+        workbook_properties = workbook_xml.find(f'{{{MAIN_NS}}}workbookPr')
+        date1904 = workbook_properties is not None and workbook_properties.get('date1904') in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else WINDOWS_EPOCH
+
+        self.sheet_paths = {}
+        for sheet in workbook_xml.iter(f'{{{MAIN_NS}}}sheet'):
+            self.sheet_paths[sheet.get('name')] = workbook_rels[sheet.get(f'{{{RELATIONSHIP_NS}}}id')][1]
+
+        self.shared_strings = []
+        self.styles_part = None
+        self.date_styles = set()
+        self.timedelta_styles = set()
+        for rel_type, target in workbook_rels.values():
+            if rel_type.endswith('/sharedStrings'):
+                self.shared_strings = self._read_shared_strings(archive, target)
+            elif rel_type.endswith('/styles'):
+                self._read_styles(archive, target)
+        self.dimensions = {}
+
+    @staticmethod
+    def _read_shared_strings(archive, part):
+        shared_strings = []
+        with archive.open(part) as source:
+            for _, element in etree.iterparse(source, tag=SHARED_STRING_TAG):
+                shared_strings.append(_text_content(element).replace('x005F_', ''))
+                _clear(element)
+        return shared_strings
+
+    def _read_styles(self, archive, part):
+        """Index the cell styles that format numbers as dates or time deltas."""
+        self.styles_part = part
+        styles_xml = etree.fromstring(archive.read(part))
+        custom_formats = dict(
+            (int(number_format.get('numFmtId')), number_format.get('formatCode'))
+            for number_format in styles_xml.iterfind(f'{NUMBER_FORMATS_TAG}/{NUMBER_FORMAT_TAG}')
+        )
+        cell_styles = styles_xml.find(CELL_STYLES_TAG)
+        if cell_styles is None:
+            return
+        for style_id, cell_style in enumerate(cell_styles.iterfind(f'{{{MAIN_NS}}}xf')):
+            number_format_id = int(cell_style.get('numFmtId', 0))
+            number_format = custom_formats.get(number_format_id, BUILTIN_FORMATS.get(number_format_id))
+            if number_format is None:
+                continue
+            if is_date_format(number_format):
+                self.date_styles.add(style_id)
+            if is_timedelta_format(number_format):
+                self.timedelta_styles.add(style_id)
+
+    def _sheet_titles(self):
+        return list(self.sheet_paths)
+
+    def _dimension(self, title):
+        """Boundaries (min_col, min_row, max_col, max_row) declared by the worksheet or None if it does not declare them."""
+        if title not in self.dimensions:
+            self.dimensions[title] = None
+            with self.workbook.open(self.sheet_paths[title]) as source:
+                for _, element in etree.iterparse(source, events=('start',)):
+                    if element.tag == DIMENSION_TAG:
+                        self.dimensions[title] = range_boundaries(element.get('ref'))
+                        break
+                    if element.tag == SHEET_DATA_TAG:
+                        break
+        return self.dimensions[title]
+
+    def _max_row(self, title):
+        dimension = self._dimension(title)
+        if dimension:
+            return dimension[3]
+        # The worksheet is unsized: the last row has to be found
+        max_row = 0
+        for max_row, _ in self._iter_row_values(title, 1, columns=()):
+            pass
+        return max_row
+
+    def _row_values(self, title, row):
+        for row_num, values in self._iter_row_values(title, row, columns=None):
+            return list(values) if row_num == row else []
+        return []
+
+    def _used_columns(self, worksheet):
+        """Columns (1-based) of the worksheet that are used by the parser or None if all of them are."""
+        return None
+
+    def _iter_row_values(self, worksheet, first_row, columns=False):
+        """
+        Yield the row number and the tuple of cell values of each row of the worksheet containing cells, from first_row
+        and up to the last row declared by the worksheet.
+        Only the cells of the columns (1-based) are converted, the others being None. By default these are the
+        columns used by the parser. All the cells are converted if columns is None.
+        """
+        if columns is False:
+            columns = self._used_columns(worksheet)
+        dimension = self._dimension(worksheet)
+        max_col, max_row = (dimension[2], dimension[3]) if dimension else (None, None)
+        column_indices = {}
+        shared_formulae = {}
+        with self.workbook.open(self.sheet_paths[worksheet]) as source:
+            row_num = 0
+            for _, row in etree.iterparse(source, tag=ROW_TAG):
+                row_num = int(float(row.get('r'))) if row.get('r') else row_num + 1
+                if max_row is not None and row_num > max_row:
+                    break
+                if row_num < first_row:
+                    _clear(row)
+                    continue
+                values = {}
+                column = 0
+                for cell in row:
+                    coordinate = cell.get('r')
+                    if coordinate:
+                        column_letters = coordinate.rstrip('0123456789')
+                        if column_letters not in column_indices:
+                            column_indices[column_letters] = column_index_from_string(column_letters)
+                        column = column_indices[column_letters]
+                    else:
+                        column += 1
+                    if (max_col is None or column <= max_col) and (columns is None or column in columns):
+                        values[column] = self._cell_value(cell, coordinate, shared_formulae)
+                    elif len(cell) and cell[0].tag == FORMULA_TAG and cell[0].get('t') == 'shared':
+                        # The first cell of a shared formula is needed to translate it in the other cells
+                        self._cell_value(cell, coordinate, shared_formulae)
+                _clear(row)
+                if values or columns is not None:
+                    row_values = [None] * (max_col or max(values, default=column))
+                    for column, value in values.items():
+                        row_values[column - 1] = value
+                    yield row_num, tuple(row_values)
+
+    def _cell_value(self, cell, coordinate, shared_formulae):
+        """Convert the value of the cell the same way as openpyxl in read-only mode."""
+        data_type = cell.get('t', 'n')
+        value = None
+        for child in cell:
+            if child.tag == FORMULA_TAG:
+                return self._formula_value(child, coordinate, shared_formulae)
+            if child.tag == VALUE_TAG:
+                value = child.text
+            elif child.tag == INLINE_STRING_TAG and data_type == 'inlineStr':
+                value = _text_content(child)
+        if data_type == 'inlineStr':
+            return value
+        if not value:
+            return None
+        if data_type == 'n':
+            value = _cast_number(value)
+            if self.date_styles:
+                style_id = int(cell.get('s', 0))
+                if style_id in self.date_styles:
+                    try:
+                        return from_excel(value, self.epoch, timedelta=style_id in self.timedelta_styles)
+                    except (OverflowError, ValueError):
+                        return '#VALUE!'
+            return value
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value
+
+    @staticmethod
+    def _formula_value(formula, coordinate, shared_formulae):
+        """Formulas are returned as text, like openpyxl does when the values cached in the file are not requested."""
+        formula_type = formula.get('t')
+        value = '='
+        if formula.text is not None:
+            value += formula.text
+        if formula_type == 'array':
+            return ArrayFormula(ref=formula.get('ref'), text=value)
+        if formula_type == 'shared':
+            shared_index = formula.get('si')
+            if shared_index in shared_formulae:
+                return shared_formulae[shared_index].translate_formula(coordinate)
+            if value != '=':
+                shared_formulae[shared_index] = Translator(value, coordinate)
+        elif formula_type == 'dataTable':
+            return DataTableFormula(**formula.attrib)
+        return value
+
+
+class XlsxLxmlReader(XlsxLxmlParser, XlsxReader):
+    """
+    XlsxReader reading the worksheets with lxml iterparse. The workbook attribute is the xlsx zip file.
+    """
+
+    def _used_columns(self, worksheet):
+        # Only the columns of the configured headers are read
+        return set(index + 1 for _, index, _ in self._column_indices(worksheet) if index is not None)
+
+
+def _set_cell_value(cell, value, epoch=WINDOWS_EPOCH):
+    """
+    Replace the value of the cell element keeping its style, writing it the same way as openpyxl does. Dates and times
+    are written as serial numbers: the style of the cell needs to format them as dates.
+    """
+    for child in list(cell):
+        if child.tag in (FORMULA_TAG, VALUE_TAG, INLINE_STRING_TAG):
+            cell.remove(child)
+    cell.attrib.pop('t', None)
+    if value is None or value == '':
+        return
+    if isinstance(value, str) and value.startswith('=') and len(value) > 1:
+        etree.SubElement(cell, FORMULA_TAG).text = value[1:]
+    elif isinstance(value, str):
+        cell.set('t', 'inlineStr')
+        text = etree.SubElement(etree.SubElement(cell, INLINE_STRING_TAG), TEXT_TAG)
+        text.text = value
+        whitespace(text)
+    elif isinstance(value, bool):
+        cell.set('t', 'b')
+        etree.SubElement(cell, VALUE_TAG).text = '1' if value else '0'
+    elif isinstance(value, NUMERIC_TYPES):
+        cell.set('t', 'n')
+        etree.SubElement(cell, VALUE_TAG).text = safe_string(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        cell.set('t', 'n')
+        etree.SubElement(cell, VALUE_TAG).text = safe_string(to_excel(value, epoch))
+    else:
+        _set_cell_value(cell, str(value), epoch)
+
+
+def _copy_compressed_member(source_archive, output_archive, info):
+    """Copy a member of the source zip to the output zip as it is stored, without decompressing and compressing it."""
+    source_archive.fp.seek(info.header_offset)
+    # The local header ends with the lengths of the file name and of the extra field that follow it
+    name_length, extra_length = struct.unpack(
+        zipfile.structFileHeader, source_archive.fp.read(zipfile.sizeFileHeader)
+    )[-2:]
+    source_archive.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+    output_info = zipfile.ZipInfo(info.filename, info.date_time)
+    output_info.compress_type = info.compress_type
+    output_info.external_attr = info.external_attr
+    # The CRC and sizes are known so they are written in the local header instead of a data descriptor
+    output_info.flag_bits = info.flag_bits & ~ZIP_DATA_DESCRIPTOR_FLAG
+    output_info.CRC = info.CRC
+    output_info.compress_size = info.compress_size
+    output_info.file_size = info.file_size
+    output_info.header_offset = output_archive.fp.tell()
+    output_archive.fp.write(output_info.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        data = source_archive.fp.read(min(remaining, zip_copy_size))
+        if not data:
+            raise zipfile.BadZipFile(f'Truncated member {info.filename}')
+        output_archive.fp.write(data)
+        remaining -= len(data)
+    output_archive.filelist.append(output_info)
+    output_archive.NameToInfo[output_info.filename] = output_info
+    output_archive.start_dir = output_archive.fp.tell()
+
+
+class XlsxPatchWriter(XlsxLxmlParser, XlsxWriter):
+    """
+    XlsxWriter patching the xlsx in place: the edits are kept until the xlsx is saved and only the XML of the
+    worksheets with modified cells is rewritten. All the other parts of the xlsx, including the shared strings, are
+    copied as they are compressed in the xlsx so the formatting of the spreadsheet is preserved. The styles are only
+    rewritten when a date is written in a cell whose style does not format dates. The strings written are stored in
+    the cells.
+    """
+
+    def __init__(self, xls_filename, conf_filename):
+        super().__init__(xls_filename, conf_filename)
+        # Per worksheet, the values to write keyed by row and column
+        self._edits = {}
+        # Per worksheet, the row from which all the existing rows are deleted
+        self._deleted_from = {}
+        # Styles of the xlsx, only parsed when a date style needs to be added, and the date styles added per style
+        self._styles_xml = None
+        self._added_date_styles = {}
+
+    def write_rows(self, rows, remove_when_missing_values=True):
+        worksheet = self.active_worksheet
+        if worksheet is None:
+            raise ValueError('No worksheet is specified!')
+
+        edits = self._edits.setdefault(worksheet, {})
+        for row_data in rows:
+            cells = self._row_cells(worksheet, row_data, remove_when_missing_values)
+            edits.setdefault(row_data['row_num'], {}).update(cells)
+
+    def _delete_rows_from(self, worksheet, row_num):
+        edits = self._edits.get(worksheet, {})
+        for edited_row_num in [edited_row_num for edited_row_num in edits if edited_row_num >= row_num]:
+            del edits[edited_row_num]
+        self._deleted_from[worksheet] = min(row_num, self._deleted_from.get(worksheet, row_num))
+
+    def _patch_worksheet(self, worksheet):
+        """Apply the edits to the XML of the worksheet and return it, or None if none of its cells changed."""
+        with self.workbook.open(self.sheet_paths[worksheet]) as source:
+            tree = etree.parse(source)
+        sheet_data = tree.find(SHEET_DATA_TAG)
+        changed = False
+
+        rows = {}
+        row_num = 0
+        for row in list(sheet_data):
+            row_num = int(float(row.get('r'))) if row.get('r') else row_num + 1
+            if row_num >= self._deleted_from.get(worksheet, row_num + 1):
+                sheet_data.remove(row)
+                changed = True
+            else:
+                rows[row_num] = row
+
+        for row_num, values in sorted(self._edits.get(worksheet, {}).items()):
+            row = rows.get(row_num)
+            if row is None:
+                if all(value is None or value == '' for value in values.values()):
+                    continue
+                row = etree.Element(ROW_TAG, r=str(row_num))
+                following_rows = [other_row_num for other_row_num in rows if other_row_num > row_num]
+                if following_rows:
+                    rows[min(following_rows)].addprevious(row)
+                else:
+                    sheet_data.append(row)
+                rows[row_num] = row
+            changed |= self._patch_row(row, row_num, values)
+
+        if not changed:
+            return None
+        self._update_dimension(tree, rows)
+        return etree.tostring(tree, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+    def _patch_row(self, row, row_num, values):
+        """Write the values, keyed by column, in the cells of the row. Return whether any of the cells changed."""
+        cells = {}
+        column = 0
+        for cell in row:
+            if cell.get('r'):
+                column = column_index_from_string(cell.get('r').rstrip('0123456789'))
+            else:
+                column += 1
+                cell.set('r', f'{get_column_letter(column)}{row_num}')
+            cells[column] = cell
+
+        changed = False
+        for column, value in sorted(values.items()):
+            cell = cells.get(column)
+            if cell is None:
+                if value is None or value == '':
+                    continue
+                cell = etree.Element(CELL_TAG, r=f'{get_column_letter(column)}{row_num}')
+                following_columns = [other_column for other_column in cells if other_column > column]
+                if following_columns:
+                    cells[min(following_columns)].addprevious(cell)
+                else:
+                    row.append(cell)
+                cells[column] = cell
+            else:
+                current_value = self._cell_value(cell, cell.get('r'), {})
+                if current_value == value and type(current_value) is type(value):
+                    continue
+                if current_value is None and value == '':
+                    continue
+            _set_cell_value(cell, value, self.epoch)
+            if isinstance(value, (datetime.date, datetime.time)):
+                cell.set('s', str(self._date_style(int(cell.get('s', 0)), value)))
+            changed = True
+        if changed:
+            # The optional span of the columns of the row might not be accurate anymore
+            row.attrib.pop('spans', None)
+        return changed
+
+    def _date_style(self, style_id, value):
+        """
+        Style formatting the value as a date: the style of the cell if it already does, otherwise a copy of that style
+        with the number format openpyxl uses for the type of the value, which is added to the styles of the xlsx.
+        """
+        if style_id in self.date_styles or self.styles_part is None:
+            return style_id
+        number_format = get_time_format(type(value))
+        if (style_id, number_format) not in self._added_date_styles:
+            if self._styles_xml is None:
+                self._styles_xml = etree.fromstring(self.workbook.read(self.styles_part))
+            number_format_id = self._number_format_id(number_format)
+            cell_styles = self._styles_xml.find(CELL_STYLES_TAG)
+            if cell_styles is None:
+                cell_styles = etree.SubElement(self._styles_xml, CELL_STYLES_TAG)
+            existing_styles = cell_styles.findall(CELL_STYLE_TAG)
+            if style_id < len(existing_styles):
+                date_style = copy.deepcopy(existing_styles[style_id])
+            else:
+                date_style = etree.Element(CELL_STYLE_TAG, numFmtId='0', fontId='0', fillId='0', borderId='0')
+            date_style.set('numFmtId', str(number_format_id))
+            date_style.set('applyNumberFormat', '1')
+            cell_styles.append(date_style)
+            cell_styles.set('count', str(len(existing_styles) + 1))
+            new_style_id = len(existing_styles)
+            self.date_styles.add(new_style_id)
+            self._added_date_styles[(style_id, number_format)] = new_style_id
+        return self._added_date_styles[(style_id, number_format)]
+
+    def _number_format_id(self, number_format):
+        """Id of the number format in the styles of the xlsx, adding it if it is neither built-in nor defined."""
+        if number_format in BUILTIN_FORMATS_REVERSE:
+            return BUILTIN_FORMATS_REVERSE[number_format]
+        number_formats = self._styles_xml.find(NUMBER_FORMATS_TAG)
+        if number_formats is None:
+            number_formats = etree.Element(NUMBER_FORMATS_TAG)
+            self._styles_xml.insert(0, number_formats)
+        custom_formats = dict(
+            (element.get('formatCode'), int(element.get('numFmtId')))
+            for element in number_formats.iterfind(NUMBER_FORMAT_TAG)
+        )
+        if number_format not in custom_formats:
+            number_format_id = max([BUILTIN_FORMATS_MAX_SIZE - 1] + list(custom_formats.values())) + 1
+            etree.SubElement(number_formats, NUMBER_FORMAT_TAG, numFmtId=str(number_format_id),
+                             formatCode=number_format)
+            number_formats.set('count', str(len(custom_formats) + 1))
+            custom_formats[number_format] = number_format_id
+        return custom_formats[number_format]
+
+    @staticmethod
+    def _update_dimension(tree, rows):
+        """Update the range of cells declared by the worksheet to include the cells written."""
+        dimension = tree.find(DIMENSION_TAG)
+        if dimension is None:
+            return
+        min_col, min_row, _, _ = range_boundaries(dimension.get('ref'))
+        max_row = max([row_num for row_num, row in rows.items() if len(row)], default=min_row)
+        max_col = min_col
+        for row in rows.values():
+            if len(row):
+                last_cell = row[-1].get('r')
+                max_col = max(max_col, column_index_from_string(last_cell.rstrip('0123456789')) if last_cell
+                              else len(row))
+        dimension.set('ref', f'{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}')
+
+    def save(self, filename):
+        """
+        Write the patched xlsx to filename, which can be the xlsx edited. The file is replaced once it is complete.
+        The parts that are not patched are copied as they are compressed in the xlsx.
+        """
+        patched_parts = {}
+        for worksheet in set(self._edits) | set(self._deleted_from):
+            patched_part = self._patch_worksheet(worksheet)
+            if patched_part is not None:
+                patched_parts[self.sheet_paths[worksheet]] = patched_part
+        if self._styles_xml is not None:
+            patched_parts[self.styles_part] = etree.tostring(
+                self._styles_xml, xml_declaration=True, encoding='UTF-8', standalone=True
+            )
+
+        output_dir = os.path.dirname(os.path.abspath(filename))
+        with tempfile.NamedTemporaryFile(dir=output_dir, suffix='.xlsx', delete=False) as open_file:
+            tmp_filename = open_file.name
+        try:
+            with zipfile.ZipFile(tmp_filename, 'w') as output_archive:
+                for info in self.workbook.infolist():
+                    output_info = zipfile.ZipInfo(info.filename, info.date_time)
+                    output_info.compress_type = info.compress_type
+                    output_info.external_attr = info.external_attr
+                    if info.filename in patched_parts:
+                        output_archive.writestr(output_info, patched_parts[info.filename])
+                    else:
+                        _copy_compressed_member(self.workbook, output_archive, info)
+            os.replace(tmp_filename, filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
@@ -1,4 +1,9 @@
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 
 import yaml
 from cerberus import Validator
@@ -9,48 +14,138 @@ from requests import HTTPError
 
 from eva_submission import ETC_DIR
 from eva_submission.eload_utils import cast_list
+from eva_submission.resolver import get_resolver
 from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader, EvaXlsxWriter
 
+# Sheets that can contain many rows: they are validated in chunks spread across a pool of processes
+chunked_sheets = ('Sample', 'Files')
+validation_chunk_size = 2000
+
+# Cerberus validators of each sheet, compiled once per process from the validation schema
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+def get_validator(sheet):
+    """
+    Provides the Cerberus validator of the sheet or None if the sheet is not in the validation schema.
+    Validators are not thread safe: _validators_lock needs to be held while using it.
+    """
+    if not _validators:
+        config_file = os.path.join(ETC_DIR, 'eva_project_validation.yaml')
+        with open(config_file) as open_file:
+            validation_schema = yaml.safe_load(open_file)
+        for schema_sheet, sheet_schema in validation_schema.items():
+            validator = Validator({schema_sheet: sheet_schema})
+            validator.allow_unknown = True
+            _validators[schema_sheet] = validator
+    return _validators.get(sheet)
+
+
+def validate_rows(sheet, rows):
+    """
+    Validate the rows of the sheet. Return the Cerberus errors of the sheet and the time spent validating them in
+    seconds.
+    """
+    start = time.perf_counter()
+    with _validators_lock:
+        validator = get_validator(sheet)
+        if validator is None or validator.validate({sheet: rows}):
+            errors = []
+        else:
+            errors = validator.errors.get(sheet, [])
+    return errors, time.perf_counter() - start
+
 
 class EvaXlsxValidator(AppLogger):
 
-    def __init__(self, metadata_file):
+    def __init__(self, metadata_file, snapshot_dir=None):
         self.metadata_file = metadata_file
-        self.reader = EvaXlsxReader(metadata_file)
+        self.reader = EvaXlsxReader(metadata_file, snapshot_dir)
         self.metadata = {}
-        for worksheet in self.reader.reader.valid_worksheets():
-            self.metadata[worksheet] = self.reader._get_all_rows(worksheet)
+        for worksheet in self.reader.valid_worksheets():
+            # The rows of a metadata directory are streamed from its files every time they are iterated over
+            self.metadata[worksheet] = self.reader.worksheet_rows(worksheet)
 
         self.error_list = []
+        # Runs the lookups of NCBI and Ensembl used by the semantic validation
+        self.resolver = get_resolver()
+        # Time in seconds spent in each validation step and in the Cerberus validation of each sheet
+        self.timings = {}
 
     def validate(self):
-        self.cerberus_validation()
-        self.complex_validation()
-        self.semantic_validation()
+        for validation_step in (self.cerberus_validation, self.complex_validation, self.semantic_validation):
+            start = time.perf_counter()
+            validation_step()
+            self.timings[validation_step.__name__] = time.perf_counter() - start
+            self.info(f'{validation_step.__name__} took {self.timings[validation_step.__name__]:.2f}s')
+
+    def _validation_chunks(self):
+        """Yield each sheet with a chunk of its rows. The rows are only read when the chunk is needed."""
+        for sheet, rows in self.metadata.items():
+            rows = iter(rows)
+            chunk_size = validation_chunk_size if sheet in chunked_sheets else None
+            chunk = list(islice(rows, chunk_size))
+            while chunk:
+                yield sheet, chunk
+                chunk = list(islice(rows, chunk_size))
+
+    @staticmethod
+    def _validate_in_pool(chunks, max_workers):
+        """
+        Yield each chunk with its validation results, validated in a pool of processes. Only a few chunks are
+        submitted ahead of the one being yielded so that the rows are not all held in memory at once.
+        """
+        max_pending = 2 * max_workers
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for sheet, rows in chunks:
+                pending.append((sheet, rows, executor.submit(validate_rows, sheet, rows)))
+                if len(pending) >= max_pending:
+                    sheet, rows, future = pending.popleft()
+                    yield sheet, rows, future.result()
+            while pending:
+                sheet, rows, future = pending.popleft()
+                yield sheet, rows, future.result()
 
-    def cerberus_validation(self):
+    def cerberus_validation(self, max_workers=None):
         """
         Leverage cerberus validation to check the format of the metadata.
+        The sheets with many rows are validated in chunks in a pool of max_workers processes, which defaults to the
+        number of CPUs.
         This function adds error statements to the errors attribute
         """
-        config_file = os.path.join(ETC_DIR, 'eva_project_validation.yaml')
-        with open(config_file) as open_file:
-            validation_schema = yaml.safe_load(open_file)
-        validator = Validator(validation_schema)
-        validator.allow_unknown = True
-        validator.validate(self.metadata)
-        for sheet in validator.errors:
-            for error1 in validator.errors[sheet]:
-                for data_pos in error1:
-                    # data_pos is 0 based position in the data that was provided to cerberus
-                    # Convert this position to the excel row number
-                    row_num = data_pos + self.reader.reader.base_row_offset(sheet) + 1
-                    for error2 in error1[data_pos]:
-                        for field_name in error2:
-                            for error3 in error2[field_name]:
-                                self.error_list.append(
-                                    f'In Sheet {sheet}, Row {row_num}, field {field_name}: {error3}'
-                                )
+        nb_cpus = os.cpu_count() or 1
+        max_workers = min(max_workers or nb_cpus, nb_cpus)
+        chunks = self._validation_chunks()
+        # The pool is only used when at least one sheet is split in several chunks and there are several CPUs to
+        # validate them: otherwise the chunks are validated in this process
+        first_chunks = list(islice(chunks, len(self.metadata) + 1))
+        if len(first_chunks) > len(self.metadata) and max_workers > 1:
+            results = self._validate_in_pool(chain(first_chunks, chunks), max_workers)
+        else:
+            results = ((sheet, rows, validate_rows(sheet, rows)) for sheet, rows in chain(first_chunks, chunks))
+
+        # Time spent validating each sheet, summed over its chunks
+        sheet_timings = self.timings.setdefault('cerberus_validation_per_sheet', {})
+        for sheet, rows, (errors, duration) in results:
+            sheet_timings[sheet] = sheet_timings.get(sheet, 0) + duration
+            self._add_cerberus_errors(sheet, rows, errors)
+        for sheet, duration in sheet_timings.items():
+            self.info(f'Cerberus validation of {sheet} took {duration:.2f}s')
+
+    def _add_cerberus_errors(self, sheet, rows, errors):
+        for error1 in errors:
+            for data_pos in error1:
+                # data_pos is 0 based position in the rows that were provided to cerberus
+                # Convert this position to the excel row number
+                row_num = rows[data_pos].get('row_num') or data_pos + self.reader.base_row_offset(sheet) + 1
+                for error2 in error1[data_pos]:
+                    for field_name in error2:
+                        for error3 in error2[field_name]:
+                            self.error_list.append(
+                                f'In Sheet {sheet}, Row {row_num}, field {field_name}: {error3}'
+                            )
 
     def complex_validation(self):
         """
@@ -80,10 +175,27 @@ class EvaXlsxValidator(AppLogger):
         Validation of the data that involve checking its meaning
         This function adds error statements to the errors attribute
         """
+        # The lookups of the references and of the taxonomies are run concurrently
+        references = list(set([row['Reference'] for row in self.metadata['Analysis'] if row['Reference']]))
+        taxid_and_species_list = []
+        for taxid, species in set([(row['Tax Id'], row['Scientific Name']) for row in self.metadata['Sample'] if row['Tax Id']]):
+            try:
+                taxid_and_species_list.append((taxid, species, int(taxid)))
+            except ValueError as e:
+                self.error(str(e))
+                self.error_list.append(str(e))
+        lookups = [
+            ('genbank_assembly_accessions', retrieve_genbank_assembly_accessions_from_ncbi, (reference,))
+            for reference in references
+        ] + [
+            ('scientific_name_from_ensembl', get_scientific_name_from_ensembl, (int_taxid,))
+            for _, _, int_taxid in taxid_and_species_list
+        ]
+        futures = self.resolver.resolve_concurrently(lookups)
+
         # Check if the references can be retrieved
-        references = set([row['Reference'] for row in self.metadata['Analysis'] if row['Reference']])
-        for reference in references:
-            accessions = retrieve_genbank_assembly_accessions_from_ncbi(reference)
+        for reference, future in zip(references, futures):
+            accessions = future.result()
             if len(accessions) == 0:
                 self.error_list.append(f'In Analysis, Reference {reference} did not resolve to any accession')
             elif len(accessions) > 1:
@@ -91,10 +203,9 @@ class EvaXlsxValidator(AppLogger):
 
         correct_taxid_sc_name = {}
         # Check taxonomy scientific name pair
-        taxid_and_species_list = set([(row['Tax Id'], row['Scientific Name']) for row in self.metadata['Sample'] if row['Tax Id']])
-        for taxid, species in taxid_and_species_list:
+        for (taxid, species, _), future in zip(taxid_and_species_list, futures[len(references):]):
             try:
-                scientific_name = get_scientific_name_from_ensembl(int(taxid))
+                scientific_name = future.result()
                 if species != scientific_name:
                     if species.lower() == scientific_name.lower():
                         correct_taxid_sc_name[taxid] = scientific_name
@@ -107,6 +218,7 @@ class EvaXlsxValidator(AppLogger):
             except HTTPError as e:
                 self.error(str(e))
                 self.error_list.append(str(e))
+        self.resolver.log_counters()
         if correct_taxid_sc_name:
             self.warning(f'In some Samples, Taxonomy and scientific names are inconsistent. TaxId - {correct_taxid_sc_name.keys()}')
             self.correct_taxid_scientific_name_in_metadata(correct_taxid_sc_name, self.metadata_file, self.metadata['Sample'])
@@ -1,9 +1,18 @@
+import datetime
 import os
+import shutil
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
+
+from openpyxl import load_workbook
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
 
 from eva_submission import ROOT_DIR
+from eva_submission.xlsx import xlsx_parser_eva
 from eva_submission.xlsx.xlsx_parser import XlsxReader
-from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader
+from eva_submission.xlsx.xlsx_parser_lxml import XlsxLxmlReader
+from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader, EvaXlsxWriter
 
 
 class TestEvaXlsxReader(TestCase):
@@ -16,6 +25,72 @@ class TestEvaXlsxReader(TestCase):
         assert len(rows) == 1
         assert rows[0]['Analysis Title'] == 'Greatest analysis ever'
 
+    def test_parsed_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metadata_file = os.path.join(tmp_dir, 'metadata.xlsx')
+            shutil.copyfile(self.metadata_file, metadata_file)
+            with patch.object(xlsx_parser_eva, 'XlsxReader', side_effect=XlsxReader) as m_reader:
+                reader = EvaXlsxReader(metadata_file)
+                # Each reader gets its own copy of the rows
+                reader.samples[0]['Sample Name'] = 'modified'
+                assert EvaXlsxReader(metadata_file).samples[0]['Sample Name'] == 'S1'
+                m_reader.assert_called_once()
+
+                # Saving the spreadsheet invalidates the parsed content
+                writer = EvaXlsxWriter(metadata_file)
+                project = reader.project
+                project['Project Title'] = 'Modified project'
+                writer.set_project(project)
+                writer.save()
+                assert EvaXlsxReader(metadata_file).project_title == 'Modified project'
+                assert m_reader.call_count == 2
+
+    def test_load_from_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metadata_file = os.path.join(tmp_dir, 'metadata.xlsx')
+            snapshot_dir = os.path.join(tmp_dir, 'snapshots')
+            shutil.copyfile(self.metadata_file, metadata_file)
+            samples = EvaXlsxReader(metadata_file, snapshot_dir).samples
+            # The snapshot is only written in the snapshot directory, keyed by the md5 of the spreadsheet
+            spreadsheet_md5 = xlsx_parser_eva._spreadsheet_md5(metadata_file)
+            assert os.listdir(snapshot_dir) == [spreadsheet_md5 + '.json']
+            assert sorted(os.listdir(tmp_dir)) == ['metadata.xlsx', 'snapshots']
+
+            # Another process loads the snapshot without parsing the spreadsheet
+            xlsx_parser_eva._parsed_spreadsheets.clear()
+            with patch.object(xlsx_parser_eva, 'XlsxReader') as m_reader:
+                reader = EvaXlsxReader(metadata_file, snapshot_dir)
+                assert reader.samples == samples
+                assert reader.base_row_offset('Sample') == 3
+                m_reader.assert_not_called()
+
+            # The snapshot is not used once the content of the spreadsheet changed
+            xlsx_parser_eva._parsed_spreadsheets.clear()
+            with open(metadata_file, 'ab') as open_file:
+                open_file.write(b'\0')
+            with patch.object(xlsx_parser_eva, 'XlsxReader', side_effect=XlsxReader) as m_reader:
+                EvaXlsxReader(metadata_file, snapshot_dir)
+                m_reader.assert_called_once()
+
+    def test_snapshot_dates(self):
+        parsed_spreadsheet = xlsx_parser_eva.ParsedSpreadsheet(
+            ['Project'], {'Project': 2},
+            {'Project': [{'Hold Date': datetime.datetime(2021, 1, 1), 'Day': datetime.date(2021, 1, 2), 'row_num': 3}]}
+        )
+        snapshot_key = xlsx_parser_eva._snapshot_key('0' * 32)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xlsx_parser_eva.save_snapshot(tmp_dir, snapshot_key, parsed_spreadsheet)
+            loaded_spreadsheet = xlsx_parser_eva.load_snapshot(tmp_dir, snapshot_key)
+        assert loaded_spreadsheet.get_rows('Project') == parsed_spreadsheet.get_rows('Project')
+        assert loaded_spreadsheet.base_row_offsets['Project'] == 2
+
+    def test_no_snapshot_without_snapshot_dir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metadata_file = os.path.join(tmp_dir, 'metadata.xlsx')
+            shutil.copyfile(self.metadata_file, metadata_file)
+            EvaXlsxReader(metadata_file)
+            assert os.listdir(tmp_dir) == ['metadata.xlsx']
+
 
 class TestXlsxReader(TestCase):
 
@@ -76,4 +151,108 @@ class TestXlsxReader(TestCase):
             'row_num': 4
         }
 
+    def test_next_row_single_pass(self):
+        self.xls_reader.active_worksheet = 'Sample'
+        with patch.object(ReadOnlyWorksheet, 'iter_rows', autospec=True,
+                          side_effect=ReadOnlyWorksheet.iter_rows) as m_iter_rows:
+            rows = list(self.xls_reader)
+            # The worksheet is only streamed once
+            m_iter_rows.assert_called_once()
+        assert len(rows) == 100
+        assert [row['Sample Name'] for row in rows[:2]] == ['S1', 'S2']
+        assert [row['row_num'] for row in rows[:2]] == [4, 5]
+        # The remaining rows continue from the last row read
+        assert self.xls_reader.get_rows() == []
+
+
+class TestXlsxLxmlReader(TestCase):
+
+    resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+    eva_xls_reader_conf = os.path.join(resources_dir, 'test_metadata_fields.yaml')
+    eva_project_conf = os.path.join(ROOT_DIR, 'eva_submission', 'etc', 'eva_project_conf.yaml')
+
+    def read_all_rows(self, reader_class, metadata_file, conf):
+        reader = reader_class(metadata_file, conf)
+        rows = {}
+        for worksheet in reader.valid_worksheets():
+            reader.active_worksheet = worksheet
+            rows[worksheet] = reader.get_rows()
+        reader.close()
+        return rows
+
+    def test_same_rows_as_openpyxl(self):
+        for metadata_file in ['metadata.xlsx', 'metadata_2_analysis.xlsx', 'metadata_2_analysis_same_samples.xlsx']:
+            metadata_file = os.path.join(self.resources_dir, metadata_file)
+            for conf in [self.eva_xls_reader_conf, self.eva_project_conf]:
+                lxml_rows = self.read_all_rows(XlsxLxmlReader, metadata_file, conf)
+                assert lxml_rows == self.read_all_rows(XlsxReader, metadata_file, conf)
+                assert lxml_rows
+
+    def test_same_typed_values_as_openpyxl(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metadata_file = os.path.join(tmp_dir, 'metadata.xlsx')
+            workbook = load_workbook(os.path.join(self.resources_dir, 'metadata.xlsx'))
+            worksheet = workbook['Sample']
+            worksheet['A4'] = datetime.datetime(2023, 1, 2, 3, 4)
+            worksheet['B4'] = True
+            worksheet['C4'] = 1.5
+            worksheet['D4'] = '=CONCATENATE("S", 1)'
+            worksheet['E4'] = 'Text with _x000D_ escape'
+            workbook.save(metadata_file)
+
+            lxml_rows = self.read_all_rows(XlsxLxmlReader, metadata_file, self.eva_project_conf)
+            assert lxml_rows == self.read_all_rows(XlsxReader, metadata_file, self.eva_project_conf)
+            assert datetime.datetime(2023, 1, 2, 3, 4) in lxml_rows['Sample'][0].values()
+
+    def test_select_backend(self):
+        metadata_file = os.path.join(self.resources_dir, 'metadata.xlsx')
+        with patch.dict(xlsx_parser_eva.cfg.content, {'metadata_reader': 'lxml'}), \
+                patch.object(XlsxLxmlReader, 'close', autospec=True, side_effect=XlsxLxmlReader.close) as m_close:
+            parsed_spreadsheet = xlsx_parser_eva.ParsedSpreadsheet.from_xlsx(metadata_file)
+            m_close.assert_called_once()
+        assert parsed_spreadsheet.sheets['Sample'][0]['Sample Name'] == 'S1'
+
+
+class TestMetadataDirectoryReader(TestCase):
+
+    resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+
+    @staticmethod
+    def rows_without_row_num(reader, worksheet):
+        return [dict((key, value) for key, value in row.items() if key != 'row_num')
+                for row in reader.iter_rows(worksheet)]
+
+    def test_same_rows_as_spreadsheet(self):
+        spreadsheet_reader = EvaXlsxReader(os.path.join(self.resources_dir, 'metadata.xlsx'))
+        for metadata_dir in ['metadata_tsv', 'metadata_json']:
+            reader = EvaXlsxReader(os.path.join(self.resources_dir, metadata_dir))
+            assert reader.valid_worksheets() == spreadsheet_reader.valid_worksheets()
+            for worksheet in reader.valid_worksheets():
+                assert self.rows_without_row_num(reader, worksheet) == \
+                       self.rows_without_row_num(spreadsheet_reader, worksheet)
+            # Integers are converted from the text of the files
+            assert reader.project['Tax ID'] == 9606
+            assert len(list(reader.iter_samples_of_analysis('GAE'))) == 100
+
+    def test_rows_streamed(self):
+        reader = EvaXlsxReader(os.path.join(self.resources_dir, 'metadata_tsv'))
+        samples = reader.worksheet_rows('Sample')
+        assert not isinstance(samples, list)
+        # The rows are numbered like the lines of the file and can be iterated over several times
+        assert [sample['row_num'] for sample in samples][:2] == [2, 3]
+        assert len(list(samples)) == 100
 
+    def test_converted_values(self):
+        with tempfile.TemporaryDirectory() as metadata_dir:
+            with open(os.path.join(metadata_dir, 'Sample.tsv'), 'w') as open_file:
+                open_file.write('Sample Name\tTax Id\tcollection_date\n')
+                open_file.write('S1\t9606\t2023-01-02\n')
+                open_file.write('\t\t\n')
+                open_file.write('S3\tHuman\tlast week\n')
+            reader = EvaXlsxReader(metadata_dir)
+            assert reader.valid_worksheets() == ['Sample']
+            samples = reader.samples
+            assert [sample['row_num'] for sample in samples] == [2, 4]
+            assert (samples[0]['Tax Id'], samples[0]['collection_date']) == (9606, datetime.datetime(2023, 1, 2))
+            # Invalid values are left for the validation to report
+            assert (samples[1]['Tax Id'], samples[1]['collection_date']) == ('Human', 'last week')
@@ -1,8 +1,17 @@
+import datetime
 import os
+import shutil
+import tempfile
+import zipfile
 from unittest import TestCase
+from unittest.mock import patch
+
+from openpyxl import load_workbook
+from openpyxl.cell import Cell
 
 from eva_submission import ROOT_DIR
-from eva_submission.xlsx.xlsx_parser_eva import XlsxWriter, EvaXlsxReader
+from eva_submission.xlsx.xlsx_parser_eva import XlsxWriter, EvaXlsxReader, EvaXlsxWriter, ParsedSpreadsheet
+from eva_submission.xlsx.xlsx_parser_lxml import XlsxPatchWriter
 
 
 class TestXlsxWriter(TestCase):
@@ -52,3 +61,148 @@ class TestXlsxWriter(TestCase):
         reader = EvaXlsxReader(self.metadata_copy_file)
         assert len(reader.samples) == 50
         assert reader.samples[0]['Sample Accession'] == 'SABCDEFGHIJKLMNOP1'
+
+    def test_write_rows(self):
+        self.xls_writer.active_worksheet = 'Sample'
+        rows = [
+            {'Sample Name': 'S1', 'Title': 'Sample 1', 'row_num': 4},
+            {'Sample Name': 'S2', 'Sample Accession': 'SABCDEF2', 'row_num': 5}
+        ]
+        with patch.object(Cell, '_bind_value', autospec=True, side_effect=Cell._bind_value) as m_bind_value:
+            self.xls_writer.write_rows(rows, remove_when_missing_values=False)
+            # Only the modified cell is written
+            m_bind_value.assert_called_once()
+        self.xls_writer.save(self.metadata_copy_file)
+        reader = EvaXlsxReader(self.metadata_copy_file)
+        assert reader.samples[0] == self.reader.samples[0]
+        assert reader.samples[1]['Sample Accession'] == 'SABCDEF2'
+
+    def test_write_rows_missing_required(self):
+        self.xls_writer.active_worksheet = 'Project'
+        with self.assertRaises(ValueError):
+            self.xls_writer.write_rows([{'Project Title': 'Modified project', 'row_num': 2}])
+        # None of the cells of the row are written
+        assert self.xls_writer.workbook['Project'].cell(row=2, column=1).value == 'Greatest project ever'
+
+
+class TestXlsxPatchWriter(TestCase):
+
+    resources_folder = os.path.join(ROOT_DIR, 'tests', 'resources')
+    metadata_file = os.path.join(resources_folder, 'metadata.xlsx')
+    eva_project_conf = os.path.join(ROOT_DIR, 'eva_submission', 'etc', 'eva_project_conf.yaml')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.metadata_copy_file = os.path.join(self.tmp_dir, 'metadata.xlsx')
+        shutil.copyfile(self.metadata_file, self.metadata_copy_file)
+        self.reader = EvaXlsxReader(self.metadata_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_samples(self, writer_class, output_file):
+        writer = writer_class(self.metadata_file, self.eva_project_conf)
+        writer.active_worksheet = 'Sample'
+        samples = self.reader.samples[:30]
+        for sample in samples:
+            sample['Sample Accession'] = 'SAMEA' + str(sample['row_num'])
+        writer.set_rows(samples, empty_remaining_rows=True)
+        writer.update_rows([{'row_num': 4, 'Sample Name': 'Sample 4', 'Tax Id': 9606, 'Scientific Name': ' Homo sapiens '}])
+        writer.save(output_file)
+        return ParsedSpreadsheet.from_xlsx(output_file).sheets
+
+    def test_same_rows_as_openpyxl(self):
+        openpyxl_file = os.path.join(self.tmp_dir, 'metadata_openpyxl.xlsx')
+        patched_sheets = self.write_samples(XlsxPatchWriter, self.metadata_copy_file)
+        assert patched_sheets == self.write_samples(XlsxWriter, openpyxl_file)
+        assert len(patched_sheets['Sample']) == 30
+        assert patched_sheets['Sample'][1]['Sample Accession'] == 'SAMEA5'
+
+    def test_only_modified_worksheets_rewritten(self):
+        self.write_samples(XlsxPatchWriter, self.metadata_copy_file)
+        with zipfile.ZipFile(self.metadata_file) as original, zipfile.ZipFile(self.metadata_copy_file) as patched:
+            assert original.namelist() == patched.namelist()
+            modified_parts = [name for name in original.namelist() if original.read(name) != patched.read(name)]
+        writer = XlsxPatchWriter(self.metadata_file, self.eva_project_conf)
+        assert modified_parts == [writer.sheet_paths['Sample']]
+
+    def test_unchanged_values(self):
+        writer = XlsxPatchWriter(self.metadata_copy_file, self.eva_project_conf)
+        writer.active_worksheet = 'Project'
+        writer.update_rows([self.reader.project])
+        writer.save(self.metadata_copy_file)
+        with zipfile.ZipFile(self.metadata_file) as original, zipfile.ZipFile(self.metadata_copy_file) as patched:
+            for name in original.namelist():
+                assert original.read(name) == patched.read(name)
+
+    def test_unmodified_parts_copied_compressed(self):
+        # Compressed with another level than the one used by zipfile so that recompressing would change them
+        recompressed_file = os.path.join(self.tmp_dir, 'recompressed.xlsx')
+        with zipfile.ZipFile(self.metadata_file) as original, \
+                zipfile.ZipFile(recompressed_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as recompressed:
+            for info in original.infolist():
+                recompressed.writestr(info, original.read(info), compresslevel=1)
+        writer = XlsxPatchWriter(recompressed_file, self.eva_project_conf)
+        writer.active_worksheet = 'Project'
+        writer.update_rows([dict(self.reader.project, **{'Project Title': 'Patched project'})])
+        writer.save(self.metadata_copy_file)
+
+        with zipfile.ZipFile(recompressed_file) as original, zipfile.ZipFile(self.metadata_copy_file) as patched:
+            assert patched.testzip() is None
+            for info in original.infolist():
+                patched_info = patched.getinfo(info.filename)
+                if info.filename != writer.sheet_paths['Project']:
+                    assert (patched_info.CRC, patched_info.compress_size) == (info.CRC, info.compress_size)
+        assert EvaXlsxReader(self.metadata_copy_file).project['Project Title'] == 'Patched project'
+
+    def test_write_dates(self):
+        writer = XlsxPatchWriter(self.metadata_copy_file, self.eva_project_conf)
+        writer.active_worksheet = 'Project'
+        hold_date = datetime.datetime(2024, 5, 17, 10, 30)
+        writer.update_rows([dict(self.reader.project, **{'Hold Date': hold_date})])
+        writer.save(self.metadata_copy_file)
+
+        # Dates are written as serial numbers in a style formatting them as dates, like openpyxl does
+        workbook = load_workbook(self.metadata_copy_file)
+        hold_date_cell = next(
+            cell for cell in workbook['Project'][2] if workbook['Project'].cell(1, cell.column).value == 'Hold Date'
+        )
+        assert hold_date_cell.value == hold_date
+        assert hold_date_cell.is_date
+        assert hold_date_cell.number_format == 'yyyy-mm-dd h:mm:ss'
+        with zipfile.ZipFile(self.metadata_copy_file) as patched:
+            assert b't="d"' not in patched.read(writer.sheet_paths['Project'])
+        assert EvaXlsxReader(self.metadata_copy_file).project['Hold Date'] == hold_date
+
+
+class TestMetadataDirectoryWriter(TestCase):
+
+    resources_folder = os.path.join(ROOT_DIR, 'tests', 'resources')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_set_and_update_rows(self):
+        for metadata_dir in ['metadata_tsv', 'metadata_json']:
+            output_dir = os.path.join(self.tmp_dir, metadata_dir)
+            reader = EvaXlsxReader(os.path.join(self.resources_folder, metadata_dir))
+            samples = list(reader.iter_rows('Sample'))[:30]
+            for sample in samples:
+                sample['Sample Accession'] = 'SAMEA' + sample['Sample Name']
+            writer = EvaXlsxWriter(os.path.join(self.resources_folder, metadata_dir), output_dir)
+            writer.set_samples(samples)
+            writer.update_samples([{'row_num': samples[1]['row_num'], 'Sample Name': 'Sample 2', 'Tax Id': 9606}])
+            writer.save()
+
+            output_reader = EvaXlsxReader(output_dir)
+            output_samples = output_reader.samples
+            assert len(output_samples) == 30
+            assert output_samples[0]['Sample Accession'] == 'SAMEAS1'
+            assert (output_samples[1]['Sample Name'], output_samples[1]['Tax Id']) == ('Sample 2', 9606)
+            # Values not provided in the update are removed
+            assert output_samples[1]['Scientific Name'] is None
+            # The worksheets that were not modified are copied
+            assert output_reader.project == reader.project
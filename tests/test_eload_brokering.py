@@ -236,3 +236,20 @@ Cezard T, Cunningham F, Hunt SE, Koylass B, Kumar N, Saunders G, Shen A, Silva A
             {'Analysis Alias': 'GAE2', 'File Name': 'ELOAD_3/GAE2.vcf.gz', 'File Type': 'vcf', 'MD5': None, 'row_num': 4},
             {'Analysis Alias': 'GAE2', 'File Name': 'ELOAD_3/GAE2.vcf.gz.csi', 'File Type': 'csi', 'MD5': None, 'row_num': 5}
         ]
+
+    def test_update_metadata_directory_streams_samples(self):
+        metadata_dir = os.path.join(self.eload.eload_dir, 'metadata_tsv')
+        ena_metadata_dir = os.path.join(self.eload.eload_dir, 'metadata_for_brokering')
+        shutil.copytree(os.path.join(self.resources_folder, 'metadata_tsv'), metadata_dir)
+        self.eload.eload_cfg.set('brokering', 'analyses', value={})
+        self.eload.eload_cfg.set('brokering', 'Biosamples', 'Samples', value={'S1': 'SAMEA0001', 'S2': 'SAMEA0002'})
+        # The samples are streamed to the writer without loading the whole worksheet
+        with patch.object(EvaXlsxReader, 'samples', new_callable=PropertyMock, side_effect=AssertionError):
+            self.eload.update_metadata_spreadsheet(metadata_dir, ena_metadata_dir)
+
+        samples = list(EvaXlsxReader(ena_metadata_dir).iter_rows('Sample'))
+        assert len(samples) == 100
+        assert [(sample['Sample ID'], sample['Sample Accession']) for sample in samples[:3]] == [
+            ('S1', 'SAMEA0001'), ('S2', 'SAMEA0002'), (None, None)
+        ]
+        assert samples[2]['Sample Name'] == 'S3'
@@ -75,6 +75,21 @@ class TestEloadPreparation(TestCase):
         # Check that the metadata spreadsheet is in the config file
         assert self.eload.eload_cfg.query('submission', 'metadata_spreadsheet') == metadata
 
+    def test_detect_submitted_metadata_directory(self):
+        vcfs = self.create_vcfs()
+        metadata_dir = os.path.join(self.eload.eload_dir, '10_submitted', 'metadata_file')
+        for worksheet_file in glob.glob(os.path.join(self.resources_folder, 'metadata_tsv', '*.tsv')):
+            shutil.copy(worksheet_file, metadata_dir)
+        # The config is shared with the other tests which expect the metadata to be a spreadsheet
+        self.addCleanup(self.eload.eload_cfg.pop, 'submission', 'metadata_spreadsheet')
+
+        self.eload.detect_submitted_metadata()
+        self.eload.check_submitted_filenames()
+        assert self.eload.eload_cfg.query('submission', 'metadata_spreadsheet') == metadata_dir
+        # The submitted VCFs are written in the TSV of the files
+        reader = EvaXlsxReader(metadata_dir)
+        assert sorted(row['File Name'] for row in reader.files) == sorted(os.path.basename(vcf) for vcf in vcfs)
+
     def test_detect_metadata_attributes(self):
         self.create_vcfs()
         metadata = self.create_metadata()
@@ -100,6 +115,7 @@ class TestEloadPreparation(TestCase):
 
     def test_replace_values_in_metadata(self):
         metadata = self.create_metadata()
+        self.eload.eload_cfg.set('submission', 'metadata_spreadsheet', value=metadata)
 
         reader = EvaXlsxReader(metadata)
         assert reader.project['Tax ID'] == 9606
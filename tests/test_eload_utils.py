@@ -1,5 +1,9 @@
 import os
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
+
+import pysam
 
 from eva_submission.eload_utils import check_existing_project, detect_vcf_aggregation
 
@@ -22,3 +26,28 @@ class TestEloadUtils(TestCase):
         assert detect_vcf_aggregation(
             os.path.join(self.resources_folder, 'vcf_files', 'file_undetermined_aggregation.vcf')
         ) is None
+
+    def test_detect_vcf_aggregation_without_profile(self):
+        # Only the first lines are read when the VcfProfile of the file has not already been computed
+        with patch('eva_submission.vcf_profile.VcfProfile.from_vcf', side_effect=AssertionError) as m_from_vcf:
+            assert detect_vcf_aggregation(
+                os.path.join(self.resources_folder, 'vcf_files', 'file_no_aggregation.vcf')
+            ) == 'none'
+        m_from_vcf.assert_not_called()
+
+    def test_detect_vcf_aggregation_sampled_through_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vcf_file = os.path.join(tmp_dir, 'test.vcf')
+            with open(vcf_file, 'w') as open_file:
+                open_file.write('##fileformat=VCFv4.3\n##contig=<ID=1,length=1000>\n##contig=<ID=2,length=1000>\n')
+                open_file.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n')
+                for position in range(1, 1000, 50):
+                    open_file.write(f'1\t{position}\t.\tA\tT\t.\tPASS\t.\tGT\t0/1\n')
+                # The genotypes are missing from the second contig only
+                for position in range(1, 1000, 50):
+                    open_file.write(f'2\t{position}\t.\tA\tT\t.\tPASS\t.\tDP\t10\n')
+            compressed_vcf = pysam.tabix_index(vcf_file, preset='vcf')
+
+            # The first lines are not enough to find the missing genotypes
+            assert detect_vcf_aggregation(compressed_vcf) == 'none'
+            assert detect_vcf_aggregation(compressed_vcf, nb_offsets=3) is None
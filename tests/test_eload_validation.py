@@ -1,4 +1,9 @@
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
 from copy import deepcopy
 from unittest import TestCase
 from unittest.mock import patch
@@ -80,6 +85,48 @@ class TestEloadValidation(TestCase):
         assert nb_error == 8
         assert nb_warning == 1
 
+    def test_parse_vcf_check_db_report(self):
+        vcf_check_db_report = os.path.join(self.resources_folder, 'validations', 'failed_file.vcf.errors.db')
+        vcf_check_report = os.path.join(self.resources_folder, 'validations', 'failed_file.vcf.errors.txt')
+        db_report_results = self.validation.parse_vcf_check_db_report(vcf_check_db_report, vcf_check_report)
+        # The database report gives the same results as the text report
+        assert db_report_results == self.validation.parse_vcf_check_report(vcf_check_report)
+        valid, error_list, nb_error, nb_warning = db_report_results
+        assert valid is False
+        assert error_list[0] == 'Line 6: Error in ALT metadata.'
+        assert nb_error == 8
+        assert nb_warning == 1
+
+    def test_parse_vcf_check_db_report_max_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vcf_check_db_report = os.path.join(tmp_dir, 'failed_file.vcf.errors.db')
+            shutil.copyfile(os.path.join(self.resources_folder, 'validations', 'failed_file.vcf.errors.db'),
+                            vcf_check_db_report)
+            with closing(sqlite3.connect(vcf_check_db_report)) as connection:
+                connection.executemany(
+                    'INSERT INTO "Error" (typeid, line, message, severity) VALUES (?, ?, ?, ?)',
+                    [('ebi::vcf::BodySectionError', line, 'Error in body.', 1) for line in range(14, 20)]
+                )
+                connection.commit()
+            valid, error_list, nb_error, nb_warning = self.validation.parse_vcf_check_db_report(vcf_check_db_report)
+            assert valid is False
+            assert len(error_list) == 10
+            assert error_list[-1] == 'Line 15: Error in body.'
+            assert nb_error == 14
+            assert nb_warning == 1
+
+    def test_parse_vcf_check_db_report_different_conclusion(self):
+        vcf_check_db_report = os.path.join(self.resources_folder, 'validations', 'failed_file.vcf.errors.db')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vcf_check_report = os.path.join(tmp_dir, 'failed_file.vcf.errors.txt')
+            with open(vcf_check_report, 'w') as open_file:
+                open_file.write('According to the VCF specification, the input file is valid')
+            assert self.validation.parse_vcf_check_db_report(vcf_check_db_report, vcf_check_report) is None
+
+    def test_parse_vcf_check_db_report_unreadable(self):
+        vcf_check_report = os.path.join(self.resources_folder, 'validations', 'failed_file.vcf.errors.txt')
+        assert self.validation.parse_vcf_check_db_report(vcf_check_report) is None
+
     def test_parse_bcftools_norm_report(self):
         normalisation_log = os.path.join(self.resources_folder, 'validations', 'bcftools_norm.log')
         expected = ([], 2, 0, 1, 0)
@@ -255,3 +302,116 @@ Structural variant check:
         expected = {'analyses': {'analysis_alias': {'vcf_files': ['normalised_test.vcf.gz']}},
                     'metadata_spreadsheet': '/path/to/the/spreadsheet'}
         assert self.validation.eload_cfg.query('validation', 'valid') == expected
+
+    def test_validate_incremental(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vcf_file = os.path.join(tmp_dir, 'test.vcf')
+            with open(vcf_file, 'w') as open_file:
+                open_file.write('##fileformat=VCFv4.3\n')
+            self.validation.eload_cfg.set('submission', 'analyses', value={
+                'analysis_alias': {'vcf_files': [vcf_file], 'assembly_fasta': 'genome.fa'}
+            })
+
+            def collect_vcf_check_results(vcf_files, output_dir):
+                for vcf_file in vcf_files:
+                    self.validation._set_file_results('vcf_check', vcf_file, {'error_list': [], 'nb_error': 0})
+
+            with patch.object(EloadValidation, '_get_tool_version', return_value='1.0'), \
+                    patch.object(EloadValidation, '_run_validation_workflow', return_value=None) as m_run, \
+                    patch.object(EloadValidation, '_collect_vcf_check_results',
+                                 side_effect=collect_vcf_check_results) as m_collect, \
+                    patch.object(EloadValidation, 'mark_valid_files_and_metadata'):
+                self.validation.validate(['vcf_check'])
+                m_run.assert_called_once_with(['vcf_check'], [vcf_file], None)
+                m_collect.assert_called_once_with([vcf_file], None)
+                results = self.validation.eload_cfg.query('validation', 'vcf_check', 'files', 'test.vcf')
+                assert results['fingerprint']['size'] == 21
+
+                # Unchanged file: the previous results are reused
+                m_run.reset_mock()
+                m_collect.reset_mock()
+                self.validation.validate(['vcf_check'])
+                m_run.assert_not_called()
+                m_collect.assert_called_once_with([], None)
+                assert self.validation.eload_cfg.query('validation', 'vcf_check', 'files', 'test.vcf') == results
+
+                # Full revalidation runs the workflow again
+                self.validation.validate(['vcf_check'], incremental=False)
+                m_run.assert_called_once_with(['vcf_check'], [vcf_file], None)
+
+                # Modified file: validated again
+                m_run.reset_mock()
+                with open(vcf_file, 'a') as open_file:
+                    open_file.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+                self.validation._fingerprints = {}
+                self.validation.validate(['vcf_check'])
+                m_run.assert_called_once_with(['vcf_check'], [vcf_file], None)
+
+    def test_validate_python_checks_during_workflow(self):
+        workflow_started = threading.Event()
+
+        def run_validation_workflow(validation_tasks, vcf_files, fail_fast):
+            workflow_started.set()
+            return None
+
+        def validate_metadata_format():
+            # The workflow is started before the Python checks complete
+            assert workflow_started.wait(timeout=10)
+            return {'errors': [], 'pass': True}
+
+        with patch.object(EloadValidation, '_run_validation_workflow', side_effect=run_validation_workflow), \
+                patch.object(EloadValidation, '_validate_metadata_format', side_effect=validate_metadata_format), \
+                patch.object(EloadValidation, '_validate_genotype_aggregation', return_value={'errors': [], 'pass': True}), \
+                patch.object(EloadValidation, '_get_vcf_files_to_validate', return_value={'vcf_check': ['test.vcf']}), \
+                patch.object(EloadValidation, '_collect_validation_workflow_results') as m_collect, \
+                patch.object(EloadValidation, 'mark_valid_files_and_metadata'):
+            self.validation.validate(['metadata_check', 'aggregation_check', 'vcf_check'])
+            m_collect.assert_called_once_with(None, ['vcf_check'], {'vcf_check': ['test.vcf']})
+        assert self.validation.eload_cfg.query('validation', 'metadata_check') == {'errors': [], 'pass': True}
+        assert self.validation.eload_cfg.query('validation', 'aggregation_check') == {'errors': [], 'pass': True}
+
+    def test_validate_workflow_failure_keeps_results(self):
+        previous_vcf_check = {'files': {'test.vcf': {'nb_error': 0, 'fingerprint': {'size': 21}}}, 'pass': True}
+        self.validation.eload_cfg.set('validation', 'vcf_check', value=deepcopy(previous_vcf_check))
+        with patch.object(EloadValidation, '_run_validation_workflow', side_effect=OSError('Nextflow failed')), \
+                patch.object(EloadValidation, '_validate_metadata_format', return_value={'errors': [], 'pass': True}), \
+                patch.object(EloadValidation, '_get_vcf_files_to_validate', return_value={'vcf_check': ['test.vcf']}), \
+                patch.object(EloadValidation, '_collect_validation_workflow_results') as m_collect:
+            with self.assertRaises(OSError):
+                self.validation.validate(['metadata_check', 'vcf_check'])
+            m_collect.assert_not_called()
+        # The results of the Python checks are recorded and the previous results of the workflow tasks are kept
+        assert self.validation.eload_cfg.query('validation', 'metadata_check') == {'errors': [], 'pass': True}
+        assert self.validation.eload_cfg.query('validation', 'vcf_check') == previous_vcf_check
+
+    def test_validate_python_check_failure(self):
+        workflow_released = threading.Event()
+
+        def run_validation_workflow(validation_tasks, vcf_files, fail_fast):
+            workflow_released.wait(timeout=10)
+            return None
+
+        with patch.object(EloadValidation, '_run_validation_workflow', side_effect=run_validation_workflow), \
+                patch.object(EloadValidation, '_validate_metadata_format', side_effect=ValueError('Invalid metadata')), \
+                patch.object(EloadValidation, '_get_vcf_files_to_validate', return_value={'vcf_check': ['test.vcf']}):
+            # The error is raised without waiting for the workflow to complete
+            with self.assertRaises(ValueError):
+                self.validation.validate(['metadata_check', 'vcf_check'])
+            assert not workflow_released.is_set()
+            workflow_released.set()
+
+    def test_collect_vcf_check_results_truncated(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            os.makedirs(os.path.join(output_dir, 'vcf_format'))
+            reason = 'Stopped after 10 errors (fail fast set to 10)'
+            with open(os.path.join(output_dir, 'vcf_format', 'test.vcf.truncated'), 'w') as open_file:
+                open_file.write(reason + '\n')
+            self.validation._collect_vcf_check_results(['path/to/test.vcf'], output_dir)
+
+        results = self.validation.eload_cfg.query('validation', 'vcf_check', 'files', 'test.vcf')
+        assert results['truncated'] == reason
+        assert results['error_list'] == [reason]
+        # Truncated results are not kept for the next validation
+        assert 'fingerprint' not in results
+        assert self.validation.eload_cfg.query('validation', 'vcf_check', 'truncated') is True
+        assert not self.validation.eload_cfg.query('validation', 'vcf_check', 'pass')
@@ -0,0 +1,36 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from eva_submission.persistent_cache import PersistentCache
+
+
+class TestPersistentCache(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'cache', 'cache.sqlite')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_get_set(self):
+        cache = PersistentCache(self.db_path, table='test')
+        assert cache.get('key') is None
+        assert cache.get('key', default='default') == 'default'
+        cache.set('key', {'a': [1, 2]})
+        assert cache.get('key') == {'a': [1, 2]}
+        # Another instance reads the same database
+        assert PersistentCache(self.db_path, table='test').get('key') == {'a': [1, 2]}
+        cache.delete('key')
+        assert cache.get('key') is None
+
+    def test_expired_entry(self):
+        cache = PersistentCache(self.db_path, table='test', ttl=10)
+        with patch('eva_submission.persistent_cache.time.time', return_value=1000):
+            cache.set('key', 'value')
+        with patch('eva_submission.persistent_cache.time.time', return_value=1005):
+            assert cache.get('key') == 'value'
+        with patch('eva_submission.persistent_cache.time.time', return_value=1011):
+            assert cache.get('key') is None
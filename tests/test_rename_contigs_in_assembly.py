@@ -1,7 +1,15 @@
 import os
+import shutil
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 
-from eva_submission.steps.rename_contigs_from_insdc_in_assembly import RenameContigsInAssembly
+import pysam
+
+from eva_submission.persistent_cache import PersistentCache
+from eva_submission.steps.custom_genome_store import CustomGenomeStore
+from eva_submission.steps.rename_contigs_from_insdc_in_assembly import RenameContigsInAssembly, \
+    get_fasta_header_positions
 
 
 class TestRenameContigs(TestCase):
@@ -31,4 +39,140 @@ class TestRenameContigs(TestCase):
         assembly_custom = os.path.join(self.resources, 'GCA_000002945.2', 'GCA_000002945.2_custom.fa')
         self.rename.rewrite_changing_names(assembly_custom)
 
+    def test_rename_genome_without_network(self):
+        self.rename.contig_alias_map = {}
+        assembly_fasta_path = os.path.join(self.resources, 'GCA_000002945.2', 'GCA_000002945.2.fa')
+        with open(assembly_fasta_path) as open_file:
+            expected_lines = [
+                '>' + {'CU329670.1': 'I', 'CU329671.1': 'II', 'CU329672.1': 'III', 'X54421.1': 'MT',
+                       'FP565355.1': 'MTR'}.get(line.split()[0][1:], line.split()[0][1:]) + '\n'
+                if line.startswith('>') else line
+                for line in open_file
+            ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Without a fasta index
+            fasta_copy = os.path.join(tmp_dir, 'genome.fa')
+            shutil.copy(assembly_fasta_path, fasta_copy)
+            self.rename.assembly_fasta_path = fasta_copy
+            assembly_custom = os.path.join(tmp_dir, 'genome_custom.fa')
+            self.rename.rewrite_changing_names(assembly_custom)
+            with open(assembly_custom) as open_file:
+                assert open_file.readlines() == expected_lines
+
+            # With a fasta index
+            pysam.faidx(fasta_copy)
+            assert len(get_fasta_header_positions(fasta_copy)) == 6
+            os.remove(assembly_custom)
+            del self.rename.fasta_header_positions
+            self.rename.rewrite_changing_names(assembly_custom)
+            with open(assembly_custom) as open_file:
+                assert open_file.readlines() == expected_lines
+
+    def test_contigs_from_header_and_index(self):
+        input_vcf = os.path.join(self.resources, 'vcf_files', 'vcf_file_ASM294v2.vcf')
+        all_contigs = {'I', 'II', 'III', 'MTR', 'MT'}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vcf_with_header = os.path.join(tmp_dir, 'vcf_with_contig_header.vcf')
+            with open(input_vcf) as open_input, open(vcf_with_header, 'w') as open_output:
+                for line in open_input:
+                    if line.startswith('#CHROM'):
+                        open_output.write('##contig=<ID=I,length=5579133>\n##contig=<ID=II,length=4539804>\n')
+                    open_output.write(line)
+            assert RenameContigsInAssembly._get_contigs_from_header(input_vcf, set()) is None
+            # The header only declares some of the contigs with records
+            assert RenameContigsInAssembly._get_contigs_from_header(vcf_with_header, all_contigs) is None
+            assert RenameContigsInAssembly._get_contigs_from_header(vcf_with_header, {'I'}) == {'I', 'II'}
+
+            compressed_vcf = pysam.tabix_index(vcf_with_header, preset='vcf', keep_original=True, force=True)
+            assert RenameContigsInAssembly._get_contigs_from_index(vcf_with_header) is None
+            assert RenameContigsInAssembly._get_contigs_from_index(compressed_vcf) == all_contigs
+            assert RenameContigsInAssembly._get_contigs_from_records(compressed_vcf) == all_contigs
+
+            # The incomplete header is not used, with or without an index
+            for vcf_file in (vcf_with_header, compressed_vcf):
+                rename = RenameContigsInAssembly(
+                    self.rename.assembly_accession, self.rename.assembly_fasta_path,
+                    self.rename.assembly_report_path, [vcf_file]
+                )
+                assert rename.contigs_found_in_vcf == all_contigs
+
+    def test_contig_alias_map_from_cache(self):
+        pages = [
+            {'_embedded': {'chromosomeEntities': [{'insdcAccession': 'CU329670.1', 'enaSequenceName': 'I'}]},
+             '_links': {'next': {}}, 'page': {'totalPages': 2}},
+            {'_embedded': {'chromosomeEntities': [{'insdcAccession': 'X54421.1', 'ucscName': 'MT'}]},
+             '_links': {}, 'page': {'totalPages': 2}}
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = PersistentCache(os.path.join(tmp_dir, 'cache.sqlite'), table='contig_alias')
+            with patch.object(RenameContigsInAssembly, '_contig_alias_assembly_get',
+                              side_effect=lambda page, size: pages[page]) as mock_get:
+                for _ in range(2):
+                    rename = RenameContigsInAssembly(
+                        self.rename.assembly_accession, self.rename.assembly_fasta_path,
+                        self.rename.assembly_report_path, self.rename.input_vcfs, contig_alias_cache=cache
+                    )
+                    assert rename.contig_alias_map == {'CU329670.1': 'I', 'X54421.1': 'MT'}
+                assert mock_get.call_count == 2
+            assert cache.get('GCA_000002945.2') == {'I': 'CU329670.1', 'MT': 'X54421.1'}
+
+    def test_link_from_custom_genome_store(self):
+        self.rename.contig_alias_map = {}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = CustomGenomeStore(os.path.join(tmp_dir, 'store'), max_size=10 ** 9)
+            assembly_custom = os.path.join(tmp_dir, 'genome_custom.fa')
+            with patch.object(RenameContigsInAssembly, 'rewrite_changing_names',
+                              wraps=self.rename.rewrite_changing_names) as mock_rewrite:
+                self.rename.link_from_custom_genome_store(assembly_custom, store)
+                self.rename.link_from_custom_genome_store(assembly_custom, store)
+                assert mock_rewrite.call_count == 1
+            store_fasta = store.entry_path('GCA_000002945.2', self.rename.contig_name_mapping)
+            assert os.path.samefile(assembly_custom, store_fasta)
+            assert os.stat(store_fasta).st_nlink == 2
+            with open(assembly_custom) as open_file:
+                assert open_file.readline() == '>I\n'
+
+    def test_custom_genome_store_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = CustomGenomeStore(tmp_dir, max_size=35)
+
+            def create_genome(output_fasta):
+                with open(output_fasta, 'w') as open_file:
+                    open_file.write('>chr1\nACGT\n')
+
+            custom_fastas = [store.get_or_create('GCA_1', {'CM1': f'chr{i}'}, create_genome) for i in range(3)]
+            for i, custom_fasta in enumerate(custom_fastas):
+                os.utime(custom_fasta, (i, i))
+            # The first genome is used again so the second one is the least recently used
+            assert store.get('GCA_1', {'CM1': 'chr0'}) == custom_fastas[0]
+            store.get_or_create('GCA_1', {'CM1': 'chr3'}, create_genome)
+            assert [os.path.exists(custom_fasta) for custom_fasta in custom_fastas] == [True, False, True]
+
+    def test_custom_genome_store_eviction_keeps_linked_genomes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Room for one genome only held by the store
+            store = CustomGenomeStore(os.path.join(tmp_dir, 'store'), max_size=12)
+
+            def create_genome(output_fasta):
+                with open(output_fasta, 'w') as open_file:
+                    open_file.write('>chr1\nACGT\n')
 
+            # The oldest genome is still used by a submission
+            submission_fasta = os.path.join(tmp_dir, 'genome_custom.fa')
+            used_fasta = store.link_or_create('GCA_1', {'CM1': 'chr0'}, create_genome, submission_fasta)
+            unused_fasta = store.get_or_create('GCA_1', {'CM1': 'chr1'}, create_genome)
+            os.utime(used_fasta, (0, 0))
+            os.utime(unused_fasta, (1, 1))
+            new_fasta = store.get_or_create('GCA_1', {'CM1': 'chr2'}, create_genome)
+            assert os.path.exists(used_fasta)
+            assert not os.path.exists(unused_fasta)
+            # The genomes still used are not counted in the maximum size of the store
+            other_submission_fasta = os.path.join(tmp_dir, 'other_genome_custom.fa')
+            store.link_or_create('GCA_1', {'CM1': 'chr2'}, create_genome, other_submission_fasta)
+            unlinked_fasta = store.get_or_create('GCA_1', {'CM1': 'chr3'}, create_genome)
+            store.evict()
+            assert all(os.path.exists(fasta) for fasta in (used_fasta, new_fasta, unlinked_fasta))
+            # Removing the genome from the store does not affect the submission
+            os.remove(used_fasta)
+            with open(submission_fasta) as open_file:
+                assert open_file.read() == '>chr1\nACGT\n'
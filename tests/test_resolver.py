@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from eva_submission.eload_utils import resolve_accession_from_text
+from eva_submission.resolver import Resolver, open_lookup_cache
+
+
+class TestResolver(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = open_lookup_cache(os.path.join(self.tmp_dir.name, 'remote_lookups.sqlite'))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_resolve(self):
+        lookup = Mock(side_effect=lambda taxid: f'species {taxid}')
+        resolver = Resolver(self.cache)
+        assert resolver.resolve('species', lookup, 9606) == 'species 9606'
+        assert resolver.resolve('species', lookup, 9606) == 'species 9606'
+        assert resolver.resolve('species', lookup, 10090) == 'species 10090'
+        assert lookup.call_count == 2
+        # Another resolver gets the results from the persistent cache
+        assert Resolver(self.cache).resolve('species', lookup, 9606) == 'species 9606'
+        assert lookup.call_count == 2
+        assert resolver.counters() == {'species': {'hits': 1, 'misses': 2}}
+
+    def test_negative_caching(self):
+        negative_cache = open_lookup_cache(os.path.join(self.tmp_dir.name, 'remote_lookups.sqlite'), ttl_days=1,
+                                           table='negative')
+        lookup = Mock(return_value=(None, None))
+        assert Resolver(self.cache, negative_cache).resolve('assembly', lookup, 'GCA_1') == (None, None)
+        resolver = Resolver(self.cache, negative_cache)
+        assert resolver.resolve('assembly', lookup, 'GCA_1') == [None, None]
+        lookup.assert_called_once_with('GCA_1')
+        assert resolver.counters() == {'assembly': {'hits': 1, 'misses': 0}}
+        # Negative results expire sooner than the others
+        with patch('eva_submission.persistent_cache.time.time', return_value=time.time() + 2 * 24 * 3600):
+            Resolver(self.cache, negative_cache).resolve('assembly', lookup, 'GCA_1')
+        assert lookup.call_count == 2
+
+    def test_errors_not_cached(self):
+        lookup = Mock(side_effect=[ValueError('Service unavailable'), 'species 9606'])
+        resolver = Resolver(self.cache)
+        with self.assertRaises(ValueError):
+            resolver.resolve('species', lookup, 9606)
+        assert resolver.resolve('species', lookup, 9606) == 'species 9606'
+
+    def test_resolve_accession_from_text(self):
+        resolver = Resolver(self.cache)
+        with patch('eva_submission.eload_utils.retrieve_genbank_assembly_accessions_from_ncbi',
+                   return_value=['GCA_000001405.15']) as m_retrieve:
+            assert resolve_accession_from_text('GRCh38', resolver) == ['GCA_000001405.15']
+            assert resolve_accession_from_text('GRCh38', resolver) == ['GCA_000001405.15']
+            m_retrieve.assert_called_once_with('GRCh38')
+
+    def test_resolve_concurrently(self):
+        lookup = Mock(side_effect=lambda taxid: f'species {taxid}')
+        failing_lookup = Mock(side_effect=ValueError('Unknown taxonomy'))
+        futures = Resolver(max_workers=2).resolve_concurrently(
+            [('species', lookup, (taxid,)) for taxid in (9606, 10090)] + [('other', failing_lookup, (1,))]
+        )
+        assert [future.result() for future in futures[:2]] == ['species 9606', 'species 10090']
+        with self.assertRaises(ValueError):
+            futures[2].result()
@@ -3,7 +3,7 @@ from unittest import TestCase
 
 from eva_submission import ROOT_DIR
 from eva_submission.samples_checker import get_samples_from_vcf, get_sample_names, compare_names_in_files_and_samples, \
-    compare_spreadsheet_and_vcf
+    compare_spreadsheet_and_vcf, get_samples_from_vcfs
 
 
 class TestSampleChecker(TestCase):
@@ -34,6 +34,14 @@ class TestSampleChecker(TestCase):
             'A1'
         ) == (True, [], ['S2'])
 
+    def test_get_samples_from_vcfs(self):
+        vcf_files = [
+            os.path.join(self.resources_folder, 'test.vcf'),
+            os.path.join(self.resources_folder, 'vcf_files', 'file_basic_aggregation.vcf'),
+            os.path.join(self.resources_folder, 'test.vcf')
+        ]
+        assert get_samples_from_vcfs(vcf_files) == {vcf_files[0]: ['S1'], vcf_files[1]: []}
+
     def test_compare_spreadsheet_and_vcf(self):
         metadata_file = os.path.join(self.resources_folder, 'metadata_2_analysis_same_samples.xlsx')
         vcf_dir = os.path.join(self.resources_folder, 'vcf_dir')
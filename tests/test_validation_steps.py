@@ -1,18 +1,37 @@
+import csv
+import gzip
+import json
 import os
+import sqlite3
+import sys
+import tempfile
+from contextlib import closing
 from unittest import TestCase
 from unittest.mock import patch
 
+import pysam
+
 from eva_submission import ROOT_DIR
-from eva_submission.steps.structural_variant_detection import detect_structural_variant
+from eva_submission.steps.merge_validation_shards import merge_vcf_check_shards, merge_assembly_check_shards
+from eva_submission.steps.run_with_error_budget import run_with_error_budget
+from eva_submission.steps.plan_vcf_shards import plan_shards, write_vcf_shards
+from eva_submission.steps.structural_variant_detection import detect_structural_variant, \
+    find_structural_variant_lines, split_bgzf_file
+from eva_submission import vcf_profile
+from eva_submission.vcf_profile import get_vcf_profile, VcfProfile
 
 
 class TestValidationSteps(TestCase):
     resources_folder = os.path.join(ROOT_DIR, 'tests', 'resources')
     vcf_file = os.path.join(resources_folder, 'vcf_files', 'file_structural_variants.vcf')
     output_vcf = os.path.join(resources_folder, 'vcf_files', 'output_structural_variants.vcf')
+    output_vcf_gz = os.path.join(resources_folder, 'vcf_files', 'output_structural_variants.vcf.gz')
+    bgzip_vcf_file = os.path.join(resources_folder, 'vcf_files', 'bgzip_structural_variants.vcf.gz')
 
     def tearDown(self) -> None:
-        os.remove(self.output_vcf)
+        for output in [self.output_vcf, self.output_vcf_gz, self.bgzip_vcf_file]:
+            if os.path.exists(output):
+                os.remove(output)
 
     def test_detect_structural_variant(self):
 
@@ -22,3 +41,284 @@ class TestValidationSteps(TestCase):
         mprint.assert_called_once_with('1 lines containing structural variants')
         assert os.path.exists(self.output_vcf)
 
+    def test_detect_structural_variant_bgzip_output(self):
+        with patch('builtins.print') as mprint:
+            detect_structural_variant(self.vcf_file, self.output_vcf_gz)
+        mprint.assert_called_once_with('1 lines containing structural variants')
+        with gzip.open(self.output_vcf_gz, 'rt') as open_file:
+            data_lines = [line for line in open_file if not line.startswith('#')]
+        assert len(data_lines) == 1
+        assert data_lines[0].startswith('20\t1234567\tmicrosat1\tGTC\tG,<DEL:ME>')
+
+    def test_find_structural_variant_lines(self):
+        lines = [
+            b'1\t100\t.\tA\tG\t.\tPASS\tAF=0.5\n',
+            b'1\t101\t.\tA\t<DUP:TANDEM>\t.\tPASS\tAF=0.5\n',
+            b'1\t102\t.\tA\tG]17:198982]\t.\tPASS\tAF=0.5\n',
+            b'1\t103\t.\tA\tC,.A\t.\tPASS\tAF=0.5\n',
+            b'1\t104\t.\tA\t.\t.\tPASS\tAF=0.5\n',
+            b'1\t105\t.\tA\tA<ctg1>\t.\tPASS\tAF=0.5\n',
+            b'1\t106\t.\tA\t<NON_REF>\t.\tPASS\tAF=0.5\n',
+            b'1\t107\t.\tA\tG.'
+        ]
+        assert list(find_structural_variant_lines(b''.join(lines))) == [
+            lines[1], lines[2], lines[3], lines[5], lines[7]
+        ]
+
+    def test_detect_structural_variant_in_parallel(self):
+        # Create a BGZF file with one block per line so that it can be split between the lines
+        with open(self.vcf_file, 'rb') as open_input, pysam.BGZFile(self.bgzip_vcf_file, 'wb') as open_output:
+            for line in open_input:
+                open_output.write(line)
+                open_output.flush()
+        chunks = split_bgzf_file(self.bgzip_vcf_file, chunk_size=100)
+        assert len(chunks) > 5
+        assert chunks[0][0] == 0 and chunks[-1][1] == os.path.getsize(self.bgzip_vcf_file)
+
+        with patch('eva_submission.steps.structural_variant_detection.split_bgzf_file',
+                   side_effect=lambda vcf_file: split_bgzf_file(vcf_file, chunk_size=100)), \
+                patch('builtins.print') as mprint:
+            detect_structural_variant(self.bgzip_vcf_file, self.output_vcf_gz, nb_processes=2)
+        mprint.assert_called_once_with('1 lines containing structural variants')
+        detect_structural_variant(self.vcf_file, self.output_vcf)
+        with gzip.open(self.output_vcf_gz, 'rb') as parallel_output, open(self.output_vcf, 'rb') as single_output:
+            assert parallel_output.read() == single_output.read()
+
+    def test_detect_structural_variant_records_profile(self):
+        with open(self.vcf_file, 'rb') as open_input, pysam.BGZFile(self.bgzip_vcf_file, 'wb') as open_output:
+            for line in open_input:
+                open_output.write(line)
+                open_output.flush()
+        expected_profile = VcfProfile.from_vcf(self.vcf_file).to_dict()
+        vcf_profile._profiles.clear()
+        # The profile is gathered while scanning the file, in a single process or in chunks scanned in parallel
+        with patch('eva_submission.steps.structural_variant_detection.split_bgzf_file',
+                   side_effect=lambda vcf_file: split_bgzf_file(vcf_file, chunk_size=100)), \
+                patch.object(VcfProfile, 'from_vcf') as m_from_vcf, patch('builtins.print'):
+            detect_structural_variant(self.vcf_file, self.output_vcf)
+            detect_structural_variant(self.bgzip_vcf_file, self.output_vcf_gz, nb_processes=2)
+            assert get_vcf_profile(self.vcf_file, compute=False).to_dict() == expected_profile
+            assert get_vcf_profile(self.bgzip_vcf_file, compute=False).to_dict() == expected_profile
+        m_from_vcf.assert_not_called()
+
+    def test_detect_structural_variant_with_profile(self):
+        vcf_without_sv = os.path.join(self.resources_folder, 'vcf_files', 'file_no_aggregation.vcf')
+        assert get_vcf_profile(vcf_without_sv).nb_structural_variants == 0
+        with patch('eva_submission.steps.structural_variant_detection._detect_structural_variant_in_blocks') \
+                as m_detect, patch('builtins.print') as mprint:
+            detect_structural_variant(vcf_without_sv, self.output_vcf)
+        m_detect.assert_not_called()
+        mprint.assert_not_called()
+        with open(vcf_without_sv) as open_input, open(self.output_vcf) as open_output:
+            assert open_output.read() == ''.join(line for line in open_input if line.startswith('#'))
+
+    def test_plan_shards(self):
+        records_per_contig = [('1', 6), ('2', 0), ('3', 2), ('4', 3), ('HLA-A*01:01', 1)]
+        assert plan_shards(records_per_contig, records_per_shard=5) == [
+            (['1'], 0), (['3', '4'], 6), (['HLA-A*01:01'], 11)
+        ]
+
+    def test_write_vcf_shards_without_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shards_csv = os.path.join(tmp_dir, 'shards.csv')
+            write_vcf_shards(self.vcf_file, 5, shards_csv)
+            with open(shards_csv) as open_file:
+                assert list(csv.DictReader(open_file)) == [
+                    {'shard': '0', 'regions_file': '', 'line_offset': '0', 'header_lines': '19'}
+                ]
+
+    def test_write_vcf_shards(self):
+        records_per_contig = [('1', 6), ('2', 0), ('3', 2), ('4', 3), ('HLA-A*01:01', 1)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shards_csv = os.path.join(tmp_dir, 'shards.csv')
+            with patch('eva_submission.steps.plan_vcf_shards.get_records_per_contig', return_value=records_per_contig):
+                write_vcf_shards(self.vcf_file, 5, shards_csv)
+            with open(shards_csv) as open_file:
+                shards = list(csv.DictReader(open_file))
+            assert [(shard['shard'], shard['line_offset']) for shard in shards] == [('0', '0'), ('1', '6'), ('2', '11')]
+            # The contigs of each shard are in a regions file rather than on the command line
+            regions_file = os.path.join(tmp_dir, 'file_structural_variants.vcf.shard_1.regions')
+            assert shards[1]['regions_file'] == regions_file
+            with open(regions_file) as open_file:
+                assert open_file.read() == '3\t1\t2147483647\n4\t1\t2147483647\n'
+
+    def _write_shard(self, shard_dir, shard, line_offset, files):
+        for file_name, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(shard_dir, file_name)), exist_ok=True)
+            with open(os.path.join(shard_dir, file_name), 'w') as open_file:
+                open_file.write(content)
+        with open(os.path.join(shard_dir, 'shard_info.json'), 'w') as open_file:
+            json.dump({'shard': shard, 'line_offset': line_offset, 'header_lines': 3}, open_file)
+
+    def _write_vcf_check_db(self, db_path, errors):
+        """Write a report with the layout of vcf_validator, where the errors of the body are BodySectionErrors."""
+        connection = sqlite3.connect(db_path)
+        connection.execute('CREATE TABLE "Error" ("id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
+                           '"typeid" TEXT NOT NULL, "line" INTEGER NOT NULL, "message" TEXT NOT NULL, '
+                           '"severity" INTEGER NOT NULL)')
+        connection.execute('CREATE TABLE "BodySectionError" ("id" INTEGER NOT NULL PRIMARY KEY)')
+        for line, message, severity in errors:
+            typeid = 'ebi::vcf::BodySectionError' if line > 3 else 'ebi::vcf::MetaSectionError'
+            error_id = connection.execute(
+                'INSERT INTO "Error" (typeid, line, message, severity) VALUES (?, ?, ?, ?)',
+                (typeid, line, message, severity)
+            ).lastrowid
+            if line > 3:
+                connection.execute('INSERT INTO "BodySectionError" (id) VALUES (?)', (error_id,))
+        connection.commit()
+        connection.close()
+
+    def test_merge_vcf_check_shards(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard_dirs = [os.path.join(tmp_dir, 'shard_0'), os.path.join(tmp_dir, 'shard_1')]
+            self._write_shard(shard_dirs[1], 1, 10, {
+                'vcf_format/test.vcf.shard_1.vcf.vcf_format.log': 'log 1\n',
+                'vcf_format/test.vcf.shard_1.vcf.errors.2.txt':
+                    "Line 2: A valid 'reference' entry is not listed in the meta section. (warning)\n"
+                    'Line 5: Error in shard 1\n'
+                    'According to the VCF specification, the input file is not valid'
+            })
+            self._write_vcf_check_db(os.path.join(shard_dirs[1], 'vcf_format', 'test.vcf.shard_1.vcf.errors.2.db'),
+                                     [(2, 'header warning', 0), (5, 'Error in shard 1', 1),
+                                      (6, 'Other error in shard 1', 1)])
+            self._write_shard(shard_dirs[0], 0, 0, {
+                'vcf_format/test.vcf.shard_0.vcf.vcf_format.log': 'log 0\n',
+                'vcf_format/test.vcf.shard_0.vcf.errors.1.txt':
+                    "Line 2: A valid 'reference' entry is not listed in the meta section. (warning)\n"
+                    'Line 4: Error in shard 0\n'
+                    'According to the VCF specification, the input file is valid'
+            })
+            self._write_vcf_check_db(os.path.join(shard_dirs[0], 'vcf_format', 'test.vcf.shard_0.vcf.errors.1.db'),
+                                     [(2, 'header warning', 0), (4, 'Error in shard 0', 1)])
+            output_dir = os.path.join(tmp_dir, 'vcf_format')
+
+            merge_vcf_check_shards('test.vcf', shard_dirs, output_dir)
+
+            with open(os.path.join(output_dir, 'test.vcf.errors.sharded.txt')) as open_file:
+                assert open_file.read() == (
+                    "Line 2: A valid 'reference' entry is not listed in the meta section. (warning)\n"
+                    'Line 4: Error in shard 0\n'
+                    'Line 15: Error in shard 1\n'
+                    'According to the VCF specification, the input file is not valid\n'
+                )
+            with open(os.path.join(output_dir, 'test.vcf.vcf_format.log')) as open_file:
+                assert open_file.read() == 'log 0\nlog 1\n'
+            with closing(sqlite3.connect(os.path.join(output_dir, 'test.vcf.errors.sharded.db'))) as connection:
+                assert connection.execute('SELECT line, message, severity FROM "Error" ORDER BY id').fetchall() == [
+                    (2, 'header warning', 0), (4, 'Error in shard 0', 1), (15, 'Error in shard 1', 1),
+                    (16, 'Other error in shard 1', 1)
+                ]
+                # The rows of the subclass tables follow the ids of their errors
+                assert connection.execute(
+                    'SELECT line FROM "Error" JOIN "BodySectionError" USING (id) ORDER BY id'
+                ).fetchall() == [(4,), (15,), (16,)]
+
+    def test_merge_vcf_check_databases_unknown_layout(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard_dirs = [os.path.join(tmp_dir, 'shard_0'), os.path.join(tmp_dir, 'shard_1')]
+            for shard, shard_dir in enumerate(shard_dirs):
+                self._write_shard(shard_dir, shard, shard * 10, {
+                    f'vcf_format/test.vcf.shard_{shard}.vcf.vcf_format.log': '',
+                    f'vcf_format/test.vcf.shard_{shard}.vcf.errors.1.txt': ''
+                })
+            self._write_vcf_check_db(os.path.join(shard_dirs[0], 'vcf_format', 'test.vcf.shard_0.vcf.errors.1.db'), [])
+            with closing(sqlite3.connect(
+                    os.path.join(shard_dirs[1], 'vcf_format', 'test.vcf.shard_1.vcf.errors.1.db'))) as connection:
+                connection.execute('CREATE TABLE errors (id INTEGER PRIMARY KEY, line INTEGER, message TEXT)')
+            with self.assertRaises(ValueError):
+                merge_vcf_check_shards('test.vcf', shard_dirs, os.path.join(tmp_dir, 'vcf_format'))
+
+    def test_merge_assembly_check_shards(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard_dirs = [os.path.join(tmp_dir, 'shard_0'), os.path.join(tmp_dir, 'shard_1')]
+            for shard, shard_dir in enumerate(shard_dirs):
+                self._write_shard(shard_dir, shard, shard * 10, {
+                    f'assembly_check/test.vcf.shard_{shard}.vcf.assembly_check.log':
+                        '[info] Reading from input VCF file...\n'
+                        f'[info] Number of matches: {9 - shard}/10\n'
+                        '[info] Percentage of matches: 90%\n'
+                        '[error] Contig not found\n',
+                    f'assembly_check/test.vcf.shard_{shard}.vcf.text_assembly_report.1.txt':
+                        "Line 4: Chromosome 1, position 7387, reference allele 'T' does not match the reference "
+                        "sequence, expected 'C'\n",
+                    f'assembly_check/test.vcf.shard_{shard}.vcf.valid_assembly_report.1.txt':
+                        f'#header\nvalid {shard}\n'
+                })
+            output_dir = os.path.join(tmp_dir, 'assembly_check')
+
+            merge_assembly_check_shards('test.vcf', shard_dirs, output_dir)
+
+            with open(os.path.join(output_dir, 'test.vcf.assembly_check.log')) as open_file:
+                # The errors of every shard are kept, as in the log of the whole VCF
+                assert open_file.read() == (
+                    '[error] Contig not found\n'
+                    '[error] Contig not found\n'
+                    '[info] Number of matches: 17/20\n'
+                    '[info] Percentage of matches: 85%\n'
+                )
+            with open(os.path.join(output_dir, 'test.vcf.text_assembly_report.sharded.txt')) as open_file:
+                assert [line.split(',')[0] for line in open_file] == ['Line 4: Chromosome 1', 'Line 14: Chromosome 1']
+            with open(os.path.join(output_dir, 'test.vcf.valid_assembly_report.sharded.txt')) as open_file:
+                assert open_file.read() == '#header\nvalid 0\nvalid 1\n'
+
+    def test_merge_truncated_shards(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard_dirs = [os.path.join(tmp_dir, 'shard_0'), os.path.join(tmp_dir, 'shard_1')]
+            self._write_shard(shard_dirs[0], 0, 0, {'vcf_format/test.vcf.shard_0.vcf.vcf_format.log': 'log 0\n'})
+            self._write_shard(shard_dirs[1], 1, 10, {
+                'vcf_format/test.vcf.shard_1.vcf.vcf_format.log': 'log 1\n',
+                'vcf_format/test.vcf.shard_1.vcf.truncated': 'Stopped after 10 errors\n'
+            })
+            output_dir = os.path.join(tmp_dir, 'vcf_format')
+
+            merge_vcf_check_shards('test.vcf', shard_dirs, output_dir)
+
+            with open(os.path.join(output_dir, 'test.vcf.truncated')) as open_file:
+                assert open_file.read() == 'Shard 1: Stopped after 10 errors\n'
+            assert not os.path.exists(os.path.join(output_dir, 'test.vcf.errors.sharded.txt'))
+
+    def test_run_with_error_budget(self):
+        # Writes one error per line in the report until it is stopped
+        command = [sys.executable, '-c', (
+            'import sys, time\n'
+            'with open(sys.argv[1], "w", buffering=1) as open_file:\n'
+            '    for i in range(1000):\n'
+            '        open_file.write(f"Line {i}: Error\\n")\n'
+            '        time.sleep(0.01)\n'
+        )]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report = os.path.join(tmp_dir, 'test.vcf.errors.1.txt')
+            truncated_marker = os.path.join(tmp_dir, 'test.vcf.truncated')
+            cancel_marker = os.path.join(tmp_dir, 'fail_fast', 'analysis')
+            return_code = run_with_error_budget(
+                command + [report], 'vcf_check', 5, tmp_dir, os.path.join(tmp_dir, 'test.log'), truncated_marker,
+                cancel_marker, poll_interval=0.1
+            )
+            assert return_code == 1
+            with open(report) as open_file:
+                assert 5 <= len(open_file.readlines()) < 1000
+            assert os.path.exists(truncated_marker)
+            assert os.path.exists(cancel_marker)
+
+            # The checks of the other files of the analysis are cancelled
+            other_marker = os.path.join(tmp_dir, 'other.vcf.truncated')
+            return_code = run_with_error_budget(
+                command + [os.path.join(tmp_dir, 'other.vcf.errors.1.txt')], 'vcf_check', 5, tmp_dir,
+                os.path.join(tmp_dir, 'other.log'), other_marker, cancel_marker, poll_interval=0.1
+            )
+            assert return_code == 1
+            assert not os.path.exists(os.path.join(tmp_dir, 'other.vcf.errors.1.txt'))
+            with open(other_marker) as open_file:
+                assert open_file.read().startswith('Cancelled')
+
+    def test_run_with_error_budget_complete(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            truncated_marker = os.path.join(tmp_dir, 'test.vcf.truncated')
+            return_code = run_with_error_budget(
+                [sys.executable, '-c', 'print("valid")'], 'vcf_check', 5, tmp_dir, os.path.join(tmp_dir, 'test.log'),
+                truncated_marker, poll_interval=0.1
+            )
+            assert return_code == 0
+            assert not os.path.exists(truncated_marker)
+            with open(os.path.join(tmp_dir, 'test.log')) as open_file:
+                assert open_file.read() == 'valid\n'
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import pysam
+
+from eva_submission import ROOT_DIR
+from eva_submission import vcf_profile
+from eva_submission.vcf_profile import VcfProfile, VcfProfileBuilder, get_vcf_profile, open_vcf_profile_cache, \
+    get_vcf_samples
+
+
+class TestVcfProfile(TestCase):
+    resources_folder = os.path.join(ROOT_DIR, 'tests', 'resources')
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.vcf_file = os.path.join(self.tmp_dir.name, 'test.vcf')
+        with open(self.vcf_file, 'w') as open_file:
+            open_file.write(
+                '##fileformat=VCFv4.3\n'
+                '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\n'
+                '1\t10\t.\tA\tG\t.\t.\tAF=0.5\tGT\t0/1\t0/0\n'
+                '2\t20\t.\tACGT\t<DEL>\t.\t.\tAC=1;AN=4\tGT:DP\t0/1:3\t0/0:5\n'
+                '1\t5\t.\tC\tT,CTTTTT\t.\t.\tDP=3\tGT\t0/1\t0/0\n'
+            )
+        vcf_profile._profiles.clear()
+        vcf_profile._samples.clear()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_from_vcf(self):
+        profile = VcfProfile.from_vcf(self.vcf_file)
+        assert profile.to_dict() == {
+            'samples': ['S1', 'S2'], 'contigs': ['1', '2'], 'nb_variants': 3, 'has_genotypes': True,
+            'has_allele_frequencies': False, 'nb_structural_variants': 1, 'max_allele_length': 6, 'is_sorted': False
+        }
+
+    def test_from_vcf_compressed(self):
+        compressed_vcf = os.path.join(self.tmp_dir.name, 'vcf_file_ASM294v2.vcf.gz')
+        pysam.tabix_compress(os.path.join(self.resources_folder, 'vcf_files', 'vcf_file_ASM294v2.vcf'), compressed_vcf)
+        profile = VcfProfile.from_vcf(compressed_vcf)
+        assert profile.contigs == ['I', 'II', 'III', 'MT', 'MTR']
+        assert profile.samples == ['S1']
+        assert profile.is_sorted
+
+    def test_merge_profile_builders(self):
+        with open(self.vcf_file, 'rb') as open_file:
+            lines = open_file.readlines()
+        sorted_lines = lines[:2] + [lines[4], lines[2], lines[3]]
+        for vcf_lines in (lines, sorted_lines):
+            expected_profile = VcfProfile.from_vcf(self.vcf_file) if vcf_lines is lines else None
+            # The builders of the lines split at any position give the same profile as a single builder
+            single_builder = VcfProfileBuilder()
+            single_builder.add_lines(b''.join(vcf_lines))
+            for split in range(len(vcf_lines) + 1):
+                builder, other_builder = VcfProfileBuilder(), VcfProfileBuilder()
+                builder.add_lines(b''.join(vcf_lines[:split]))
+                other_builder.add_lines(b''.join(vcf_lines[split:]))
+                builder.merge(other_builder)
+                assert builder.profile().to_dict() == single_builder.profile().to_dict()
+            if expected_profile:
+                assert single_builder.profile().to_dict() == expected_profile.to_dict()
+            else:
+                assert single_builder.profile().is_sorted
+
+    def test_get_vcf_profile(self):
+        cache = open_vcf_profile_cache(os.path.join(self.tmp_dir.name, 'vcf_profiles.sqlite'))
+        assert get_vcf_profile(self.vcf_file, cache, compute=False) is None
+        profile = get_vcf_profile(self.vcf_file, cache)
+        assert profile.nb_variants == 3
+
+        # Profiles are retrieved from the persistent cache in another process
+        vcf_profile._profiles.clear()
+        with patch.object(VcfProfile, 'from_vcf') as m_from_vcf:
+            assert get_vcf_profile(self.vcf_file, cache, compute=False).to_dict() == profile.to_dict()
+            m_from_vcf.assert_not_called()
+
+        # A modified file is profiled again
+        with open(self.vcf_file, 'a') as open_file:
+            open_file.write('2\t30\t.\tA\tG\t.\t.\tAF=0.5\tGT\t0/1\t0/0\n')
+        assert get_vcf_profile(self.vcf_file, cache, compute=False) is None
+        assert get_vcf_profile(self.vcf_file, cache).nb_variants == 4
+
+    def test_get_vcf_samples(self):
+        cache = open_vcf_profile_cache(os.path.join(self.tmp_dir.name, 'vcf_profiles.sqlite'))
+        assert get_vcf_samples(self.vcf_file, cache) == ['S1', 'S2']
+
+        # Samples are retrieved from the persistent cache in another process without reading the file
+        vcf_profile._samples.clear()
+        with patch.object(vcf_profile, 'read_header_samples') as m_read_header_samples:
+            assert get_vcf_samples(self.vcf_file, cache) == ['S1', 'S2']
+            m_read_header_samples.assert_not_called()
+
+    def test_get_vcf_samples_compressed(self):
+        compressed_vcf = os.path.join(self.tmp_dir.name, 'test.vcf.gz')
+        pysam.tabix_compress(self.vcf_file, compressed_vcf)
+        assert get_vcf_samples(compressed_vcf) == ['S1', 'S2']
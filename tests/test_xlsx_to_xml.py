@@ -1,11 +1,14 @@
 import os
+import tempfile
 from datetime import datetime
+from io import BytesIO
 from unittest import TestCase
 import xml.etree.ElementTree as ET
+from xml.dom import minidom
 from unittest.mock import patch, Mock
 
 from eva_submission import ROOT_DIR
-from eva_submission.ENA_submission.xlsx_to_ENA_xml import EnaXlsxConverter
+from eva_submission.ENA_submission.xlsx_to_ENA_xml import EnaXlsxConverter, open_xml_file
 
 
 def elements_equal(e1, e2):
@@ -186,6 +189,38 @@ class TestEnaXlsConverter(TestCase):
         assert os.path.isfile(os.path.join(self.brokering_folder, 'TEST1.Project.xml'))
         assert os.path.isfile(os.path.join(self.brokering_folder, 'TEST1.Analysis.xml'))
 
+    def test_write_streamed_analysis_xml(self):
+        with patch('eva_submission.ENA_submission.xlsx_to_ENA_xml.get_scientific_name_from_ensembl') as m_sci_name:
+            m_sci_name.return_value = 'Homo sapiens'
+            _, _, analysis_file = self.converter.create_submission_files('TEST1')
+        assert elements_equal(ET.parse(analysis_file).getroot(), self.converter._create_analysis_xml())
+        with open(analysis_file) as open_file:
+            lines = open_file.readlines()
+        # The analyses written one at a time are indented in the ANALYSIS_SET
+        assert lines[:4] == [
+            '<?xml version="1.0" encoding="utf-8"?>\n',
+            '<ANALYSIS_SET xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n',
+            '    <ANALYSIS alias="GAE" center_name="The place to be">\n',
+            '        <TITLE>Greatest analysis ever</TITLE>\n'
+        ]
+        assert lines[-2:] == ['    </ANALYSIS>\n', '</ANALYSIS_SET>\n']
+
+    def test_write_xml_like_minidom(self):
+        analysis = ET.Element('ANALYSIS', alias='The "best" analysis', center_name='A & B')
+        ET.SubElement(analysis, 'TITLE').text = 'Analysis of "quoted" <samples> & files'
+        ET.SubElement(analysis, 'DESCRIPTION').text = "It's a \"description\"\nover two lines"
+        ET.SubElement(ET.SubElement(analysis, 'SAMPLE_REF', accession='SAMEA1'), 'EMPTY')
+        # Output of the re-parsing with minidom that was used to pretty-print the XML
+        outfile = BytesIO()
+        ET.ElementTree(analysis).write(outfile, encoding='utf-8', xml_declaration=True)
+        expected = minidom.parseString(outfile.getvalue()).toprettyxml(indent='    ', encoding='utf-8')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, 'analysis.xml')
+            with open_xml_file(output_file) as xml_writer:
+                xml_writer.write(analysis)
+            with open(output_file, 'rb') as open_file:
+                assert open_file.read() == expected
+
     def test_create_submission(self):
         expected_submission = '''
 <SUBMISSION_SET>
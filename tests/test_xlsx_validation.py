@@ -1,9 +1,11 @@
 import os
 import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 
 from eva_submission import ROOT_DIR
+from eva_submission.resolver import Resolver, open_lookup_cache
 from eva_submission.xlsx.xlsx_parser_eva import EvaXlsxReader
 from eva_submission.xlsx.xlsx_validation import EvaXlsxValidator
 
@@ -73,3 +75,51 @@ class TestEvaXlsValidator(TestCase):
         assert len([s for s in scientific_name_list if s == 'Homo Sapiens']) == 0
         assert len([s for s in scientific_name_list if s == 'HS']) == 10
 
+
+    def test_cerberus_validation_in_chunks(self):
+        samples = self.validator.metadata['Sample']
+        samples[25]['Tax Id'] = 'not a taxonomy'
+        with patch('eva_submission.xlsx.xlsx_validation.validation_chunk_size', 10):
+            self.validator.cerberus_validation(max_workers=2)
+        # The position of the error in its chunk is converted to the row of the sample in the spreadsheet
+        self.assertEqual(self.validator.error_list, [
+            f'In Sheet Sample, Row {samples[25]["row_num"]}, field Tax Id: must be of integer type'
+        ])
+        assert set(self.validator.timings['cerberus_validation_per_sheet']) == set(self.validator.metadata)
+
+    def test_cerberus_validation_in_chunks_single_cpu(self):
+        samples = self.validator.metadata['Sample']
+        samples[25]['Tax Id'] = 'not a taxonomy'
+        # The chunks are validated in this process when there is only one CPU
+        with patch('eva_submission.xlsx.xlsx_validation.validation_chunk_size', 10), \
+                patch('eva_submission.xlsx.xlsx_validation.os.cpu_count', return_value=1), \
+                patch('eva_submission.xlsx.xlsx_validation.ProcessPoolExecutor') as m_executor:
+            self.validator.cerberus_validation(max_workers=2)
+        m_executor.assert_not_called()
+        self.assertEqual(self.validator.error_list, [
+            f'In Sheet Sample, Row {samples[25]["row_num"]}, field Tax Id: must be of integer type'
+        ])
+
+    def test_validation_of_metadata_directory(self):
+        validator = EvaXlsxValidator(os.path.join(ROOT_DIR, 'tests', 'resources', 'metadata_tsv'))
+        with patch('eva_submission.xlsx.xlsx_validation.validation_chunk_size', 10):
+            validator.cerberus_validation(max_workers=2)
+        validator.complex_validation()
+        self.assertEqual(validator.error_list, [])
+        # The rows are streamed from the files rather than held by the validator
+        assert not isinstance(validator.metadata['Sample'], list)
+
+    def test_semantic_validation_cached_lookups(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lookup_cache = open_lookup_cache(os.path.join(tmp_dir, 'remote_lookups.sqlite'))
+            with patch('eva_submission.xlsx.xlsx_validation.get_scientific_name_from_ensembl',
+                       return_value='Homo sapiens') as m_sci_name, \
+                    patch('eva_submission.xlsx.xlsx_validation.retrieve_genbank_assembly_accessions_from_ncbi',
+                          return_value=['GCA_000001405.1']) as m_accessions:
+                for _ in range(2):
+                    # Validations of different ELOADs share the persistent cache
+                    self.validator.resolver = Resolver(lookup_cache, max_workers=2)
+                    self.validator.semantic_validation()
+                m_sci_name.assert_called_once_with(9606)
+                m_accessions.assert_called_once_with('GCA_000001405.1')
+        assert self.validator.error_list == []